@@ -12,7 +12,7 @@ create_agent = function () {
             $("#send-message").removeClass('disabled');
             $("#send-message").html('Send');
             $("#reproduction").focus();
-            setInterval(function () { get_transmissions(my_node_id); }, 2000);
+            wait_for_transmissions(my_node_id, display_transmissions);
         },
         error: function (err) {
             console.log(err);
@@ -27,28 +27,11 @@ create_agent = function () {
     });
 };
 
-get_transmissions = function (my_node_id) {
-    reqwest({
-        url: "/node/" + my_node_id + "/transmissions",
-        method: 'get',
-        type: 'json',
-        data: {
-            status: "pending",
-        },
-        success: function (resp) {
-            console.log(resp);
-            transmissions = resp.transmissions;
-            for (var i = transmissions.length - 1; i >= 0; i--) {
-                console.log(transmissions[i]);
-                display_info(transmissions[i].info_id);
-            }
-        },
-        error: function (err) {
-            console.log(err);
-            err_response = JSON.parse(err.response);
-            $('body').html(err_response.html);
-        }
-    });
+display_transmissions = function (transmissions) {
+    for (var i = transmissions.length - 1; i >= 0; i--) {
+        console.log(transmissions[i]);
+        display_info(transmissions[i].info_id);
+    }
 };
 
 display_info = function(info_id) {
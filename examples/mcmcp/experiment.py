@@ -8,9 +8,7 @@ from wallace import db
 import random
 from flask import Blueprint, Response
 import json
-from sqlalchemy import Boolean
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.sql.expression import cast
 from operator import attrgetter
 
 
@@ -95,21 +93,18 @@ class AnimalInfo(Info):
 
     @hybrid_property
     def chosen(self):
-        """Use property1 to store whether an info was chosen."""
-        try:
-            return bool(self.property1)
-        except TypeError:
-            return None
+        """Use boolean1 to store whether an info was chosen."""
+        return self.boolean1
 
     @chosen.setter
     def chosen(self, chosen):
-        """Assign chosen to property1."""
-        self.property1 = repr(chosen)
+        """Assign chosen to boolean1."""
+        self.boolean1 = chosen
 
     @chosen.expression
     def chosen(self):
-        """Retrieve chosen via property1."""
-        return cast(self.property1, Boolean)
+        """Retrieve chosen via boolean1."""
+        return self.boolean1
 
     properties = {
         "foot_spread": [0, 1],
@@ -6,11 +6,8 @@ from wallace.nodes import Source, Agent, Environment
 from wallace.networks import DiscreteGenerational
 from wallace.models import Node, Network, Participant
 from wallace import transformations
-from sqlalchemy import Integer, Float
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.sql.expression import cast
 from sqlalchemy import and_
-from operator import attrgetter
 import random
 
 
@@ -195,6 +192,9 @@ class RogersExperiment(Experiment):
 
     def add_node_to_network(self, node, network):
         """Add participant's node to a network."""
+        # the rest of this hook gets nodes, infos and vectors of the
+        # network, so fetch them all up front.
+        network.load_graph()
         network.add_node(node)
         node.receive()
 
@@ -203,11 +203,9 @@ class RogersExperiment(Experiment):
 
         gene = node.infos(type=LearningGene)[0].contents
         if (gene == "social"):
-            prev_agents = RogersAgent.query\
-                .filter(and_(RogersAgent.failed == False,
-                             RogersAgent.network_id == network.id,
-                             RogersAgent.generation == node.generation - 1))\
-                .all()
+            prev_agents = [
+                agent for agent in network.nodes(type=RogersAgent)
+                if agent.generation == node.generation - 1]
             parent = random.choice(prev_agents)
             parent.connect(whom=node)
             parent.transmit(what=Meme, to_whom=node)
@@ -253,48 +251,48 @@ class RogersAgent(Agent):
 
     @hybrid_property
     def generation(self):
-        """Convert property2 to genertion."""
-        return int(self.property2)
+        """Convert integer1 to genertion."""
+        return self.integer1
 
     @generation.setter
     def generation(self, generation):
         """Make generation settable."""
-        self.property2 = repr(generation)
+        self.integer1 = generation
 
     @generation.expression
     def generation(self):
         """Make generation queryable."""
-        return cast(self.property2, Integer)
+        return self.integer1
 
     @hybrid_property
     def score(self):
-        """Convert property3 to score."""
-        return int(self.property3)
+        """Convert integer2 to score."""
+        return self.integer2
 
     @score.setter
     def score(self, score):
         """Mark score settable."""
-        self.property3 = repr(score)
+        self.integer2 = score
 
     @score.expression
     def score(self):
         """Make score queryable."""
-        return cast(self.property3, Integer)
+        return self.integer2
 
     @hybrid_property
     def proportion(self):
-        """Make property4 proportion."""
-        return float(self.property4)
+        """Make real2 proportion."""
+        return self.real2
 
     @proportion.setter
     def proportion(self, proportion):
         """Make proportion settable."""
-        self.property4 = repr(proportion)
+        self.real2 = proportion
 
     @proportion.expression
     def proportion(self):
         """Make proportion queryable."""
-        return cast(self.property4, Float)
+        return self.real2
 
     def calculate_fitness(self):
         """Calculcate your fitness."""
@@ -306,9 +304,7 @@ class RogersAgent(Agent):
 
         said_blue = ([i for i in infos if
                       isinstance(i, Meme)][0].contents == "blue")
-        proportion = float(
-            max(State.query.filter_by(network_id=self.network_id).all(),
-                key=attrgetter('creation_time')).contents)
+        proportion = float(self.network.latest(type=State).contents)
         self.proportion = proportion
         is_blue = proportion > 0.5
 
@@ -368,8 +364,7 @@ class RogersEnvironment(Environment):
 
     def step(self):
         """Prompt the environment to change."""
-        current_state = max(self.infos(type=State),
-                            key=attrgetter('creation_time'))
+        current_state = self.latest(type=State)
         current_contents = float(current_state.contents)
         new_contents = 1 - current_contents
         info_out = State(origin=self, contents=new_contents)
@@ -51,6 +51,27 @@ class TestAgents(object):
         assert agent.failed is True
         assert agent.time_of_death is not None
 
+    def test_agent_fitness(self):
+        net = models.Network()
+        self.db.add(net)
+        agent1 = nodes.Agent(network=net)
+        agent2 = nodes.Agent(network=net)
+        agent3 = nodes.Agent(network=net)
+        assert agent1.fitness is None
+
+        agent1.fitness = 0.5
+        agent2.fitness = 0.75
+        self.db.commit()
+
+        assert agent2.fitness == 0.75
+        assert agent2.real1 == 0.75
+        assert nodes.Agent.query\
+            .filter(nodes.Agent.fitness > 0.6).all() == [agent2]
+        assert nodes.Agent.query\
+            .filter(nodes.Agent.fitness != None)\
+            .order_by(nodes.Agent.fitness.desc()).all() == [agent2, agent1]
+        assert agent3.fitness is None
+
     def test_create_replicator_agent(self):
         net = models.Network()
         self.db.add(net)
@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import Integer, cast
+from sqlalchemy.ext.hybrid import hybrid_property
+
+from wallace import analysis, data, db, models, nodes
+
+
+class Scored(nodes.Agent):
+    """An agent that keeps a score in property1, as older experiments do."""
+
+    __mapper_args__ = {"polymorphic_identity": "scored_agent"}
+
+    @hybrid_property
+    def score(self):
+        return int(self.property1)
+
+    @score.setter
+    def score(self, score):
+        self.property1 = repr(score)
+
+    @score.expression
+    def score(self):
+        return cast(self.property1, Integer)
+
+
+class TestAnalysis(object):
+
+    def setup(self):
+        self.db = db.init_db(drop_all=True)
+        self.path = tempfile.mkdtemp()
+        self.package = os.path.join(self.path, "package")
+        os.makedirs(os.path.join(self.package, "data"))
+
+    def teardown(self):
+        self.db.rollback()
+        self.db.close()
+        shutil.rmtree(self.path)
+
+    def populate(self):
+        net = models.Network()
+        self.db.add(net)
+        source = nodes.RandomBinaryStringSource(network=net)
+        agents = [nodes.Agent(network=net) for _ in range(2)]
+        scored = Scored(network=net)
+        scored.score = 7
+        agents[0].fitness = 0.5
+        source.connect(whom=agents + [scored])
+        agents[0].connect(whom=agents[1])
+        source.transmit(to_whom=agents[0])
+        self.db.commit()
+        return net
+
+    def export(self, **kwargs):
+        data.export_tables(os.path.join(self.package, "data"), **kwargs)
+        return data.archive(self.package,
+                            os.path.join(self.path, "package.zip"))
+
+    def test_load_tables(self):
+        self.populate()
+        with analysis.DataPackage(self.export()) as package:
+            assert package.tables() == sorted(data.TABLES)
+
+            node = package.table("node")
+            assert list(node["id"]) == [1, 2, 3, 4]
+            assert node["id"].dtype.name == "int64"
+            assert node["type"].dtype.name == "category"
+            assert node["failed"].dtype.name == "bool"
+            assert node["creation_time"].dtype.name == "datetime64[ns]"
+            assert node["fitness"][1] == 0.5
+            assert node["score"][3] == 7
+            assert node["score"].isnull()[:3].all()
+
+            transmission = package.table("transmission")
+            assert transmission["status"].dtype.name == "category"
+            assert list(transmission["status"]) == ["pending"]
+
+            assert package.table("node") is node
+
+    def test_load_deltas(self):
+        net = self.populate()
+        data.export_tables(os.path.join(self.package, "data"),
+                           incremental=True)
+        nodes.Agent(network=net)
+        models.Node.query.get(2).fail()
+        self.db.commit()
+        data.export_tables(os.path.join(self.package, "data"),
+                           incremental=True)
+
+        package = analysis.DataPackage(self.package)
+        assert package.deltas == 1
+        node = package.table("node")
+        assert list(node["id"]) == [1, 2, 3, 4, 5]
+        assert list(node["failed"]) == [False, True, False, False, False]
+
+    def test_graph(self):
+        self.populate()
+        graph = analysis.DataPackage(self.export()).graph()
+
+        assert list(graph.node_ids) == [1, 2, 3, 4]
+        assert list(graph.indptr) == [0, 3, 4, 4, 4]
+        assert list(graph.indices) == [1, 2, 3, 2]
+        assert list(graph.transmission_origins) == [0]
+        assert list(graph.transmission_destinations) == [1]
+        assert graph.transmission_info_ids[0] == 1
@@ -0,0 +1,153 @@
+from wallace import cache, db, models, nodes
+from wallace.simulation import Simulation
+
+
+class Connection(object):
+    """The few Redis commands the cache uses, in memory."""
+
+    def __init__(self):
+        self.values = {}
+        self.expiries = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def setex(self, key, seconds, value):
+        self.values[key] = value
+        self.expiries[key] = seconds
+
+    def incr(self, key):
+        self.values[key] = int(self.values.get(key, 0)) + 1
+        return self.values[key]
+
+    def sadd(self, key, member):
+        self.values.setdefault(key, set()).add(member)
+
+    def sunion(self, keys):
+        return set().union(*[self.values.get(k, set()) for k in keys])
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+
+class Pipeline(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        for name, args in self.commands:
+            getattr(self.conn, name)(*args)
+
+
+class TestCache(object):
+
+    def setup(self):
+        self.db = db.init_db(drop_all=True)
+        self.conn = Connection()
+        self.cache = cache.ResponseCache(self.conn)
+
+    def teardown(self):
+        self.db.rollback()
+        self.db.close()
+
+    def test_response_cache(self):
+        key = self.cache.key("/node/1/infos", {"info_type": "Info", "a": 1})
+        assert key == "wallace:cache:response:/node/1/infos?a=1&info_type=Info"
+        assert self.cache.get(key) is None
+
+        self.cache.set(key, "infos", [("node", 1), ("network", 1)])
+        self.cache.set("other", "info", [("info", 2)], expire=False)
+        assert self.cache.get(key) == "infos"
+        assert self.conn.expiries == {key: cache.EXPIRY}
+
+        generation = self.cache.generation()
+        self.cache.invalidate([("network", 1), ("info", 3)])
+        assert self.cache.get(key) is None
+        assert self.cache.get("other") == "info"
+        assert self.cache.generation() == generation + 1
+
+        # a response made before an invalidation is not kept
+        self.cache.set(key, "stale", [("node", 1)], generation=generation)
+        assert self.cache.get(key) is None
+        self.cache.set(key, "infos", [("node", 1)],
+                       generation=generation + 1)
+        assert self.cache.get(key) == "infos"
+
+    def test_tags(self):
+        net = models.Network()
+        self.db.add(net)
+        agents = [nodes.Agent(network=net) for _ in range(2)]
+        vector = agents[0].connect(whom=agents[1])[0]
+        info = models.Info(origin=agents[0])
+        self.db.flush()
+
+        assert cache.tags(net) == [("network", net.id)]
+        assert cache.tags(agents[0]) == [("node", agents[0].id),
+                                         ("network", net.id)]
+        assert cache.tags(vector) == [("node", agents[0].id),
+                                      ("node", agents[1].id)]
+        assert cache.tags(info) == [("info", info.id),
+                                    ("node", agents[0].id)]
+
+    def test_invalidate_on_commit(self):
+        # listen to this thread's session alone, and drop it afterwards.
+        session = self.db()
+        cache.invalidate_on_commit(session, self.cache)
+        net = models.Network()
+        session.add(net)
+        agent = nodes.Agent(network=net)
+        info = models.Info(origin=agent, contents="a")
+        session.commit()
+
+        self.cache.set("info", "a", [("info", info.id)], expire=False)
+        self.cache.set("network", "net", [("network", net.id)])
+
+        # nothing is invalidated until the change is committed
+        info.fail()
+        session.flush()
+        assert self.cache.get("info") == "a"
+        session.rollback()
+        session.commit()
+        assert self.cache.get("info") == "a"
+
+        info.fail()
+        session.commit()
+        assert self.cache.get("info") is None
+        assert self.cache.get("network") == "net"
+        self.db.remove()
+
+    def test_invalidate_bulk_inserts(self):
+        session = self.db()
+        cache.invalidate_on_commit(session, self.cache)
+        net = models.Network()
+        session.add(net)
+        source = nodes.RandomBinaryStringSource(network=net)
+        agent = nodes.ReplicatorAgent(network=net)
+        session.commit()
+
+        # vectors are inserted in bulk by connect
+        self.cache.set("vectors", "[]", [("node", agent.id)])
+        source.connect(whom=agent)
+        session.commit()
+        assert self.cache.get("vectors") is None
+
+        # infos are inserted in bulk when a simulation is saved
+        self.cache.set("infos", "[]", [("node", agent.id)])
+        sim = Simulation(net, seed=1)
+        sim.random_walk(1)
+        sim.save()
+        session.commit()
+        assert self.cache.get("infos") is None
+        self.db.remove()
@@ -3,6 +3,10 @@
 import os
 import subprocess
 
+from click.testing import CliRunner
+
+from wallace import command_line, data, db, models, nodes
+
 
 class TestCommandLine(object):
 
@@ -20,3 +24,44 @@ class TestCommandLine(object):
     def test_wallace_help(self):
         output = subprocess.check_output("wallace", shell=True)
         assert("Usage: wallace [OPTIONS] COMMAND [ARGS]" in output)
+
+
+class TestExport(object):
+
+    def setup(self):
+        self.db = db.init_db(drop_all=True)
+        net = models.Network()
+        self.db.add(net)
+        nodes.Agent(network=net)
+        self.db.commit()
+
+    def teardown(self):
+        self.db.rollback()
+        self.db.close()
+
+    def test_export_keeps_watermarks(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            path = os.path.join("data", "test", "data")
+            args = ["--app", "test", "--local"]
+
+            result = runner.invoke(command_line.export, args)
+            assert result.exit_code == 0, result.output
+            assert os.path.exists(os.path.join("data", "test-data.zip"))
+            assert data.read_watermarks(path)["tables"]["node"]["id"] == 1
+
+            # an incremental export builds on the full one
+            nodes.Agent(network=models.Network.query.one())
+            self.db.commit()
+            result = runner.invoke(command_line.export,
+                                   args + ["--incremental"])
+            assert result.exit_code == 0, result.output
+            assert os.path.exists(os.path.join(path, "node.delta-0001.csv"))
+            assert len(data.load_table(path, "node")) == 2
+
+            # and a full export starts again
+            result = runner.invoke(command_line.export, args)
+            assert result.exit_code == 0, result.output
+            assert not os.path.exists(
+                os.path.join(path, "node.delta-0001.csv"))
+            assert data.read_watermarks(path)["deltas"] == 0
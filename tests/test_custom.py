@@ -0,0 +1,176 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from json import dumps, loads
+
+from flask import Flask
+
+from wallace import cache, db, metrics, models, nodes, networks
+
+from tests.test_cache import Connection
+
+# the experiment server's routes, imported from an experiment directory.
+custom = None
+directory = None
+
+EXPERIMENT = """
+from wallace.experiments import Experiment
+
+
+class RouteTest(Experiment):
+    pass
+"""
+
+
+def setup_module():
+    """Import the routes as the server does, from an experiment directory."""
+    global custom, directory
+    wallace = os.path.join(os.path.dirname(__file__), "..", "wallace")
+    directory = tempfile.mkdtemp()
+    shutil.copy(os.path.join(wallace, "..", "examples", "bartlett1932",
+                             "config.txt"), directory)
+    with open(os.path.join(directory, "wallace_experiment.py"), "w") as f:
+        f.write(EXPERIMENT)
+    sys.path[:0] = [directory, os.path.join(wallace, "heroku")]
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        from wallace import custom
+        # psiTurk's models, which the recruiters use, read config.txt too.
+        importlib.import_module("wallace.recruiters")
+    finally:
+        os.chdir(cwd)
+
+
+def teardown_module():
+    shutil.rmtree(directory)
+
+
+class TestCustom(object):
+
+    def setup(self):
+        self.db = db.init_db(drop_all=True)
+        app = Flask(__name__, template_folder=os.path.join(
+            os.path.dirname(custom.__file__), "frontend", "templates"))
+        app.register_blueprint(custom.custom_code)
+        self.client = app.test_client()
+
+        self.net = networks.Network()
+        self.db.add(self.net)
+        self.agents = [nodes.Agent(network=self.net) for _ in range(2)]
+        self.agents[0].connect(whom=self.agents[1])
+        self.db.commit()
+        self.ids = [agent.id for agent in self.agents]
+
+    def teardown(self):
+        self.db.rollback()
+        self.db.close()
+
+    def test_transmissions_wait_timeout(self):
+        start = time.time()
+        response = self.client.get(
+            "/node/{}/transmissions/wait?timeout=1".format(self.ids[1]))
+        assert time.time() - start >= 1
+        assert response.status_code == 200
+        assert loads(response.get_data())["transmissions"] == []
+
+    def test_transmissions_wait(self):
+        def send():
+            try:
+                time.sleep(0.5)
+                sender = models.Node.query.get(self.ids[0])
+                info = models.Info(origin=sender, contents="hello")
+                sender.transmit(what=info)
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        start = time.time()
+        response = self.client.get(
+            "/node/{}/transmissions/wait?timeout=10".format(self.ids[1]))
+        thread.join()
+
+        assert time.time() - start < 5
+        transmissions = loads(response.get_data())["transmissions"]
+        assert len(transmissions) == 1
+        assert transmissions[0]["status"] == "received"
+
+    def batch(self, *operations):
+        return self.client.post("/batch",
+                                data={"operations": dumps(operations)})
+
+    def test_batch(self):
+        response = self.batch(
+            {"url": "/info/{}".format(self.ids[0]), "method": "post",
+             "data": {"contents": "hello"}},
+            {"url": "/info/{}".format(self.ids[1]), "method": "post",
+             "data": {"contents": "world"}},
+            {"url": "/node/{}/infos".format(self.ids[0])})
+        assert response.status_code == 200
+        results = loads(response.get_data())["results"]
+        assert [r["info"]["contents"] for r in results[:2]] == \
+            ["hello", "world"]
+        assert len(results[2]["infos"]) == 1
+
+        assert sorted(i.contents for i in models.Info.query) == \
+            ["hello", "world"]
+
+    def test_batch_failure(self):
+        response = self.batch(
+            {"url": "/info/{}".format(self.ids[0]), "method": "post",
+             "data": {"contents": "hello"}},
+            {"url": "/info/1000", "method": "post",
+             "data": {"contents": "hello"}})
+        assert response.status_code == 400
+        error = loads(response.get_data())
+        assert error["status"] == "error" and error["index"] == 1
+
+        assert models.Info.query.count() == 0
+
+    def test_batch_cache(self):
+        url = "/node/{}/infos".format(self.ids[0])
+        custom.response_cache = cache.ResponseCache(Connection())
+        try:
+            response = self.client.get(url)
+            assert loads(response.get_data())["infos"] == []
+            assert custom.response_cache.get(
+                custom.response_cache.key(url, {})) is not None
+
+            # the cached response is out of date once the info is posted.
+            response = self.batch(
+                {"url": "/info/{}".format(self.ids[0]), "method": "post",
+                 "data": {"contents": "hello"}},
+                {"url": url})
+            results = loads(response.get_data())["results"]
+            assert len(results[1]["infos"]) == 1
+        finally:
+            custom.response_cache = None
+
+    def test_metrics(self):
+        registry = metrics.registry
+        metrics.registry = metrics.Registry()
+        try:
+            self.client.get("/node/{}/infos".format(self.ids[0]))
+            # a missing experiment property raises an AttributeError.
+            response = self.client.get("/experiment_property/missing")
+            assert response.status_code == 500
+
+            lines = self.client.get("/metrics").get_data().splitlines()
+        finally:
+            metrics.registry = registry
+
+        assert 'wallace_requests_total{route="/node/<int:node_id>/infos",' \
+            'method="GET",status="200"} 1' in lines
+        assert 'wallace_requests_total{route="/experiment_property/<prop>",' \
+            'method="GET",status="500"} 1' in lines
+        statements = [line for line in lines if line.startswith(
+            'wallace_sql_statements_total{route="/node/<int:node_id>/infos"')]
+        assert len(statements) == 1
+        assert int(statements[0].split()[-1]) > 0
@@ -0,0 +1,130 @@
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+
+from nose.tools import assert_raises
+
+from wallace import data, db, models, nodes
+
+
+class TestData(object):
+
+    def setup(self):
+        self.db = db.init_db(drop_all=True)
+        self.path = tempfile.mkdtemp()
+
+    def teardown(self):
+        self.db.rollback()
+        self.db.close()
+        shutil.rmtree(self.path)
+
+    def populate(self):
+        net = models.Network()
+        self.db.add(net)
+        agents = [nodes.Agent(network=net) for _ in range(3)]
+        agents[0].connect(whom=agents[1:])
+        for agent in agents:
+            models.Info(origin=agent, contents="a,\"quoted\"\nvalue")
+        self.db.commit()
+
+    def rows(self, filename, opener=open):
+        with opener(filename, "rb") as f:
+            return list(csv.reader(f))
+
+    def test_export_tables(self):
+        self.populate()
+        files = data.export_tables(self.path, format="csv.gz")
+
+        assert sorted(os.path.basename(f) for f in files) == sorted(
+            table + ".csv.gz" for table in data.TABLES)
+
+        nodes_file = os.path.join(self.path, "node.csv.gz")
+        rows = self.rows(nodes_file, gzip.open)
+        assert rows[0][:3] == ["id", "creation_time", "property1"]
+        assert len(rows) == 4
+
+        infos = self.rows(os.path.join(self.path, "info.csv.gz"), gzip.open)
+        contents = infos[0].index("contents")
+        assert [r[contents] for r in infos[1:]] == \
+            ["a,\"quoted\"\nvalue"] * 3
+
+        assert len(self.rows(
+            os.path.join(self.path, "vector.csv.gz"), gzip.open)) == 3
+        assert len(self.rows(
+            os.path.join(self.path, "question.csv.gz"), gzip.open)) == 1
+
+    def test_export_csv(self):
+        self.populate()
+        files = data.export_tables(self.path, tables=["network"], workers=1)
+
+        assert files == [os.path.join(self.path, "network.csv")]
+        assert len(self.rows(files[0])) == 2
+
+        assert_raises(ValueError, data.export_tables, self.path,
+                      format="xml")
+
+    def test_archive(self):
+        self.populate()
+        tables = os.path.join(self.path, "data")
+        os.makedirs(tables)
+        data.export_tables(tables, tables=["node", "vector"], format="csv.gz")
+        with open(os.path.join(self.path, "experiment_id.md"), "w") as f:
+            f.write("abc")
+
+        filename = data.archive(self.path,
+                                os.path.join(tempfile.mkdtemp(), "x.zip"))
+        try:
+            with zipfile.ZipFile(filename) as z:
+                info = dict((i.filename, i) for i in z.infolist())
+        finally:
+            shutil.rmtree(os.path.dirname(filename))
+
+        assert sorted(info) == ["data/node.csv.gz", "data/vector.csv.gz",
+                                "data/watermarks.json", "experiment_id.md"]
+        assert info["data/node.csv.gz"].compress_type == zipfile.ZIP_STORED
+        assert info["experiment_id.md"].compress_type == zipfile.ZIP_DEFLATED
+
+    def test_incremental_export(self):
+        self.populate()
+        data.export_tables(self.path, format="csv.gz", incremental=True)
+        marks = data.read_watermarks(self.path)
+        assert marks["deltas"] == 0
+        assert marks["tables"]["node"]["id"] == 3
+        assert marks["tables"]["node"]["time_of_death"] is None
+        assert marks["tables"]["network"] == {}
+
+        # nothing has changed
+        files = data.export_tables(self.path, tables=["node", "info"],
+                                   format="csv.gz", incremental=True)
+        assert [os.path.basename(f) for f in files] == \
+            ["node.delta-0001.csv.gz", "info.delta-0001.csv.gz"]
+        assert len(self.rows(files[0], gzip.open)) == 1
+
+        # a new node and a failed one
+        net = models.Network.query.one()
+        nodes.Agent(network=net)
+        models.Node.query.get(2).fail()
+        self.db.commit()
+        files = data.export_tables(self.path, tables=["node", "network"],
+                                   format="csv.gz", incremental=True)
+        node_rows = self.rows(files[0], gzip.open)
+        assert sorted(r[0] for r in node_rows[1:]) == ["2", "4"]
+        assert len(self.rows(files[1], gzip.open)) == 2
+        marks = data.read_watermarks(self.path)
+        assert marks["deltas"] == 2
+        assert marks["tables"]["node"]["id"] == 4
+        assert marks["tables"]["node"]["time_of_death"] is not None
+        assert "info" in marks["tables"]
+
+        loaded = data.load_table(self.path, "node")
+        assert [int(r["id"]) for r in loaded] == [1, 2, 3, 4]
+        assert [r["failed"] for r in loaded] == ["f", "t", "f", "f"]
+        assert len(data.load_table(self.path, "info")) == 3
+
+        # a full export starts again
+        data.export_tables(self.path, tables=["node"], format="csv.gz")
+        assert data.read_watermarks(self.path)["deltas"] == 0
+        assert len(data.load_table(self.path, "node")) == 4
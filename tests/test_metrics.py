@@ -0,0 +1,64 @@
+from wallace import db, metrics, models
+
+
+class TestMetrics(object):
+
+    def setup(self):
+        self.db = db.init_db(drop_all=True)
+        metrics.registry = metrics.Registry()
+
+    def teardown(self):
+        self.db.rollback()
+        self.db.close()
+
+    def test_histogram(self):
+        histogram = metrics.Histogram((1, 5, 10))
+        for value in [0, 1, 3, 7, 20]:
+            histogram.observe(value)
+
+        assert histogram.counts == [2, 1, 1, 1]
+        assert histogram.cumulative_counts() == [2, 3, 4, 5]
+        assert histogram.total == 31
+        assert histogram.count == 5
+
+    def test_request_sql_counts(self):
+        metrics.start_request()
+        self.db.add(models.Network())
+        self.db.commit()
+        models.Network.query.all()
+        metrics.finish_request("/network/<network_id>", "GET", 200)
+
+        labels = ("/network/<network_id>", "GET")
+        assert metrics.registry.requests[labels + ("200",)] == 1
+        assert metrics.registry.sql_statements[labels] >= 2
+        assert metrics.registry.statements[labels].count == 1
+        assert metrics.registry.durations[labels].count == 1
+
+        # a request is only recorded once
+        metrics.finish_request("/network/<network_id>", "GET", 500)
+        assert labels + ("500",) not in metrics.registry.requests
+
+        # statements outside a request are not counted
+        models.Network.query.all()
+        assert metrics.registry.statements[labels].total == \
+            metrics.registry.sql_statements[labels]
+
+    def test_render(self):
+        metrics.registry.record("/node/<participant_id>", "POST", 200, 0.2,
+                                12, 0.05)
+        metrics.registry.record("/node/<participant_id>", "POST", 403, 0.01,
+                                3, 0.002)
+        text = metrics.registry.render()
+
+        labels = '{route="/node/<participant_id>",method="POST"'
+        assert 'wallace_requests_total' + labels + ',status="200"} 1' in text
+        assert 'wallace_requests_total' + labels + ',status="403"} 1' in text
+        assert ('wallace_request_duration_seconds_bucket' + labels +
+                ',le="0.01"} 1') in text
+        assert ('wallace_request_duration_seconds_bucket' + labels +
+                ',le="+Inf"} 2') in text
+        assert 'wallace_request_duration_seconds_count' + labels + '} 2' in text
+        assert ('wallace_request_sql_statements_bucket' + labels +
+                ',le="5"} 1') in text
+        assert 'wallace_sql_statements_total' + labels + '} 15' in text
+        assert "# TYPE wallace_request_duration_seconds histogram" in text
@@ -4,6 +4,7 @@ from __future__ import print_function
 import sys
 from datetime import datetime
 from wallace import models, db, nodes
+from wallace.profiling import query_budget
 from nose.tools import raises, assert_raises
 from wallace.nodes import Agent, Source
 from wallace.information import Gene
@@ -72,6 +73,9 @@ class TestModels(object):
         assert net.property3 is None
         assert net.property4 is None
         assert net.property5 is None
+        assert net.integer1 is None
+        assert net.real1 is None
+        assert net.boolean1 is None
         assert net.failed is False
         assert net.time_of_death is None
         assert net.type == "network"
@@ -99,7 +103,12 @@ class TestModels(object):
             "property2": None,
             "property3": None,
             "property4": None,
-            "property5": None
+            "property5": None,
+            "integer1": None,
+            "integer2": None,
+            "real1": None,
+            "real2": None,
+            "boolean1": None
         }
 
         # test nodes()
@@ -587,3 +596,42 @@ class TestModels(object):
         node = models.Node(network=net)
         self.add(node)
         assert node.creation_time is not None
+
+    def test_participant_infos(self):
+        participant = models.Participant(worker_id="1", hit_id="1",
+                                         assignment_id="1", mode="test")
+        net = models.Network()
+        self.add(participant, net)
+        for _ in range(5):
+            agent = Agent(network=net, participant=participant)
+            models.Info(origin=agent, contents="a")
+        self.db.commit()
+        participant.id  # load the expired participant before counting
+
+        with query_budget(1):
+            infos = participant.infos()
+        assert len(infos) == 5
+
+    def test_transmit_in_bulk(self):
+        net = models.Network(max_size=1000)
+        self.add(net)
+        source = Source(network=net)
+        agents = [Agent(network=net) for _ in range(500)]
+        source.connect(whom=agents)
+        info = models.Info(origin=source, contents="a")
+        self.db.flush()
+
+        with query_budget(4):
+            transmissions = source.transmit(what=models.Info,
+                                            to_whom=Agent)
+        assert len(transmissions) == 500
+        assert sorted(t.destination_id for t in transmissions) == \
+            sorted(a.id for a in agents)
+        assert all(t.info_id == info.id and t.status == "pending"
+                   for t in transmissions)
+        assert [t for t in models.bulk_inserted(self.db())
+                if isinstance(t, models.Transmission)] == transmissions
+
+        self.db.commit()
+        assert models.bulk_inserted(self.db()) == []
+        assert len(agents[0].transmissions(direction="incoming")) == 1
@@ -1,8 +1,27 @@
-from wallace import networks, nodes, db, models
+from datetime import datetime
+import os
+import threading
+from StringIO import StringIO
+from xml.etree import ElementTree
+
+from wallace import networks, nodes, db, models, information
+from wallace.experiments import Experiment
+from wallace.profiling import query_budget
 import random
 from nose.tools import assert_raises, raises
 
 
+class Receiver(nodes.Agent):
+    """An agent that notes the transmissions it receives itself."""
+
+    __mapper_args__ = {"polymorphic_identity": "receiver"}
+
+    def receive(self, what=None):
+        pending = self.transmissions(direction="incoming", status="pending")
+        super(Receiver, self).receive(what)
+        self.property1 = ",".join(str(t.id) for t in pending)
+
+
 class TestNetworks(object):
 
     def setup(self):
@@ -192,6 +211,134 @@ class TestNetworks(object):
 
         assert_raises(ValueError, node1.neighbors, direction="ghbhfgjd")
 
+    def test_network_adjacency(self):
+        net = networks.Network()
+        self.db.add(net)
+        self.db.commit()
+
+        agent1 = nodes.Agent(network=net)
+        agent2 = nodes.Agent(network=net)
+        node = models.Node(network=net)
+        agent1.connect(whom=[agent2, node])
+
+        index = net.adjacency()
+        assert index.neighbors(agent1.id) == set([agent2.id, node.id])
+        assert index.neighbors(agent2.id, direction="from") == set([agent1.id])
+        assert index.types[node.id] is models.Node
+
+        agent2.connect(whom=agent1)
+        assert net.adjacency() is index
+        assert index.neighbors(agent1.id, direction="both") == set([agent2.id])
+        assert agent1.neighbors(type=nodes.Agent) == [agent2]
+
+        agent1.vectors(direction="outgoing")[0].fail()
+        assert len(index.neighbors(agent1.id)) == 1
+        assert len(agent1.neighbors()) == 1
+
+        self.db.commit()
+        assert net.adjacency() is not index
+        assert len(net.adjacency().neighbors(agent1.id)) == 1
+
+        # once the index is built, neighbors needs a single query
+        with query_budget(1):
+            assert agent1.neighbors() == [node]
+
+    def test_network_add_vectors(self):
+        net = networks.Network()
+        self.db.add(net)
+        self.db.commit()
+
+        agent1 = nodes.Agent(network=net)
+        agent2 = nodes.Agent(network=net)
+        agent3 = nodes.Agent(network=net)
+        source = nodes.Source(network=net)
+        agent1.connect(whom=agent2)
+
+        vectors = net.add_vectors([(agent1, agent2), (agent2, agent3),
+                                   (source, agent1), (agent2, agent3)])
+        assert len(vectors) == 2
+        assert [(v.origin, v.destination) for v in vectors] == [
+            (agent2, agent3), (source, agent1)]
+        assert len(net.vectors()) == 3
+        assert agent2.is_connected(whom=agent3)
+        assert net.add_vectors([(agent1, agent2)]) == []
+
+        assert_raises(TypeError, net.add_vectors, [(agent3, agent1),
+                                                   (agent1, source)])
+        assert not agent3.is_connected(whom=agent1)
+
+        other_net = networks.Network()
+        self.db.add(other_net)
+        self.db.commit()
+        assert_raises(ValueError, other_net.add_vectors, [(agent1, agent3)])
+
+    def test_participant_fail_cascade(self):
+        net = networks.FullyConnected()
+        self.db.add(net)
+        participant = models.Participant(worker_id="1", hit_id="1",
+                                         assignment_id="1", mode="test")
+        self.db.add(participant)
+        self.db.commit()
+
+        agents = [nodes.ReplicatorAgent(network=net) for _ in range(3)]
+        agents.append(nodes.ReplicatorAgent(network=net,
+                                            participant=participant))
+        for agent in agents:
+            net.add_node(agent)
+        mine = agents[-1]
+
+        info = models.Info(origin=mine, contents="mine")
+        mine.transmit(what=info, to_whom=agents[0])
+        agents[0].receive()
+        copy = agents[0].infos()[0]
+        other = models.Info(origin=agents[1], contents="other")
+        agents[1].transmit(what=other, to_whom=mine)
+
+        participant.fail()
+
+        assert mine.failed is True
+        assert info.failed is True
+        assert copy.failed is False and other.failed is False
+        assert all(v.failed for v in mine.vectors(failed="all"))
+        assert all(t.failed for t in mine.transmissions(direction="all",
+                                                        failed="all"))
+        assert all(t.failed for t in net.transformations(failed="all"))
+        assert len(net.nodes()) == 3
+        assert len(net.vectors()) == 6
+        assert len(net.transmissions()) == 0
+        assert mine not in agents[0].neighbors()
+
+        self.db.commit()
+        assert models.Node.query.get(mine.id).failed is True
+        assert mine.time_of_death == info.time_of_death
+
+    def test_network_counts(self):
+        net = networks.Network()
+        net.max_size = 4
+        self.db.add(net)
+        self.db.commit()
+
+        agents = [nodes.Agent(network=net) for _ in range(3)]
+        source = nodes.Source(network=net)
+        source.connect(whom=agents)
+
+        assert net.node_count == 4
+        assert net.full is True
+        assert net.count_nodes() == 4
+        assert net.count_nodes(type=nodes.Agent) == 3
+        assert net.count_vectors() == 3
+        assert net.count_infos() == 0
+
+        agents[0].fail()
+        assert net.node_count == 3
+        assert net.full is False
+        assert net.count_nodes(failed=True) == 1
+        assert net.count_vectors(failed="all") == 3
+        assert net.count_vectors() == 2
+
+        self.db.commit()
+        assert models.Network.query.get(net.id).node_count == 3
+
     def test_network_repr(self):
         net = networks.Network()
         self.db.add(net)
@@ -314,6 +461,32 @@ class TestNetworks(object):
         assert len(net.nodes(type=nodes.Agent)) == m0 + 2
         assert len(net.vectors()) == m0*(m0 - 1) + 2*2*m
 
+    def test_scale_free_degrees(self):
+        net = networks.ScaleFree(m0=3, m=2)
+        self.db.add(net)
+        self.db.commit()
+
+        agents = []
+        for i in range(8):
+            agent = nodes.Agent(network=net)
+            net.add_node(agent)
+            agents.append(agent)
+
+        degrees = net.degrees()
+        for agent in agents:
+            assert degrees[agent.id] == len(agent.vectors(direction="outgoing"))
+            assert degrees[agent.id] >= 2
+        for agent in agents[3:]:
+            assert len(agent.neighbors(direction="both")) >= 2
+
+        agents[0].fail()
+        assert degrees[agents[0].id] == 0
+        assert agents[0].id not in degrees.sample(8)
+
+        self.db.commit()
+        assert net.degrees() is not degrees
+        assert net.degrees()[agents[0].id] == 0
+
     def test_scale_free_repr(self):
         net = networks.ScaleFree(m0=4, m=4)
         self.db.add(net)
@@ -363,6 +536,35 @@ class TestNetworks(object):
         assert agent3.is_connected(direction="to", whom=agent5)
         assert not agent3.is_connected(direction="to", whom=agent6)
 
+    def test_discrete_generational_parents(self):
+        net = networks.DiscreteGenerational(
+            generations=3, generation_size=2, initial_source=True)
+        self.db.add(net)
+        self.db.commit()
+        source = nodes.RandomBinaryStringSource(network=net)
+
+        agents = []
+        for i in range(6):
+            agent = nodes.Agent(network=net)
+            net.add_node(agent)
+            agent.fitness = [1, 0, None, 2, 1, 1][i]
+            agents.append(agent)
+
+        assert [a.generation for a in agents] == [0, 0, 1, 1, 2, 2]
+        for a in agents[:2]:
+            assert a.neighbors(direction="from") == [source]
+        for a in agents[2:4]:
+            assert a.neighbors(direction="from") == [agents[0]]
+        for a in agents[4:]:
+            assert a.neighbors(direction="from") == [agents[3]]
+
+        # the sampler of a generation is built once, until the next commit
+        sampler = net.parents(1)
+        assert sampler.items == agents[2:4]
+        assert net.parents(1) is sampler
+        self.db.commit()
+        assert net.parents(1) is not sampler
+
     # def test_discrete_generational(self):
     #     n_gens = 4
     #     gen_size = 4
@@ -392,3 +594,288 @@ class TestNetworks(object):
     #                 assert (agents[a].is_connected(direction="to", whom=agents[b]) is False)
     #             if a_gen == 0:
     #                 assert isinstance(agents[a].neighbors(direction="from")[0], nodes.Source)
+
+    def test_deliver_all(self):
+        net = networks.Network()
+        self.db.add(net)
+        self.db.commit()
+
+        source = nodes.Source(network=net)
+        agents = [nodes.ReplicatorAgent(network=net) for _ in range(3)]
+        source.connect(whom=agents)
+        infos = [models.Info(origin=source, contents=c) for c in "ab"]
+        source.transmit(what=infos[0], to_whom=agents)
+        source.transmit(what=infos[1], to_whom=agents[0])
+        agents[2].fail()
+
+        received = net.deliver_all()
+        assert [t.destination_id for t in received] == \
+            [agents[0].id, agents[1].id, agents[0].id]
+        assert all(t.status == "received" for t in received)
+        assert sorted(i.contents for i in agents[0].infos()) == ["a", "b"]
+        assert [i.contents for i in agents[1].infos()] == ["a"]
+        assert len(agents[0].received_infos()) == 2
+
+        # transmissions to failed nodes are left pending
+        assert net.transmissions(status="pending", failed="all")[0]\
+            .destination_id == agents[2].id
+        assert net.deliver_all() == []
+
+        self.db.commit()
+        assert len(net.transmissions(status="received")) == 3
+
+        # the number of queries does not grow with the number of nodes
+        net = networks.Network(max_size=100)
+        self.db.add(net)
+        source = nodes.Source(network=net)
+        agents = [nodes.Agent(network=net) for _ in range(50)]
+        source.connect(whom=agents)
+        source.transmit(what=models.Info(origin=source, contents="a"),
+                        to_whom=agents)
+        self.db.commit()
+        net.id  # load the expired network before counting
+
+        with query_budget(4):
+            received = net.deliver_all()
+        assert len(received) == 50
+
+    def test_deliver_all_overridden_receive(self):
+        net = networks.Network()
+        self.db.add(net)
+        source = nodes.Source(network=net)
+        agent = nodes.Agent(network=net)
+        receiver = Receiver(network=net)
+        source.connect(whom=[agent, receiver])
+        transmissions = source.transmit(
+            what=models.Info(origin=source, contents="a"),
+            to_whom=[agent, receiver])
+        self.db.commit()
+
+        # classes that override receive receive for themselves
+        assert net.deliver_all() == sorted(transmissions, key=lambda t: t.id)
+        mine = [t for t in transmissions if t.destination_id == receiver.id]
+        assert receiver.property1 == str(mine[0].id)
+        assert all(t.status == "received" for t in transmissions)
+        self.db.commit()
+
+        # sources cannot receive, as with receive; connect refuses to make a
+        # vector to a source, so it is inserted directly.
+        info = models.Info(origin=agent, contents="b")
+        self.db.flush()
+        vector = models.bulk_insert(self.db(), models.Vector, [{
+            "origin_id": agent.id, "destination_id": source.id,
+            "network_id": net.id, "failed": False}])[0]
+        models.bulk_insert(self.db(), models.Transmission, [{
+            "vector_id": vector.id, "info_id": info.id,
+            "origin_id": agent.id, "destination_id": source.id,
+            "network_id": net.id, "status": "pending", "failed": False}])
+        assert_raises(Exception, net.deliver_all)
+
+    def test_latest_and_earliest(self):
+        net = networks.Network()
+        self.db.add(net)
+        self.db.commit()
+
+        assert net.latest() is None
+        source = nodes.Source(network=net)
+        agents = [nodes.Agent(network=net) for _ in range(3)]
+        agents[2].fail()
+
+        assert net.earliest() is source
+        assert net.latest() is agents[1]
+        assert net.latest(failed="all") is agents[2]
+        assert net.earliest(type=nodes.Agent) is agents[0]
+        assert net.latest(where=models.Node.id != agents[1].id) is agents[0]
+
+        infos = [models.Info(origin=source, contents=c) for c in "abc"]
+        gene = information.Gene(origin=source, contents="d")
+        assert source.latest() is gene
+        assert source.latest(type=information.Gene) is gene
+        assert source.earliest() is infos[0]
+        assert agents[0].latest() is None
+        assert net.latest(type=models.Info, where=models.Info.contents < "c")\
+            is infos[1]
+
+        source.connect(whom=agents[:2])
+        source.transmit(what=gene, to_whom=agents[1])
+        source.transmit(what=gene, to_whom=agents[0])
+        agents[1].receive()
+        assert net.latest_transmission_recipient() is agents[1]
+        agents[0].receive()
+        assert net.latest_transmission_recipient() is agents[0]
+
+        # the same answers come from the loaded graph
+        net.load_graph()
+        assert net.latest() is agents[1]
+        assert source.earliest() is infos[0]
+        assert net.latest_transmission_recipient() is agents[0]
+
+    def test_snapshots(self):
+        net = networks.Network()
+        self.db.add(net)
+        self.db.commit()
+
+        t = [datetime(2016, 1, 1, 0, 0, s) for s in range(6)]
+        environment = nodes.Environment(network=net)
+        environment.creation_time = t[0]
+        agent = nodes.Agent(network=net)
+        agent.creation_time = t[1]
+        vector = environment.connect(whom=agent)[0]
+        vector.creation_time = t[2]
+        old = information.State(origin=environment, contents="old")
+        old.creation_time = t[1]
+        new = information.State(origin=environment, contents="new")
+        new.creation_time = t[3]
+        agent.fail()
+        agent.time_of_death = vector.time_of_death = t[4]
+
+        assert net.at(t[0]).nodes() == [environment]
+        assert net.at(t[0]).state() is None
+        assert net.at(t[1]).nodes() == [environment, agent]
+        assert net.at(t[1]).nodes(type=nodes.Agent) == [agent]
+        assert net.at(t[1]).vectors() == []
+        assert net.at(t[1]).state() is old
+        assert net.at(t[3]).vectors() == [vector]
+        assert net.at(t[3]).infos() == [old, new]
+        assert net.at(t[3]).state(origin=environment) is new
+        assert net.at(t[4]).nodes() == [environment]
+        assert net.at(t[4]).vectors() == []
+        assert environment.state(time=t[2]) is old
+        assert environment.state() is new
+
+        snapshots = net.snapshots(reversed(t))
+        assert [s.time for s in snapshots] == t
+        for snapshot in snapshots:
+            at = net.at(snapshot.time)
+            assert snapshot.nodes() == at.nodes()
+            assert snapshot.vectors() == at.vectors()
+            assert snapshot.infos() == at.infos()
+            assert snapshot.state() is at.state()
+
+    def test_to_arrays(self):
+        net = networks.Network()
+        self.db.add(net)
+        source = nodes.Source(network=net)
+        agents = [nodes.Agent(network=net) for _ in range(3)]
+        agents[0].fitness = 0.5
+        source.connect(whom=agents)
+        agents[0].connect(whom=agents[1])
+        agents[2].fail()
+        self.db.commit()
+        net.id  # load the expired network before counting
+
+        with query_budget(2):
+            arrays = net.to_arrays(properties=["fitness"])
+        ids = [source.id] + [a.id for a in agents]
+        assert list(arrays.node_ids) == ids
+        assert arrays.types.dtype.name == "int8"
+        assert [arrays.type_names[c] for c in arrays.types] == \
+            ["generic_source", "agent", "agent", "agent"]
+        assert list(arrays.failed) == [False, False, False, True]
+        assert arrays.properties["fitness"][1] == 0.5
+        # NaN, as the source has no fitness and the agents have none set
+        assert all(f != f for f in arrays.properties["fitness"][[0, 2, 3]])
+        assert list(arrays.indptr) == [0, 2, 3, 3, 3]
+        assert list(arrays.indices) == [1, 2, 2]
+        assert list(arrays.degrees()) == [2, 1, 0, 0]
+
+        edgelist = StringIO()
+        arrays.write_edgelist(edgelist, chunk_size=2)
+        assert edgelist.getvalue().splitlines() == [
+            "{} {}".format(ids[0], ids[1]), "{} {}".format(ids[0], ids[2]),
+            "{} {}".format(ids[1], ids[2])]
+
+        graphml = StringIO()
+        arrays.write_graphml(graphml, chunk_size=2)
+        root = ElementTree.fromstring(graphml.getvalue())
+        ns = "{http://graphml.graphdrawing.org/xmlns}"
+        assert len(root.findall("{0}graph/{0}node".format(ns))) == 4
+        assert [e.get("target") for e in
+                root.findall("{0}graph/{0}edge".format(ns))] == \
+            ["n{}".format(i) for i in ids[1:3] + ids[2:3]]
+
+    def test_load_graph(self):
+        net = models.Network()
+        self.db.add(net)
+        self.db.commit()
+        source = nodes.Source(network=net)
+        agents = [nodes.Agent(network=net) for _ in range(3)]
+        source.connect(whom=agents)
+        agents[0].connect(whom=agents[1])
+        info = models.Info(origin=source, contents="a")
+        source.transmit(what=info, to_whom=agents[0])
+        agents[0].receive()
+        self.db.commit()
+        net.id  # load the expired network before counting
+
+        with query_budget(4):
+            net.load_graph()
+
+        with query_budget(0):
+            assert len(net.nodes()) == 4
+            assert len(net.nodes(type=nodes.Agent)) == 3
+            assert net.count_vectors() == 4
+            assert net.infos() == [info]
+            assert len(net.transmissions(status="received")) == 1
+            assert len(source.vectors(direction="outgoing")) == 3
+            assert len(agents[1].vectors()) == 2
+            assert source.infos() == [info]
+            assert agents[0].received_infos() == [info]
+            assert len(agents[0].transmissions(direction="incoming")) == 1
+            assert agents[0].neighbors() == [agents[1]]
+            assert agents[0].is_connected(whom=agents[1])
+
+        # objects created and failed through the models are reflected
+        new = models.Info(origin=agents[1], contents="b")
+        agents[0].vectors(direction="outgoing")[0].fail()
+        with query_budget(3):
+            assert net.infos() == [info, new]
+            assert agents[1].infos() == [new]
+            assert agents[0].vectors(direction="outgoing") == []
+            assert agents[0].neighbors() == []
+
+        # the graph is dropped on commit
+        self.db.commit()
+        assert "_graph" not in net.__dict__
+        assert len(net.infos()) == 2
+
+    def test_get_network_for_participant_concurrently(self):
+        for _ in range(2):
+            self.db.add(networks.Network(role="practice"))
+        participants = [models.Participant(worker_id=str(i), hit_id="1",
+                                           assignment_id=str(i), mode="test")
+                        for i in range(2)]
+        self.db.add_all(participants)
+        self.db.commit()
+        participant_ids = [p.id for p in participants]
+
+        # the experiment's recruiter reads psiTurk's config.txt.
+        os.chdir(os.path.join("examples", "bartlett1932"))
+        try:
+            exp = Experiment(self.db)
+        finally:
+            os.chdir(os.path.join("..", ".."))
+        exp.verbose = False
+        first = exp.get_network_for_participant(participants[0])
+
+        # a second participant arrives while the first still holds its lock;
+        # scoped sessions give the thread its own session and transaction.
+        chosen = []
+
+        def choose():
+            try:
+                participant = models.Participant.query.get(participant_ids[1])
+                network = exp.get_network_for_participant(participant)
+                chosen.append(network.id)
+            finally:
+                db.session.rollback()
+                db.session.remove()
+
+        thread = threading.Thread(target=choose)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.db.rollback()
+        thread.join()
+
+        assert chosen and chosen[0] != first.id
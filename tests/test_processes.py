@@ -1,5 +1,7 @@
 from wallace import processes, networks, nodes, db, models
 from wallace.nodes import Agent
+from wallace.sampling import WeightedSampler
+from nose.tools import assert_raises
 
 
 class TestProcesses(object):
@@ -122,3 +124,29 @@ class TestProcesses(object):
         for a in net.nodes(type=Agent):
             for a2 in net.nodes(type=Agent):
                 assert a.infos()[0].contents == a2.infos()[0].contents
+
+    def test_transmit_by_fitness(self):
+        net = networks.Network()
+        self.db.add(net)
+        self.db.commit()
+
+        parents = [nodes.Agent(network=net) for _ in range(3)]
+        child = nodes.Agent(network=net)
+        parents[0].fitness = 0
+        parents[2].fitness = 1
+        for parent in parents:
+            parent.connect(whom=child)
+            models.Info(origin=parent)
+
+        processes.transmit_by_fitness(from_whom=parents, to_whom=child)
+        assert child.transmissions(direction="incoming")[0].origin == parents[2]
+
+        # a sampler of the parents can be passed instead, and reused
+        sampler = WeightedSampler(parents, [p.fitness for p in parents])
+        processes.transmit_by_fitness(from_whom=sampler, to_whom=child)
+        assert [t.origin for t in child.transmissions(
+            direction="incoming")] == [parents[2], parents[2]]
+
+        parents[2].fitness = 0
+        assert_raises(ValueError, processes.transmit_by_fitness,
+                      from_whom=parents, to_whom=child)
@@ -0,0 +1,59 @@
+import warnings
+
+from nose.tools import assert_raises
+
+from wallace import db, models, profiling
+from wallace.profiling import count_queries, query_budget
+
+
+class TestProfiling(object):
+
+    def setup(self):
+        self.db = db.init_db(drop_all=True)
+
+    def teardown(self):
+        self.db.rollback()
+        self.db.close()
+
+    def add(self, *args):
+        self.db.add_all(args)
+        self.db.commit()
+
+    def test_count_queries(self):
+        net = models.Network()
+        self.add(net)
+
+        with count_queries() as outer:
+            with count_queries() as inner:
+                models.Node.query.all()
+            for _ in range(2):
+                models.Node.query.all()
+
+        assert inner.count == 1
+        assert outer.count == 3
+        [(call_site, n)] = outer.by_call_site()[:1]
+        assert n == 2
+        assert "test_profiling.py" in call_site
+        assert "test_count_queries" in call_site
+
+        # statements outside a block are not counted
+        models.Node.query.all()
+        assert outer.count == 3
+
+    def test_query_budget(self):
+        with query_budget(1):
+            models.Node.query.all()
+
+        with assert_raises(profiling.QueryBudgetExceeded) as context:
+            with query_budget(1):
+                for _ in range(3):
+                    models.Node.query.all()
+        assert "3 SQL statements" in str(context.exception)
+        assert "test_query_budget" in str(context.exception)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            with query_budget(0, warn=True):
+                models.Node.query.all()
+        assert len(caught) == 1
+        assert issubclass(caught[0].category, RuntimeWarning)
@@ -0,0 +1,56 @@
+from wallace.sampling import FenwickTree, WeightedSampler
+from collections import Counter
+from nose.tools import assert_raises
+
+
+class TestSampling(object):
+
+    def test_fenwick_tree_sums(self):
+        weights = [3, 0, 1, 4, 1, 5, 9, 2, 6]
+        tree = FenwickTree(weights[:4])
+        for w in weights[4:]:
+            tree.append(w)
+
+        assert len(tree) == len(weights)
+        assert tree.total() == sum(weights)
+        for n in range(len(weights) + 1):
+            assert tree.prefix(n) == sum(weights[:n])
+
+        tree[3] = 0
+        tree.add(1, 2)
+        assert tree[1] == 2
+        assert tree.total() == sum(weights) - 4 + 2
+
+    def test_fenwick_tree_find(self):
+        tree = FenwickTree([1, 0, 2, 1])
+        assert tree.find(0) == 0
+        assert tree.find(0.5) == 0
+        assert tree.find(1) == 2
+        assert tree.find(2.9) == 2
+        assert tree.find(3) == 3
+
+    def test_fenwick_tree_sample(self):
+        tree = FenwickTree([1, 0, 2, 1, 5])
+
+        drawn = tree.sample(10)
+        assert sorted(drawn) == [0, 2, 3, 4]
+        assert tree.total() == 9
+
+        drawn = tree.sample(2, exclude=[4, 2])
+        assert sorted(drawn) == [0, 3]
+        assert tree[4] == 5
+
+        counts = Counter(tree.sample(1)[0] for _ in range(5000))
+        assert 1 not in counts
+        assert counts[4] > counts[2] > counts[0]
+
+    def test_weighted_sampler(self):
+        sampler = WeightedSampler(["a", "b", "c", "d"], [1, None, 0, 3])
+        counts = Counter(sampler.sample(4000))
+        assert set(counts) == set(["a", "d"])
+        assert counts["d"] > counts["a"]
+        assert sampler.choice() in ["a", "d"]
+
+        assert_raises(ValueError, WeightedSampler, ["a", "b"], [0, None])
+        assert_raises(ValueError, WeightedSampler, ["a", "b"], [1, -1])
+        assert_raises(ValueError, WeightedSampler, ["a", "b"], [1])
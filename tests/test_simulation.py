@@ -0,0 +1,130 @@
+from wallace import networks, nodes, db, models, transformations
+from wallace.simulation import Simulation
+from nose.tools import assert_raises
+
+
+class TestSimulation(object):
+
+    def setup(self):
+        self.db = db.init_db(drop_all=True)
+
+    def teardown(self):
+        self.db.rollback()
+        self.db.close()
+
+    def test_simulation_arrays(self):
+        net = networks.Network()
+        self.db.add(net)
+        self.db.commit()
+
+        agent1 = nodes.ReplicatorAgent(network=net)
+        agent2 = nodes.ReplicatorAgent(network=net)
+        node = models.Node(network=net)
+        agent1.connect(whom=[agent2, node])
+        agent2.connect(whom=agent1)
+        models.Info(origin=agent1, contents="foo")
+
+        sim = Simulation(net)
+        assert list(sim.node_ids) == [agent1.id, agent2.id, node.id]
+        assert list(sim.indptr) == [0, 2, 3, 3]
+        assert list(sim.node_ids[sim.indices]) == [agent2.id, node.id,
+                                                   agent1.id]
+        assert list(sim.agent_indptr) == [0, 1, 2, 2]
+        assert sim.infos() == {agent1.id: "foo"}
+
+    def test_simulation_random_walk(self):
+        net = networks.Chain()
+        self.db.add(net)
+        self.db.commit()
+
+        source = nodes.RandomBinaryStringSource(network=net)
+        net.add_node(source)
+        agents = []
+        for _ in range(4):
+            agent = nodes.ReplicatorAgent(network=net)
+            net.add_node(agent)
+            agents.append(agent)
+
+        sim = Simulation(net, seed=1)
+        sim.random_walk(4)
+        msg = sim.infos()[source.id]
+        assert sim.infos() == dict((n.id, msg) for n in [source] + agents)
+
+        assert_raises(ValueError, sim.random_walk, 1)
+        sim.save()
+
+        assert len(net.transmissions(status="received")) == 4
+        assert len(net.transformations(type=transformations.Replication)) == 4
+        for agent in agents:
+            assert agent.infos()[0].contents == msg
+            assert agent.transformations()[0].info_out == agent.infos()[0]
+        assert net.latest_transmission_recipient() == agents[-1]
+
+    def test_simulation_moran_cultural(self):
+        net = networks.FullyConnected()
+        self.db.add(net)
+        self.db.commit()
+
+        agents = []
+        for _ in range(5):
+            agent = nodes.ReplicatorAgent(network=net)
+            net.add_node(agent)
+            agents.append(agent)
+        source = nodes.RandomBinaryStringSource(network=net)
+        source.connect(whom=agents)
+
+        sim = Simulation(net, seed=2)
+        sim.moran_cultural(1000)
+        assert len(set(sim.infos()[a.id] for a in agents)) == 1
+        sim.save()
+
+        sim.moran_cultural(10)
+        sim.save()
+        self.db.commit()
+
+        assert net.count_transmissions() == 1010 + 5 - 1
+        assert net.count_infos() == 1 + 1010 + 5 - 1
+        from operator import attrgetter
+        contents = set(max(a.infos(), key=attrgetter('creation_time')).contents
+                       for a in agents)
+        assert contents == set(sim.infos()[a.id] for a in agents)
+        assert len(contents) == 1
+
+        # a fresh simulation carries on from where the last left off
+        sim = Simulation(net)
+        assert sim.transmitted
+        msg = contents.pop()
+        assert all(sim.infos()[a.id] == msg for a in agents)
+
+    def test_simulation_current_infos(self):
+        net = networks.Network()
+        self.db.add(net)
+        agent = nodes.ReplicatorAgent(network=net)
+        gone = nodes.ReplicatorAgent(network=net)
+        first = models.Info(origin=agent, contents="first")
+        second = models.Info(origin=agent, contents="second")
+        second.creation_time = first.creation_time
+        # an info left behind by a node that has since failed, whose id
+        # sorts past those of all the live nodes.
+        models.Info(origin=gone, contents="gone")
+        gone.failed = True
+        self.db.commit()
+
+        sim = Simulation(net)
+        assert list(sim.node_ids) == [agent.id]
+        # ties in creation time go to the latest id, as in Node.latest
+        assert agent.latest() == second
+        assert sim.infos() == {agent.id: "second"}
+
+    def test_simulation_unmapped_type(self):
+        net = networks.Network()
+        self.db.add(net)
+        agent = nodes.Agent(network=net)
+        self.db.flush()
+        # a node of a class defined by an experiment that is not imported
+        agent.type = "experiment_agent"
+        self.db.flush()
+
+        with assert_raises(ValueError) as context:
+            Simulation(net)
+        assert "experiment_agent" in str(context.exception)
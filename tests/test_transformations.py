@@ -1,4 +1,7 @@
-from wallace import db, models
+from nose.tools import assert_raises
+
+from wallace import db, models, nodes, transformations
+from wallace.profiling import query_budget
 
 
 class TestTransformations(object):
@@ -15,6 +18,31 @@ class TestTransformations(object):
         self.db.add_all(args)
         self.db.commit()
 
+    def test_transformation_checks(self):
+        net = models.Network()
+        self.add(net)
+        source = nodes.Source(network=net)
+        agent = nodes.Agent(network=net)
+        source.connect(whom=agent)
+        info = models.Info(origin=source, contents="a")
+        source.transmit(what=info, to_whom=agent)
+        agent.receive()
+        for _ in range(5):
+            models.Info(origin=agent, contents="b")
+        copy = models.Info(origin=agent, contents="a")
+        self.db.commit()
+        # load the expired infos and their relationships before counting
+        info.origin_id, copy.origin, copy.network
+
+        # whether the info was received is checked with a single query
+        with query_budget(1):
+            models.Transformation(info_in=info, info_out=copy)
+
+        stranger = models.Info(origin=nodes.Agent(network=net), contents="c")
+        self.db.commit()
+        assert_raises(ValueError, models.Transformation, info_in=stranger,
+                      info_out=copy)
+
     def test_identity_transformation(self):
         net = models.Network()
         self.add(net)
@@ -68,3 +96,62 @@ class TestTransformations(object):
     #     self.db.commit()
 
     #     assert info_out.contents in ["foo", "ofo", "oof"]
+
+    def test_lineage(self):
+        net = models.Network()
+        self.add(net)
+        node = models.Node(network=net)
+        self.add(node)
+
+        a = models.Info(origin=node, contents="a")
+        other = models.Info(origin=node, contents="other")
+        self.add(a, other)
+
+        def replicate(info):
+            copy = models.Info(origin=node, contents=info.contents)
+            transformations.Replication(info_in=info, info_out=copy)
+            return copy
+
+        b = replicate(a)
+        c = replicate(b)
+        d = replicate(b)
+        e = replicate(c)
+        self.db.commit()
+
+        assert e.ancestors() == [(c, 1), (b, 2), (a, 3)]
+        assert a.ancestors() == []
+        assert a.descendants() == [(b, 1), (c, 2), (d, 2), (e, 3)]
+        assert c.descendants() == [(e, 1)]
+
+        tree = net.lineage_tree()
+        assert [(r.info_id, r.parent_id, r.root_id, r.depth, r.path)
+                for r in tree] == [
+            (a.id, None, a.id, 0, [a.id]),
+            (b.id, a.id, a.id, 1, [a.id, b.id]),
+            (c.id, b.id, a.id, 2, [a.id, b.id, c.id]),
+            (e.id, c.id, a.id, 3, [a.id, b.id, c.id, e.id]),
+            (d.id, b.id, a.id, 2, [a.id, b.id, d.id]),
+            (other.id, None, other.id, 0, [other.id])]
+
+        # failing an info fails its transformations, which cuts the lineage
+        c.fail()
+        self.db.commit()
+        assert e.ancestors() == []
+        assert e.ancestors(failed="all") == [(c, 1), (b, 2), (a, 3)]
+        assert a.descendants() == [(b, 1), (d, 2)]
+        assert [(r.info_id, r.root_id) for r in net.lineage_tree()] == [
+            (a.id, a.id), (b.id, a.id), (d.id, a.id), (other.id, other.id),
+            (e.id, e.id)]
+
+        net.lineage_tree(failed="all", materialize=True)
+        assert self.db.execute(
+            "SELECT count(*) FROM lineage").scalar() == 6
+
+        # a second call replaces the table, in this transaction and the next
+        net.lineage_tree(materialize=True)
+        assert self.db.execute(
+            "SELECT count(*) FROM lineage").scalar() == 5
+        self.db.commit()
+        net.lineage_tree(failed="all", materialize=True)
+        assert self.db.execute(
+            "SELECT count(*) FROM lineage").scalar() == 6
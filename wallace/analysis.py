@@ -0,0 +1,377 @@
+"""Load exported data packages for analysis.
+
+A :class:`DataPackage` reads the tables in a zip made by ``wallace export``
+(or in the folder an incremental export keeps) straight out of the archive,
+a table at a time as they are asked for, into pandas data frames with typed
+columns:
+
+* ``type`` and ``status`` columns are categorical,
+* timestamps are parsed into datetimes,
+* ids, numbers and booleans get numeric and boolean types, and
+* the hybrid properties of the node, info and other classes that have been
+  imported are decoded into columns of their own, so an experiment that
+  keeps ``generation`` in ``property2`` gets an integer ``generation``
+  column for the rows of that class.
+
+pandas and NumPy are needed to load data packages, but are not needed by
+the rest of Wallace. Import the experiment's classes before loading its
+data so that their hybrid properties can be decoded.
+"""
+
+import io
+import json
+import os
+import zipfile
+import zlib
+
+from sqlalchemy import Boolean, DateTime, Enum, Float, Integer, inspect
+from sqlalchemy.ext.hybrid import HYBRID_PROPERTY
+from sqlalchemy.sql.expression import Cast
+
+from wallace import data
+from wallace.models import (Info, Network, Node, Notification, Participant,
+                            Question, Transformation, Transmission, Vector)
+
+#: the models of the exported tables, by table name.
+MODELS = dict((model.__tablename__, model) for model in [
+    Info, Network, Node, Notification, Participant, Question, Transformation,
+    Transmission, Vector])
+
+#: the strings that decode to True and False in boolean hybrid properties.
+TRUE_VALUES = ["True", "true", "t", "1"]
+FALSE_VALUES = ["False", "false", "f", "0"]
+
+
+class DataPackage(object):
+    """The tables of an exported experiment.
+
+    ``path`` is either the zip made by ``wallace export`` or a folder holding
+    the same files. Tables are only read when they are first asked for, and
+    are then kept, so each is read once.
+    """
+
+    def __init__(self, path):
+        """Open a data package."""
+        self.path = path
+        if os.path.isdir(path):
+            self._zip = None
+            self._names = set(
+                os.path.relpath(os.path.join(root, name), path)
+                .replace(os.sep, "/")
+                for root, _, files in os.walk(path) for name in files)
+        else:
+            self._zip = zipfile.ZipFile(path)
+            self._names = set(self._zip.namelist())
+        self._tables = {}
+
+        watermarks = self._member(data.WATERMARKS_FILE)
+        self.deltas = 0
+        if watermarks is not None:
+            with self._open(watermarks) as f:
+                self.deltas = json.load(f)["deltas"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the zip file, if the package is one."""
+        if self._zip is not None:
+            self._zip.close()
+
+    def tables(self):
+        """The names of the tables in the package."""
+        return sorted(table for table in MODELS
+                      if self._files(table, 0) is not None)
+
+    def table(self, name):
+        """A table as a pandas DataFrame, merged with any deltas of it."""
+        if name not in self._tables:
+            self._tables[name] = self._load(name)
+        return self._tables[name]
+
+    def graph(self, network_id=None, failed=False):
+        """The nodes, vectors and transmissions of the package as a
+        :class:`Graph`.
+
+        By default only not-failed nodes, vectors and transmissions are
+        included. Pass ``failed="all"`` to include everything, and
+        ``network_id`` to include only the nodes of one network.
+        """
+        return Graph(self, network_id, failed)
+
+    def _load(self, name):
+        """Read, merge and decode a table."""
+        import pandas as pd
+
+        if name not in MODELS:
+            raise ValueError("{} is not an exported table".format(name))
+        model = MODELS[name]
+
+        frames = []
+        for delta in range(self.deltas + 1):
+            files = self._files(name, delta)
+            if files is not None:
+                frames.append(self._read(model, *files))
+        if not frames:
+            raise ValueError("{} has no {} table".format(self.path, name))
+
+        frame = frames[0] if len(frames) == 1 else \
+            pd.concat(frames, ignore_index=True)\
+            .drop_duplicates(subset="id", keep="last")
+        frame = frame.sort_values("id").reset_index(drop=True)
+
+        for column in _categorical_columns(model):
+            if column in frame and frame[column].dtype.name != "category":
+                frame[column] = frame[column].astype("category")
+
+        _decode_hybrid_properties(model, frame)
+        return frame
+
+    def _files(self, table, delta):
+        """The member holding a table, or a delta of it, and its format."""
+        for format in sorted(data.FORMATS):
+            member = self._member(data._filename(table, format, delta))
+            if member is not None:
+                return member, format
+        return None
+
+    def _member(self, filename):
+        """The name of the member holding an exported file, if there is one."""
+        for member in ["data/" + filename, filename]:
+            if member in self._names:
+                return member
+        return None
+
+    def _open(self, member):
+        """Open a member of the package for reading."""
+        if self._zip is None:
+            return open(os.path.join(self.path, member), "rb")
+        return self._zip.open(member)
+
+    def _read(self, model, member, format):
+        """Read an exported table, or a delta of it, into a DataFrame."""
+        import pandas as pd
+
+        if format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._zip is None:
+                return pq.read_table(
+                    os.path.join(self.path, member)).to_pandas()
+            return pq.read_table(
+                pa.BufferReader(self._zip.read(member))).to_pandas()
+
+        columns = model.__table__.columns
+        dtypes = dict((c, "category") for c in _categorical_columns(model))
+        dates = []
+        for column in columns:
+            if column.name in dtypes:
+                continue
+            if isinstance(column.type, DateTime):
+                dates.append(column.name)
+            elif isinstance(column.type, Float):
+                dtypes[column.name] = "float64"
+            elif isinstance(column.type, Integer) and not column.nullable:
+                dtypes[column.name] = "int64"
+            elif not isinstance(column.type, (Boolean, Integer)):
+                dtypes[column.name] = "object"
+
+        f = self._open(member)
+        try:
+            if format == "csv.gz":
+                f = io.BufferedReader(_GunzipReader(f), 1 << 20)
+            elif format == "csv.zst":
+                import zstandard
+                f = zstandard.ZstdDecompressor().stream_reader(f)
+            frame = pd.read_csv(f, dtype=dtypes, true_values=["t"],
+                                false_values=["f"], keep_default_na=False,
+                                na_values=[""])
+        finally:
+            f.close()
+
+        # parsing the timestamps afterwards is much quicker than having
+        # read_csv do it.
+        for column in dates:
+            frame[column] = pd.to_datetime(frame[column])
+        return frame
+
+
+class Graph(object):
+    """The structure of an exported experiment as integer arrays.
+
+    Nodes are numbered by their position in :attr:`node_ids`, which is
+    sorted. The vectors are held as a compressed sparse row (CSR) adjacency
+    matrix: the vectors from the node at position ``i`` lead to the nodes at
+    positions ``indices[indptr[i]:indptr[i + 1]]``.
+    """
+
+    def __init__(self, package, network_id=None, failed=False):
+        """Build the graph of a data package."""
+        import numpy as np
+
+        nodes = _select(package.table("node"), network_id, failed)
+        vectors = _select(package.table("vector"), network_id, failed)
+        transmissions = _select(package.table("transmission"), network_id,
+                                failed)
+
+        order = np.argsort(nodes["id"].values, kind="mergesort")
+        #: the ids of the nodes, sorted.
+        self.node_ids = nodes["id"].values[order].astype(np.int64)
+        #: the type of every node.
+        self.node_types = nodes["type"].values[order]
+        #: the id of the network of every node.
+        self.network_ids = nodes["network_id"].values[order].astype(np.int64)
+
+        origins, destinations, keep = self._positions(
+            vectors["origin_id"].values, vectors["destination_id"].values)
+        order = np.lexsort((vectors["id"].values[keep], origins))
+        #: the positions of the nodes every vector leads to, grouped by origin.
+        self.indices = destinations[order]
+        #: the ids of the vectors in the same order as :attr:`indices`.
+        self.vector_ids = vectors["id"].values[keep][order].astype(np.int64)
+        #: where the vectors from each node start in :attr:`indices`.
+        self.indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(origins,
+                                        minlength=len(self.node_ids)))])\
+            .astype(np.int64)
+
+        origins, destinations, keep = self._positions(
+            transmissions["origin_id"].values,
+            transmissions["destination_id"].values)
+        order = np.argsort(transmissions["id"].values[keep], kind="mergesort")
+        #: the positions of the origins of the transmissions, in order of id.
+        self.transmission_origins = origins[order]
+        #: the positions of the destinations of the transmissions.
+        self.transmission_destinations = destinations[order]
+        #: the ids of the infos the transmissions carried.
+        self.transmission_info_ids = transmissions["info_id"]\
+            .values[keep][order].astype(np.int64)
+        #: the ids of the transmissions.
+        self.transmission_ids = transmissions["id"]\
+            .values[keep][order].astype(np.int64)
+
+    def _positions(self, origin_ids, destination_ids):
+        """The positions of the endpoints of edges between included nodes.
+
+        Return the origin and destination positions of the edges whose
+        endpoints are both included, and a mask selecting those edges.
+        """
+        import numpy as np
+
+        keep = np.ones(len(origin_ids), dtype=bool)
+        positions = []
+        for ids in [origin_ids, destination_ids]:
+            ids = ids.astype(np.int64)
+            p = np.searchsorted(self.node_ids, ids)
+            found = p < len(self.node_ids)
+            found[found] = self.node_ids[p[found]] == ids[found]
+            keep &= found
+            positions.append(p)
+        return positions[0][keep], positions[1][keep], keep
+
+
+class _GunzipReader(io.RawIOBase):
+    """Decompress a gzipped file as it is read.
+
+    The files in a zip cannot be seeked, which :class:`gzip.GzipFile` needs
+    to do.
+    """
+
+    chunk_size = 1 << 16
+
+    def __init__(self, f):
+        self.f = f
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            chunk = self.f.read(self.chunk_size)
+            if not chunk:
+                self.buffer = self.decompressor.flush()
+                if not self.buffer:
+                    return 0
+                break
+            self.buffer = self.decompressor.decompress(chunk)
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+    def close(self):
+        self.f.close()
+        super(_GunzipReader, self).close()
+
+
+def _select(frame, network_id, failed):
+    """The rows of a table in a network that have the given failed status."""
+    mask = True
+    if network_id is not None:
+        mask = frame["network_id"] == network_id
+    if failed != "all":
+        mask = mask & (frame["failed"] == failed)
+    return frame if mask is True else frame[mask]
+
+
+def _categorical_columns(model):
+    """The columns of a model that hold one of a few values."""
+    return [c.name for c in model.__table__.columns
+            if c.name == "type" or isinstance(c.type, Enum)]
+
+
+def _decode_hybrid_properties(model, frame):
+    """Add a column for each hybrid property of the model's classes.
+
+    Hybrid properties whose expression is a column, or a column cast to
+    another type, are decoded for the rows of the class defining them and
+    its subclasses.
+    """
+    import pandas as pd
+
+    polymorphic_map = model.__mapper__.polymorphic_map
+    for cls in set(m.class_ for m in polymorphic_map.values()):
+        identities = [identity for identity, m in polymorphic_map.items()
+                      if issubclass(m.class_, cls)]
+        rows = frame["type"].isin(identities)
+        if not rows.any():
+            continue
+
+        for key, descriptor in inspect(cls).all_orm_descriptors.items():
+            if descriptor.extension_type is not HYBRID_PROPERTY or \
+                    key not in vars(cls) or key in model.__table__.columns:
+                continue
+            source = _hybrid_source(getattr(cls, key))
+            if source is None or source[0] not in frame.columns:
+                continue
+
+            column, type = source
+            values = frame.loc[rows, column]
+            if isinstance(type, (Integer, Float)):
+                values = pd.to_numeric(values, errors="coerce")
+            elif isinstance(type, Boolean) and values.dtype != bool:
+                values = values.map(
+                    dict([(v, True) for v in TRUE_VALUES] +
+                         [(v, False) for v in FALSE_VALUES] +
+                         [(True, True), (False, False)]))
+            if key in frame.columns:
+                frame.loc[rows, key] = values
+            else:
+                frame[key] = values.reindex(frame.index)
+
+
+def _hybrid_source(expression):
+    """The column a hybrid property's expression reads and its type."""
+    if isinstance(expression, Cast):
+        name = getattr(expression.clause, "name", None)
+        return None if name is None else (name, expression.type)
+    prop = getattr(expression, "property", None)
+    columns = getattr(prop, "columns", None)
+    if columns and len(columns) == 1:
+        return columns[0].name, columns[0].type
+    return None
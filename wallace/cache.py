@@ -0,0 +1,164 @@
+"""Cache the responses of routes that are read far more than they change.
+
+Responses are kept in Redis under a key made from the route and its
+arguments, and are tagged with the networks, nodes and infos they were made
+from. The ids of the networks, nodes and infos that each flush creates,
+changes or deletes are collected by a SQLAlchemy ``after_flush`` listener,
+and once the transaction is committed the responses tagged with any of them,
+or with the rows inserted by :func:`~wallace.models.bulk_insert`, are
+deleted, so no response outlives a change to the rows it was made from.
+
+:func:`~wallace.models.fail_nodes` fails rows without loading them, so
+flushes do not see the rows it fails. It always changes the networks of the
+failed nodes, though, so responses are also tagged with their network.
+Responses that could still be missed by this (e.g. after rows are changed
+outside of the session) expire after :data:`EXPIRY` seconds, while those
+made from rows that never change, like the contents of an info that has not
+failed, are kept until they are invalidated.
+
+A route may read its rows just before a change to them is committed and
+invalidated, and cache its response just after. To catch this, every
+invalidation increments a generation counter, which is read before the
+route runs and checked once its response is cached: if it has changed, the
+response is deleted again.
+"""
+
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event
+
+from wallace import db, models
+
+#: the prefix of the Redis keys of cached responses and their tags.
+PREFIX = "wallace:cache:"
+
+#: how long responses that may change are kept for, in seconds.
+EXPIRY = 300
+
+#: the key of the number of invalidations so far.
+GENERATION = PREFIX + "generation"
+
+
+class ResponseCache(object):
+    """Responses kept in Redis and tagged with the rows they were made from.
+
+    ``conn`` is a Redis connection, e.g. ``worker.conn``. Redis errors are
+    logged rather than raised, so if Redis is unavailable requests are
+    served without the cache.
+    """
+
+    def __init__(self, conn, expiry=EXPIRY):
+        """Create a cache on a Redis connection."""
+        self.conn = conn
+        self.expiry = expiry
+
+    def key(self, route, args):
+        """The key of the response to a route with the given arguments."""
+        return "{}response:{}?{}".format(PREFIX, route, "&".join(
+            "{}={}".format(name, args[name]) for name in sorted(args)))
+
+    def get(self, key):
+        """The cached response with the given key, or None."""
+        try:
+            return self.conn.get(key)
+        except Exception:
+            db.logger.exception("Could not read {} from the cache".format(key))
+            return None
+
+    def generation(self):
+        """The number of invalidations so far, or None if it is unknown."""
+        try:
+            return int(self.conn.get(GENERATION) or 0)
+        except Exception:
+            db.logger.exception("Could not read the cache generation")
+            return None
+
+    def set(self, key, response, tags, expire=True, generation=None):
+        """Cache a response, tagged with (table, id) tuples.
+
+        The response expires after :attr:`expiry` seconds unless ``expire``
+        is False. If ``generation`` is given, it should be the
+        :func:`generation` read before the response was made. If there have
+        been invalidations since, the response may be out of date and is
+        deleted again.
+        """
+        try:
+            pipeline = self.conn.pipeline()
+            if expire:
+                pipeline.setex(key, self.expiry, response)
+            else:
+                pipeline.set(key, response)
+            for tag in tags:
+                pipeline.sadd(tag_key(*tag), key)
+            pipeline.execute()
+            # invalidate() increments the generation before deleting, so
+            # either it sees this response or this sees its increment.
+            if generation is not None and self.generation() != generation:
+                self.conn.delete(key)
+        except Exception:
+            db.logger.exception("Could not cache {}".format(key))
+
+    def invalidate(self, tags):
+        """Delete the responses tagged with any of the (table, id) tuples."""
+        try:
+            tag_keys = [tag_key(*tag) for tag in tags]
+            if tag_keys:
+                self.conn.incr(GENERATION)
+                keys = list(self.conn.sunion(tag_keys))
+                self.conn.delete(*(keys + tag_keys))
+        except Exception:
+            db.logger.exception("Could not invalidate cached responses")
+
+
+def tag_key(table, id):
+    """The key of the set of responses made from a row."""
+    return "{}tag:{}:{}".format(PREFIX, table, id)
+
+
+def tags(obj):
+    """The tags of the responses that change when an object changes."""
+    if isinstance(obj, models.Network):
+        return [("network", obj.id)]
+    if isinstance(obj, models.Node):
+        return [("node", obj.id), ("network", obj.network_id)]
+    if isinstance(obj, models.Vector):
+        return [("node", obj.origin_id), ("node", obj.destination_id)]
+    if isinstance(obj, models.Info):
+        return [("info", obj.id), ("node", obj.origin_id)]
+    if isinstance(obj, models.Transmission):
+        # who an info has been received by decides who can get it.
+        return [("node", obj.destination_id)]
+    return []
+
+
+def invalidate_on_commit(session, cache):
+    """Invalidate the responses made from the rows a session changes.
+
+    ``session`` is the session (or scoped session) the web server uses.
+    """
+    changed = WeakKeyDictionary()
+
+    @event.listens_for(session, "after_flush")
+    def collect_changed_tags(flush_session, flush_context):
+        """Remember the rows changed in a flush."""
+        found = set()
+        for obj in list(flush_session.new) + list(flush_session.dirty) + \
+                list(flush_session.deleted):
+            found.update(tags(obj))
+        if found:
+            changed.setdefault(flush_session, set()).update(found)
+
+    @event.listens_for(session, "after_commit")
+    def invalidate_changed_tags(committed_session):
+        """Invalidate the responses made from the rows once committed."""
+        found = changed.pop(committed_session, set())
+        # rows inserted in bulk are not seen by the flushes.
+        for obj in models.bulk_inserted(committed_session):
+            found.update(tags(obj))
+        if found:
+            cache.invalidate(found)
+
+    @event.listens_for(session, "after_rollback")
+    def forget_changed_tags(rolled_back_session):
+        """Forget the changes of a transaction that was rolled back."""
+        changed.pop(rolled_back_session, None)
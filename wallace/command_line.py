@@ -17,7 +17,8 @@ import imp
 import pkg_resources
 import re
 import psycopg2
-from wallace import db
+from sqlalchemy import create_engine
+from wallace import data, db
 from wallace.version import __version__
 import requests
 import boto
@@ -721,7 +722,12 @@ def awaken(app, databaseurl):
 @click.option('--app', default=None, help='ID of the deployed experiment')
 @click.option('--local', is_flag=True, flag_value=True,
               help='Export local data')
-def export(app, local):
+@click.option('--format', default="csv",
+              type=click.Choice(sorted(data.FORMATS)),
+              help='Format of the exported tables')
+@click.option('--incremental', is_flag=True, flag_value=True,
+              help='Only export rows created or failed since the last export')
+def export(app, local, format, incremental):
     """Export the data."""
     print_header()
 
@@ -731,8 +737,14 @@ def export(app, local):
 
     subdata_path = os.path.join("data", id, "data")
 
-    # Create the data package
-    os.makedirs(subdata_path)
+    # Create the data package, or keep adding to it if exporting
+    # incrementally. A full export replaces the package, watermarks and all.
+    if incremental and os.path.exists(subdata_path):
+        log("Adding to the existing data package...")
+    else:
+        if os.path.exists(os.path.join("data", id)):
+            shutil.rmtree(os.path.join("data", id))
+        os.makedirs(subdata_path)
 
     # Copy the experiment code into a code/ subdirectory
     try:
@@ -748,9 +760,10 @@ def export(app, local):
     # open(os.path.join(id, "README.txt"), "a").close()
 
     # Save the experiment id.
-    with open(os.path.join("data", id, "experiment_id.md"), "a+") as file:
+    with open(os.path.join("data", id, "experiment_id.md"), "w") as file:
         file.write(id)
 
+    engine = None
     if not local:
         # Export the logs
         subprocess.call(
@@ -759,6 +772,14 @@ def export(app, local):
             " --app " + id,
             shell=True)
 
+    if not local and incremental:
+        # Read the new rows straight from the app's production database,
+        # over connections that cannot write to it.
+        database_url = subprocess.check_output(
+            "heroku config:get DATABASE_URL --app " + id, shell=True)
+        engine = create_engine(database_url.strip(), connect_args={
+            "options": "-c default_transaction_read_only=on"})
+    elif not local:
         dump_path = dump_database(id)
 
         subprocess.call(
@@ -766,35 +787,20 @@ def export(app, local):
             os.path.join("data", id) + "/data.dump",
             shell=True)
 
-    all_tables = [
-        "node",
-        "network",
-        "vector",
-        "info",
-        "transformation",
-        "transmission",
-        "participant",
-        "notification",
-        "question"
-    ]
-
-    for table in all_tables:
-        subprocess.call(
-            "psql -d wallace --command=\"\\copy " + table + " to \'" +
-            os.path.join(subdata_path, table) + ".csv\' csv header\"",
-            shell=True)
+    log("Exporting the tables...")
+    try:
+        data.export_tables(subdata_path, format=format,
+                           incremental=incremental, engine=engine)
+    finally:
+        if engine is not None:
+            engine.dispose()
 
-    if not local:
+    if not local and not incremental:
         os.remove(dump_path)
 
     log("Zipping up the package...")
-    shutil.make_archive(
-        os.path.join("data", id + "-data"),
-        "zip",
-        os.path.join("data", id)
-    )
-
-    shutil.rmtree(os.path.join("data", id))
+    data.archive(os.path.join("data", id),
+                 os.path.join("data", id + "-data.zip"))
 
     log("Done. Data available in " + str(id) + ".zip")
 
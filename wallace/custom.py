@@ -2,6 +2,8 @@
 
 from flask import (
     Blueprint,
+    current_app,
+    g,
     request,
     Response,
     send_from_directory,
@@ -13,21 +15,26 @@ from psiturk.user_utils import PsiTurkAuthorization
 from psiturk.db import init_db
 from psiturk.db import db_session as session_psiturk
 
-from wallace import db, models
+from wallace import cache, db, metrics, models
+from wallace.experiments import Experiment
 
+from functools import wraps
 import imp
 import inspect
 import logging
 from operator import attrgetter
-from json import dumps
+from json import dumps, loads
 import os
 import requests
 import traceback
 from datetime import datetime
+import time
+from weakref import WeakKeyDictionary
 
 from rq import Queue, get_current_job
 from worker import conn
 
+from sqlalchemy import event
 from sqlalchemy.orm.exc import NoResultFound
 
 # Load the configuration options.
@@ -180,13 +187,259 @@ def error_page(participant=None, error_text=None, compensate=True,
 @custom_code.teardown_request
 def shutdown_session(_=None):
     """Rollback and close session at end of a request."""
+    if getattr(g, "batch", False):
+        # the operations of a batch share the batch request's session.
+        return
     session.remove()
     db.logger.debug('Closing Wallace DB session at flask request end')
 
 
+@custom_code.before_request
+def start_request_metrics():
+    """Start timing the request and counting its SQL statements."""
+    metrics.start_request()
+
+
+# after_request functions run in the reverse of the order they are
+# registered in, so this records the request after it has been committed.
+@custom_code.after_request
+def record_request_metrics(response):
+    """Record the request's latency, status and SQL statements."""
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.finish_request(rule, request.method, response.status_code)
+    return response
+
+
+@custom_code.teardown_request
+def record_failed_request_metrics(exception=None):
+    """Record a request that raised an exception as a 500.
+
+    Flask skips the after_request functions of requests that raise, so
+    they are recorded here instead. Requests that have already been
+    recorded are not recorded again.
+    """
+    if getattr(g, "batch", False):
+        # the operations of a batch are part of the batch request.
+        return
+    rule = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.finish_request(rule, request.method, 500)
+
+
+@custom_code.after_request
+def commit_session(response):
+    """Commit the session if the request succeeded, otherwise roll it back.
+
+    Routes only flush the session, so that everything a request does,
+    including the experiment's request hooks, is committed once or not at
+    all. Anything a route adds to psiTurk's session is committed only once
+    Wallace's session has been, so it is not left behind if that fails.
+    """
+    if getattr(g, "batch", False):
+        # a batch is committed, or rolled back, as a whole.
+        return response
+    if response.status_code < 400:
+        try:
+            session.commit()
+        except:
+            session.rollback()
+            session_psiturk.rollback()
+            return error_response(error_type="Commit failed")
+        session_psiturk.commit()
+    else:
+        session.rollback()
+        session_psiturk.rollback()
+    return response
+
+
+"""Announce new transmissions to the nodes waiting for them."""
+
+# the ids of the destinations of the transmissions each session has flushed
+# but not yet committed.
+new_transmission_destinations = WeakKeyDictionary()
+
+
+def transmissions_channel(node_id):
+    """The Redis channel on which new transmissions to a node are announced."""
+    return "wallace:transmissions:{}".format(node_id)
+
+
+@event.listens_for(session, "after_flush")
+def collect_new_transmissions(flush_session, flush_context):
+    """Remember who the transmissions in a flush are being sent to."""
+    destinations = [obj.destination_id for obj in flush_session.new
+                    if isinstance(obj, models.Transmission)]
+    if destinations:
+        new_transmission_destinations.setdefault(
+            flush_session, set()).update(destinations)
+
+
+@event.listens_for(session, "after_commit")
+def announce_new_transmissions(committed_session):
+    """Tell the nodes that have been sent transmissions once they exist."""
+    destinations = new_transmission_destinations.pop(committed_session, set())
+    # transmissions inserted in bulk are not seen by the flushes.
+    destinations.update(t.destination_id
+                        for t in models.bulk_inserted(committed_session)
+                        if isinstance(t, models.Transmission))
+    for node_id in destinations:
+        try:
+            conn.publish(transmissions_channel(node_id), "pending")
+        except Exception:
+            db.logger.exception("Could not announce transmissions to node {}"
+                                .format(node_id))
+
+
+@event.listens_for(session, "after_rollback")
+def forget_new_transmissions(rolled_back_session):
+    """Forget the transmissions of a transaction that was rolled back."""
+    new_transmission_destinations.pop(rolled_back_session, None)
+
+
+"""Cache the responses of routes that are read far more than they change."""
+
+# responses are only cached if the cache is turned on in the config.
+response_cache = None
+if config.has_option("Server Parameters", "response_cache") and \
+        config.getboolean("Server Parameters", "response_cache"):
+    response_cache = cache.ResponseCache(conn)
+    cache.invalidate_on_commit(session, response_cache)
+
+
+def cached(hook=None):
+    """Serve a route from the response cache when possible.
+
+    ``hook`` is the name of the experiment's request hook that the route
+    runs. A cached response skips the route and so its hook, so responses
+    are not cached if the experiment overrides the hook. They are not used
+    within batches either, as the earlier operations of a batch may have
+    made changes that are yet to be committed. A route chooses to have its
+    response cached by calling :func:`cacheable`.
+    """
+    def decorator(route):
+        @wraps(route)
+        def cached_route(**kwargs):
+            if (response_cache is None or getattr(g, "batch", False) or
+                    (hook is not None and
+                     getattr(experiment, hook).__func__ is not
+                     getattr(Experiment, hook).__func__)):
+                return route(**kwargs)
+
+            key = response_cache.key(request.path, request.args.to_dict())
+            data = response_cache.get(key)
+            if data is not None:
+                return Response(data, status=200,
+                                mimetype='application/json')
+
+            # read before the route, so that changes committed while it
+            # runs keep its response out of the cache.
+            generation = response_cache.generation()
+            g.cache_tags = None
+            response = route(**kwargs)
+            if (response.status_code == 200 and g.cache_tags is not None and
+                    generation is not None):
+                tags, expire = g.cache_tags
+                response_cache.set(key, response.get_data(), tags, expire,
+                                   generation=generation)
+            return response
+        return cached_route
+    return decorator
+
+
+def cacheable(expire=True, network=None, node=None, info=None):
+    """Cache the response of the current route.
+
+    The response is tagged with the ids of the network, node and info it was
+    made from, so that it is invalidated when they change. If ``expire`` is
+    False it is kept until then, otherwise it also expires after a while.
+    """
+    tags = [(table, id) for table, id in [("network", network),
+                                          ("node", node),
+                                          ("info", info)]
+            if id is not None]
+    g.cache_tags = (tags, expire)
+
+
 """Define routes for managing an experiment and the participants."""
 
 
+@custom_code.route("/batch", methods=["POST"])
+def batch():
+    """Run several requests in a single transaction.
+
+    The requests are passed as ``operations``, a JSON list of objects each
+    with a ``url``, a ``method`` (default "get") and any ``data`` for the
+    request. They are run in order through the usual routes, sharing a
+    single transaction that is committed once they have all succeeded, and
+    their responses are returned in order as ``results``. If any of them
+    fails, everything is rolled back and its error response is returned,
+    with the position of the failed operation as ``index``.
+
+    For example, to create an info and then transmit it:
+    reqwest({
+        url: "/batch",
+        method: "post",
+        type: "json",
+        data: {
+            operations: JSON.stringify([
+                {url: "/info/" + my_node_id, method: "post",
+                 data: {contents: "hello"}},
+                {url: "/node/" + my_node_id + "/transmit", method: "post"}
+            ])
+        }
+    });
+    """
+    operations = request_parameter(parameter="operations")
+    if type(operations) == Response:
+        return operations
+    try:
+        operations = loads(operations)
+        assert isinstance(operations, list)
+    except (ValueError, AssertionError):
+        return error_response(error_type="/batch POST, invalid operations")
+
+    results = []
+    g.batch = True
+    try:
+        for index, operation in enumerate(operations):
+            url = operation["url"]
+            method = operation.get("method", "get").upper()
+            data = operation.get("data", {})
+            if url.split("?")[0].rstrip("/") == "/batch":
+                raise ValueError("Batches cannot be nested.")
+
+            if method == "GET":
+                context = current_app.test_request_context(
+                    url, method=method, query_string=data)
+            else:
+                context = current_app.test_request_context(
+                    url, method=method, data=data)
+            with context:
+                response = current_app.make_response(
+                    current_app.dispatch_request())
+
+            result = loads(response.get_data())
+            if response.status_code >= 400:
+                result["index"] = index
+                return Response(dumps(result), status=response.status_code,
+                                mimetype='application/json')
+            results.append(result)
+    except:
+        return error_response(error_type="/batch POST, server error")
+    finally:
+        g.batch = False
+
+    return success_response(field="results",
+                            data=results,
+                            request_type="batch")
+
+
+@custom_code.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Return the request metrics of this process in Prometheus format."""
+    return Response(metrics.registry.render(), status=200,
+                    mimetype='text/plain; version=0.0.4')
+
+
 @custom_code.route('/robots.txt')
 def static_from_root():
     """"Serve robots.txt from static file."""
@@ -375,8 +628,6 @@ def assign_properties(thing):
         if property:
             setattr(thing, property_name, property)
 
-    session.commit()
-
 
 @custom_code.route("/participant/<worker_id>/<hit_id>/<assignment_id>/<mode>",
                    methods=["POST"])
@@ -399,7 +650,7 @@ def create_participant(worker_id, hit_id, assignment_id, mode):
                                      hit_id=hit_id,
                                      mode=mode)
     session.add(participant)
-    session.commit()
+    session.flush()
 
     # make a psiturk participant too, for now
     from psiturk.models import Participant as PsiturkParticipant
@@ -407,7 +658,6 @@ def create_participant(worker_id, hit_id, assignment_id, mode):
                                              assignmentid=assignment_id,
                                              hitid=hit_id)
     session_psiturk.add(psiturk_participant)
-    session_psiturk.commit()
 
     # return the data
     return success_response(field="participant",
@@ -432,6 +682,7 @@ def get_participant(participant_id):
 
 
 @custom_code.route("/network/<network_id>", methods=["GET"])
+@cached()
 def get_network(network_id):
     """Get the network with the given id."""
     try:
@@ -442,6 +693,7 @@ def get_network(network_id):
             status=403)
 
     # return the data
+    cacheable(network=net.id)
     return success_response(field="network",
                             data=net.__json__(),
                             request_type="network get")
@@ -481,7 +733,7 @@ def create_question(participant_id):
         # execute the request
         models.Question(participant=ppt, question=question,
                         response=response, number=number)
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/question POST server error",
                               status=403)
@@ -536,7 +788,7 @@ def node_neighbors(node_id):
         exp.node_get_request(
             node=node,
             nodes=nodes)
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="exp.node_get_request")
 
@@ -591,11 +843,11 @@ def create_node(participant_id):
             node=node,
             network=network)
 
-        session.commit()
+        session.flush()
 
         # ping the experiment
         exp.node_post_request(participant=participant, node=node)
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/node POST server error",
                               status=403,
@@ -608,6 +860,7 @@ def create_node(participant_id):
 
 
 @custom_code.route("/node/<int:node_id>/vectors", methods=["GET"])
+@cached("vector_get_request")
 def node_vectors(node_id):
     """Get the vectors of a node.
 
@@ -632,13 +885,14 @@ def node_vectors(node_id):
     try:
         vectors = node.vectors(direction=direction, failed=failed)
         exp.vector_get_request(node=node, vectors=vectors)
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/node/vectors GET server error",
                               status=403,
                               participant=node.participant)
 
     # return the data
+    cacheable(network=node.network_id, node=node.id)
     return success_response(field="vectors",
                             data=[v.__json__() for v in vectors],
                             request_type="vector get")
@@ -681,7 +935,7 @@ def connect(node_id, other_node_id):
             node=node,
             vectors=vectors)
 
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/vector POST server error",
                               status=403,
@@ -693,6 +947,7 @@ def connect(node_id, other_node_id):
 
 
 @custom_code.route("/info/<int:node_id>/<int:info_id>", methods=["GET"])
+@cached("info_get_request")
 def get_info(node_id, info_id):
     """Get a specific info.
 
@@ -721,19 +976,24 @@ def get_info(node_id, info_id):
     try:
         # ping the experiment
         exp.info_get_request(node=node, infos=info)
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/info GET server error",
                               status=403,
                               participant=node.participant)
 
     # return the data
+    # the contents of an info never change, so unless it fails the response
+    # is kept until it is invalidated.
+    cacheable(expire=info.failed, network=node.network_id, node=node.id,
+              info=info.id)
     return success_response(field="info",
                             data=info.__json__(),
                             request_type="info get")
 
 
 @custom_code.route("/node/<int:node_id>/infos", methods=["GET"])
+@cached("info_get_request")
 def node_infos(node_id):
     """Get all the infos of a node.
 
@@ -763,12 +1023,13 @@ def node_infos(node_id):
             node=node,
             infos=infos)
 
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/node/infos GET server error",
                               status=403,
                               participant=node.participant)
 
+    cacheable(network=node.network_id, node=node.id)
     return success_response(field="infos",
                             data=[i.__json__() for i in infos],
                             request_type="infos")
@@ -804,7 +1065,7 @@ def node_received_infos(node_id):
             node=node,
             infos=infos)
 
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="info_get_request error",
                               status=403,
@@ -852,7 +1113,7 @@ def info_post(node_id):
             node=node,
             info=info)
 
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/info POST server error",
                               status=403,
@@ -887,16 +1148,72 @@ def node_transmissions(node_id):
         return error_response(
             error_type="/node/transmissions, node does not exist")
 
+    return transmissions_response(exp, node, direction, status)
+
+
+@custom_code.route("/node/<int:node_id>/transmissions/wait", methods=["GET"])
+def node_transmissions_wait(node_id):
+    """Wait for a node to be sent a transmission.
+
+    The node id must be specified in the url. This is a long-poll version of
+    GET /node/<node_id>/transmissions with status pending: rather than
+    returning at once it waits until the node has pending transmissions,
+    or until timeout seconds (default 30, at most 60) have passed, and then
+    receives and returns them. The list is empty if the wait timed out. New
+    transmissions are announced over Redis when they are committed, so no
+    database queries are made while waiting.
+
+    Each waiting request holds a server worker for as long as it waits, so
+    the server should be run with enough (or asynchronous) workers for all
+    the participants who wait at once.
+    """
+    exp = experiment(session)
+
+    timeout = request_parameter(parameter="timeout", parameter_type="int",
+                                default=30)
+    if type(timeout) == Response:
+        return timeout
+    timeout = min(max(timeout, 0), 60)
+
+    # check the node exists
+    node = models.Node.query.get(node_id)
+    if node is None:
+        return error_response(
+            error_type="/node/transmissions/wait, node does not exist")
+
+    # subscribe before looking, so that nothing sent in between is missed.
+    pubsub = conn.pubsub()
+    pubsub.subscribe(transmissions_channel(node_id))
+    try:
+        pending = node.transmissions(direction="incoming", status="pending")
+        if not pending and not getattr(g, "batch", False):
+            # end the transaction, which has only read, so that no database
+            # connection is held while waiting.
+            session.rollback()
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                message = pubsub.get_message(ignore_subscribe_messages=True,
+                                             timeout=deadline - time.time())
+                if message is not None:
+                    break
+    finally:
+        pubsub.close()
+
+    return transmissions_response(exp, node, "incoming", "pending")
+
+
+def transmissions_response(exp, node, direction, status):
+    """Get, receive and return the transmissions of a node."""
     # execute the request
     transmissions = node.transmissions(direction=direction, status=status)
 
     try:
         if direction in ["incoming", "all"] and status in ["pending", "all"]:
             node.receive()
-            session.commit()
+            session.flush()
         # ping the experiment
         exp.transmission_get_request(node=node, transmissions=transmissions)
-        session.commit()
+        session.flush()
     except:
         return error_response(
             error_type="/node/transmissions GET server error",
@@ -990,12 +1307,12 @@ def node_transmit(node_id):
         transmissions = node.transmit(what=what, to_whom=to_whom)
         for t in transmissions:
             assign_properties(t)
-        session.commit()
+        session.flush()
         # ping the experiment
         exp.transmission_post_request(
             node=node,
             transmissions=transmissions)
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/node/transmit POST, server error",
                               participant=node.participant)
@@ -1036,7 +1353,7 @@ def transformation_get(node_id):
         # ping the experiment
         exp.transformation_get_request(node=node,
                                        transformations=transformations)
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/node/tranaformations GET failed",
                               participant=node.participant)
@@ -1088,12 +1405,12 @@ def transformation_post(node_id, info_in_id, info_out_id):
         transformation = transformation_type(info_in=info_in,
                                              info_out=info_out)
         assign_properties(transformation)
-        session.commit()
+        session.flush()
 
         # ping the experiment
         exp.transformation_post_request(node=node,
                                         transformation=transformation)
-        session.commit()
+        session.flush()
     except:
         return error_response(error_type="/tranaformation POST failed",
                               participant=node.participant)
@@ -0,0 +1,341 @@
+"""Export the tables of the database to files.
+
+Every table is copied over its own database connection, in parallel, with
+``COPY ... TO STDOUT`` and streamed straight into a file, so whole tables
+are never held in memory. All of the connections share a snapshot of the
+database, so the tables are consistent with one another even if the
+experiment is still running.
+
+Tables can be written as CSV (the default), gzipped CSV, zstandard
+compressed CSV or Parquet. The zstandard and Parquet formats need the
+``zstandard`` and ``pyarrow`` packages, which are not needed by the rest of
+Wallace.
+
+Every export records watermarks, the largest ``id`` and ``time_of_death``
+in each table, in a ``watermarks.json`` file next to the tables. An
+incremental export only copies the rows beyond the watermarks, which are
+the rows that have been created or failed since the last export, into
+numbered delta files. :func:`load_table` merges a table with its deltas.
+"""
+
+from contextlib import contextmanager
+import csv
+import gzip
+import io
+import json
+from multiprocessing.pool import ThreadPool
+import os
+import zipfile
+
+from sqlalchemy import Boolean, DateTime, Float, Integer
+
+from wallace import db, models
+
+#: the tables that are exported.
+TABLES = [
+    "node",
+    "network",
+    "vector",
+    "info",
+    "transformation",
+    "transmission",
+    "participant",
+    "notification",
+    "question"
+]
+
+#: the formats tables can be exported in, mapped to their file extensions.
+FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "csv.zst": ".csv.zst",
+    "parquet": ".parquet"
+}
+
+#: the number of rows in each row group of a Parquet file.
+PARQUET_ROW_GROUP_SIZE = 100000
+
+#: the columns whose largest values are recorded as a table's watermarks.
+#: Rows with a larger value in any of them are copied by incremental
+#: exports. Tables not listed use ``id`` and ``time_of_death``. Networks are
+#: updated as nodes are added to them, and there are few of them, so they
+#: are copied in full every time.
+WATERMARKS = {
+    "network": [],
+    "participant": ["id", "time_of_death", "end_time"],
+    "transmission": ["id", "time_of_death", "receive_time"]
+}
+
+#: the name of the file the watermarks are kept in.
+WATERMARKS_FILE = "watermarks.json"
+
+
+def export_tables(path, tables=None, format="csv", workers=None,
+                  incremental=False, engine=None):
+    """Export tables from the database into a directory.
+
+    ``tables`` defaults to :data:`TABLES` and ``format`` is one of the keys
+    of :data:`FORMATS`. Each table is written to a file named after it by
+    one of ``workers`` threads, by default one per table. The tables are read
+    through ``engine``, which defaults to :data:`wallace.db.engine`.
+
+    If ``incremental`` is True and the directory holds the watermarks of an
+    earlier export, only rows created or failed since then are copied, into
+    delta files named like ``info.delta-0001.csv``. Rows that are changed
+    in other ways, or that are committed out of ``id`` order around the time
+    of an export, are missed, so a full export should be run at the end of
+    an experiment.
+
+    Return the paths of the files written.
+    """
+    if tables is None:
+        tables = TABLES
+    if format not in FORMATS:
+        raise ValueError("{} is not a valid export format".format(format))
+    if engine is None:
+        engine = db.engine
+    if not tables:
+        return []
+
+    watermarks = read_watermarks(path) if incremental else None
+    if watermarks is None:
+        watermarks = {"deltas": 0, "tables": {}}
+        delta = 0
+    else:
+        delta = watermarks["deltas"] + 1
+
+    # hold a snapshot open until every table has been copied from it.
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, "
+                       "READ ONLY")
+        cursor.execute("SELECT pg_export_snapshot()")
+        snapshot = cursor.fetchone()[0]
+
+        def export(table):
+            since = None
+            if delta:
+                # tables that were not in the last export are copied in full
+                since = watermarks["tables"].get(table, {})
+            filename = os.path.join(path, _filename(table, format, delta))
+            return filename, export_table(table, filename, format,
+                                          snapshot, since, engine)
+
+        pool = ThreadPool(workers or len(tables))
+        try:
+            results = pool.map(export, tables)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        connection.rollback()
+        connection.close()
+
+    watermarks["deltas"] = delta
+    for table, (_, marks) in zip(tables, results):
+        watermarks["tables"][table] = marks
+    with open(os.path.join(path, WATERMARKS_FILE), "w") as f:
+        json.dump(watermarks, f, indent=2, sort_keys=True)
+
+    return [filename for filename, _ in results]
+
+
+def export_table(table, filename, format="csv", snapshot=None,
+                 since=None, engine=None):
+    """Export a table from the database into a file.
+
+    If ``snapshot`` is given, the table is read from that exported snapshot
+    (see :func:`export_tables`). If ``since`` is given, only the rows beyond
+    those watermarks are exported. Return the table's new watermarks.
+    """
+    if format not in FORMATS:
+        raise ValueError("{} is not a valid export format".format(format))
+    if engine is None:
+        engine = db.engine
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, "
+                       "READ ONLY")
+        if snapshot is not None:
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+
+        columns = WATERMARKS.get(table, ["id", "time_of_death"])
+        marks = {}
+        if columns:
+            cursor.execute("SELECT {} FROM {}".format(
+                ", ".join("max({})".format(_quote(c)) for c in columns),
+                _quote(table)))
+            for column, value in zip(columns, cursor.fetchone()):
+                if hasattr(value, "isoformat"):
+                    value = value.isoformat()
+                marks[column] = value
+
+        query = "SELECT * FROM {}".format(_quote(table))
+        if since is not None and columns:
+            query += " WHERE " + " OR ".join(
+                _beyond(cursor, column, since.get(column))
+                for column in columns)
+
+        if format == "parquet":
+            _write_parquet(connection, table, query, filename)
+        else:
+            with _open(filename, format) as f:
+                cursor.copy_expert(
+                    "COPY ({}) TO STDOUT WITH CSV HEADER".format(query), f)
+        return marks
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def read_watermarks(path):
+    """The watermarks of the last export into a directory, if any."""
+    filename = os.path.join(path, WATERMARKS_FILE)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return json.load(f)
+
+
+def load_table(path, table):
+    """Load an exported table, merged with any incremental exports of it.
+
+    Return a list of rows, as dicts, in order of ``id``. A row that appears
+    in a delta replaces the earlier version of it. When the table was
+    exported as CSV, values are strings, with nulls and empty strings both
+    read as None.
+    """
+    watermarks = read_watermarks(path) or {"deltas": 0}
+    rows = {}
+    for delta in range(watermarks["deltas"] + 1):
+        for row in _read(path, table, delta):
+            rows[int(row["id"])] = row
+    return [rows[i] for i in sorted(rows)]
+
+
+def archive(path, filename):
+    """Zip up a directory.
+
+    Files that are already compressed are stored in the archive as they
+    are rather than being compressed a second time.
+    """
+    compressed = (".gz", ".zst", ".parquet", ".zip")
+    with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED,
+                         allowZip64=True) as z:
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                z.write(full, os.path.relpath(full, path),
+                        zipfile.ZIP_STORED if name.endswith(compressed)
+                        else zipfile.ZIP_DEFLATED)
+    return filename
+
+
+def _filename(table, format, delta=0):
+    """The name of the file a table, or a delta of it, is exported to."""
+    if delta:
+        return "{}.delta-{:04d}{}".format(table, delta, FORMATS[format])
+    return table + FORMATS[format]
+
+
+def _beyond(cursor, column, watermark):
+    """A SQL condition matching values of a column beyond a watermark."""
+    if watermark is None:
+        return "{} IS NOT NULL".format(_quote(column))
+    return cursor.mogrify("{} > %s".format(_quote(column)), (watermark,))
+
+
+def _read(path, table, delta):
+    """Read the rows of an exported table, or of a delta of it."""
+    for format in sorted(FORMATS):
+        filename = os.path.join(path, _filename(table, format, delta))
+        if os.path.exists(filename):
+            break
+    else:
+        return []
+
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        columns = pq.read_table(filename).to_pydict()
+        names = list(columns)
+        return [dict(zip(names, values))
+                for values in zip(*[columns[n] for n in names])]
+
+    with open(filename, "rb") as f:
+        if format == "csv.gz":
+            f = gzip.GzipFile(fileobj=f)
+        elif format == "csv.zst":
+            import zstandard
+            f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f))
+        reader = csv.reader(f)
+        names = next(reader)
+        return [dict((n, v if v != "" else None) for n, v in zip(names, row))
+                for row in reader]
+
+
+@contextmanager
+def _open(filename, format):
+    """Open a file to write a CSV export into."""
+    with open(filename, "wb") as f:
+        if format == "csv":
+            yield f
+        elif format == "csv.gz":
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6) as g:
+                yield g
+        elif format == "csv.zst":
+            import zstandard
+            writer = zstandard.ZstdCompressor().stream_writer(f)
+            yield writer
+            writer.flush(zstandard.FLUSH_FRAME)
+
+
+def _quote(name):
+    """Quote the name of a table or column for use in SQL."""
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _write_parquet(connection, table, query, filename):
+    """Stream the rows of a table into a Parquet file, a row group at a time.
+
+    ``query`` must select all of the columns of the table.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = models.Base.metadata.tables[table].columns
+    schema = pa.schema([pa.field(c.name, _arrow_type(pa, c.type))
+                        for c in columns])
+
+    # a server side cursor, so that rows are fetched as they are needed.
+    cursor = connection.cursor(name="export_{}".format(table))
+    cursor.execute("SELECT {} FROM ({}) AS rows".format(
+        ", ".join(_quote(c.name) for c in columns), query))
+
+    writer = pq.ParquetWriter(filename, schema)
+    try:
+        while True:
+            rows = cursor.fetchmany(PARQUET_ROW_GROUP_SIZE)
+            if not rows:
+                break
+            arrays = [pa.array(list(values), type=field.type)
+                      for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    finally:
+        writer.close()
+        cursor.close()
+
+
+def _arrow_type(pa, column_type):
+    """The Arrow type of a column of a table."""
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
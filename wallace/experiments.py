@@ -1,12 +1,12 @@
 """The base experiment class."""
 
 from wallace.models import Network, Node, Info, Transformation, Participant
+from wallace.models import fail_nodes
 from wallace.information import Gene, Meme, State
 from wallace.nodes import Agent, Source, Environment
 from wallace.transformations import Compression, Response
 from wallace.transformations import Mutation, Replication
-from sqlalchemy import and_
-import random
+from sqlalchemy import and_, case, func
 import sys
 from collections import Counter
 from operator import itemgetter
@@ -114,38 +114,35 @@ class Experiment(object):
         first complete networks with `role="practice"` before doing all other
         networks in a random order.
 
+        The network is chosen with a single query, which locks its row until
+        the end of the transaction so that concurrent requests cannot overfill
+        it. Networks locked by concurrent requests are skipped, so those
+        requests are given different networks rather than waiting in turn
+        for the same one.
         """
         key = participant.id
-        networks_with_space = Network.query.filter_by(full=False).all()
-        networks_participated_in = [
-            node.network_id for node in
-            Node.query.with_entities(Node.network_id)
-                .filter_by(participant_id=participant.id).all()
-        ]
-
-        legal_networks = [
-            net for net in networks_with_space
-            if net.id not in networks_participated_in
-        ]
-
-        if not legal_networks:
+        participated = Node.query\
+            .filter(Node.participant_id == participant.id,
+                    Node.network_id == Network.id)\
+            .exists()
+
+        legal_networks = Network.query\
+            .filter(Network.full == False, ~participated)\
+            .order_by(Network.role != "practice",
+                      case([(Network.role == "practice", Network.id)]),
+                      func.random())
+
+        chosen_network = _first_skip_locked(legal_networks)
+
+        if chosen_network is None:
             self.log("No networks available, returning None", key)
             return None
 
-        self.log("{} networks out of {} available"
-                 .format(len(legal_networks),
-                         (self.practice_repeats + self.experiment_repeats)),
-                 key)
-
-        legal_practice_networks = [net for net in legal_networks
-                                   if net.role == "practice"]
-        if legal_practice_networks:
-            chosen_network = legal_practice_networks[0]
+        if chosen_network.role == "practice":
             self.log("Practice networks available."
                      "Assigning participant to practice network {}."
                      .format(chosen_network.id), key)
         else:
-            chosen_network = random.choice(legal_networks)
             self.log("No practice networks available."
                      "Assigning participant to experiment network {}"
                      .format(chosen_network.id), key)
@@ -294,12 +291,7 @@ class Experiment(object):
 
     def fail_participant(self, participant):
         """Fail all the nodes of a participant."""
-        participant_nodes = Node.query\
-            .filter_by(participant_id=participant.id, failed=False)\
-            .all()
-
-        for node in participant_nodes:
-            node.fail()
+        fail_nodes(Node.participant_id == participant.id)
 
     def data_check_failed(self, participant):
         """What to do if a participant fails the data check.
@@ -339,3 +331,18 @@ class Experiment(object):
 
         """
         self.fail_participant(participant)
+
+
+def _first_skip_locked(query):
+    """Get the first result of a query, locking its row and skipping rows
+    that other transactions have locked.
+
+    SQLAlchemy 0.8 cannot emit ``FOR UPDATE SKIP LOCKED``, so the query is
+    compiled and the clause added to its SQL.
+    """
+    session = query.session
+    compiled = query.limit(1).statement.compile(bind=session.get_bind())
+    result = session.connection().execute(
+        "{} FOR UPDATE SKIP LOCKED".format(compiled), compiled.params)
+    results = list(query.instances(result))
+    return results[0] if results else None
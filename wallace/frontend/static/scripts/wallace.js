@@ -83,3 +83,62 @@ create_participant = function() {
         });
     }
 };
+
+// wait for transmissions to a node, calling callback with each batch of
+// received transmissions, until callback returns false
+wait_for_transmissions = function(node_id, callback) {
+    reqwest({
+        url: "/node/" + node_id + "/transmissions/wait",
+        method: 'get',
+        type: 'json',
+        success: function (resp) {
+            if (resp.transmissions.length === 0 || callback(resp.transmissions) !== false) {
+                wait_for_transmissions(node_id, callback);
+            }
+        },
+        error: function (err) {
+            console.log(err);
+            err_response = JSON.parse(err.response);
+            $('body').html(err_response.html);
+        }
+    });
+};
+
+// requests waiting to be sent together by send_batch
+batch_queue = [];
+
+// add a request to the queue, to be sent with the next batch
+queue_request = function(url, method, data) {
+    batch_queue.push({
+        url: url,
+        method: method === undefined ? "get" : method,
+        data: data === undefined ? {} : data
+    });
+};
+
+// send all the queued requests in a single transaction, calling callback
+// with their responses in order
+send_batch = function(callback) {
+    operations = batch_queue;
+    batch_queue = [];
+    reqwest({
+        url: "/batch",
+        method: 'post',
+        type: 'json',
+        data: {
+            operations: JSON.stringify(operations)
+        },
+        success: function (resp) {
+            if (callback !== undefined) {
+                callback(resp.results);
+            }
+        },
+        error: function (err) {
+            console.log(err);
+            err_response = JSON.parse(err.response);
+            if (err_response.hasOwnProperty('html')) {
+                $('body').html(err_response.html);
+            }
+        }
+    });
+};
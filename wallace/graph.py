@@ -0,0 +1,296 @@
+"""In-memory indexes over the structure of a network."""
+
+from collections import defaultdict
+
+from .sampling import FenwickTree
+
+
+class Adjacency(object):
+    """An adjacency index of the not-failed vectors in a network.
+
+    The index maps node ids to the ids of the nodes they have vectors to
+    (``outgoing``) and from (``incoming``), along with the class of every
+    node in the network. It lets neighbor and connectivity checks run in
+    O(degree) time without querying the database. The index is built by
+    :func:`~wallace.models.Network.adjacency` and is kept up to date as
+    vectors are created and failed.
+
+    """
+
+    def __init__(self):
+        """Create an empty index."""
+        #: a dict mapping node ids to node classes.
+        self.types = {}
+
+        #: a dict mapping node ids to a dict of the ids of the nodes they
+        #: have vectors to and the number of not-failed vectors to each.
+        self.outgoing = defaultdict(dict)
+
+        #: a dict mapping node ids to a dict of the ids of the nodes they
+        #: have vectors from and the number of not-failed vectors from each.
+        self.incoming = defaultdict(dict)
+
+    def add_node(self, node_id, node_type):
+        """Register a node and its class."""
+        self.types[node_id] = node_type
+
+    def add_edge(self, origin_id, destination_id):
+        """Register a not-failed vector from origin to destination."""
+        out = self.outgoing[origin_id]
+        out[destination_id] = out.get(destination_id, 0) + 1
+        inc = self.incoming[destination_id]
+        inc[origin_id] = inc.get(origin_id, 0) + 1
+
+    def remove_edge(self, origin_id, destination_id):
+        """Unregister a vector from origin to destination that has failed."""
+        for index, a, b in [(self.outgoing, origin_id, destination_id),
+                            (self.incoming, destination_id, origin_id)]:
+            count = index[a].get(b, 0) - 1
+            if count > 0:
+                index[a][b] = count
+            else:
+                index[a].pop(b, None)
+
+    def neighbors(self, node_id, direction="to"):
+        """Get the ids of the nodes connected to a node.
+
+        direction can be "to" (default), "from", "either" or "both".
+        """
+        if direction == "to":
+            return set(self.outgoing[node_id])
+        if direction == "from":
+            return set(self.incoming[node_id])
+        if direction == "either":
+            return set(self.outgoing[node_id]).union(self.incoming[node_id])
+        if direction == "both":
+            return set(self.outgoing[node_id]).intersection(
+                self.incoming[node_id])
+        raise ValueError("{} is not a valid direction".format(direction))
+
+    def is_connected(self, origin_id, destination_id):
+        """Whether there is a not-failed vector from origin to destination."""
+        return destination_id in self.outgoing[origin_id]
+
+
+class Degrees(object):
+    """An index of the out-degree of every node in a network.
+
+    The out-degrees are held in a :class:`~wallace.sampling.FenwickTree` so
+    that they can be updated, and nodes drawn with probability proportional
+    to their out-degree, in O(log n) time. The index is built by
+    :func:`~wallace.models.Network.degrees` and is kept up to date as
+    vectors are created and failed.
+
+    """
+
+    def __init__(self):
+        """Create an empty index."""
+        self._ids = []
+        self._positions = {}
+        self._tree = FenwickTree()
+
+    def __getitem__(self, node_id):
+        """The out-degree of a node."""
+        position = self._positions.get(node_id)
+        return 0 if position is None else self._tree[position]
+
+    def change(self, node_id, change):
+        """Add change to the out-degree of a node."""
+        position = self._positions.get(node_id)
+        if position is None:
+            self._positions[node_id] = len(self._ids)
+            self._ids.append(node_id)
+            self._tree.append(change)
+        else:
+            self._tree.add(position, change)
+
+    def sample(self, k, exclude=()):
+        """Draw the ids of k distinct nodes by preferential attachment.
+
+        Nodes are drawn with probability proportional to their out-degree.
+        Nodes whose ids are in ``exclude`` and nodes with no outgoing vectors
+        are never drawn, so fewer than k ids are returned if there are not
+        enough nodes left.
+        """
+        positions = [self._positions[i] for i in exclude
+                     if i in self._positions]
+        return [self._ids[p] for p in self._tree.sample(k, exclude=positions)]
+
+
+class GraphCache(object):
+    """The nodes, vectors, infos and transmissions of a network, in memory.
+
+    The cache is filled by :func:`~wallace.models.Network.load_graph` and
+    lets the query methods of networks and nodes answer without querying
+    the database. Objects are held in order of id and indexed by the ids of
+    the nodes they come from and go to. Objects created after the cache was
+    filled are added as pending and indexed once they have been flushed and
+    given ids.
+
+    """
+
+    #: the columns the objects of each table are indexed on.
+    indexes = {
+        "node": [],
+        "vector": ["origin_id", "destination_id"],
+        "info": ["origin_id"],
+        "transmission": ["origin_id", "destination_id"]
+    }
+
+    def __init__(self):
+        """Create an empty cache."""
+        self.objects = dict((table, []) for table in self.indexes)
+        self._indexes = dict(((table, column), defaultdict(list))
+                             for table, columns in self.indexes.items()
+                             for column in columns)
+
+        #: objects that have been added but have yet to be indexed.
+        self.pending = []
+
+    def load(self, objects):
+        """Add objects that have already been flushed, in order of id."""
+        for obj in objects:
+            self._index(obj)
+
+    def add(self, obj):
+        """Add an object that has just been created."""
+        self.pending.append(obj)
+
+    def index_pending(self):
+        """Index the pending objects, which must have been flushed."""
+        pending, self.pending = self.pending, []
+        for obj in sorted(pending, key=lambda o: o.id):
+            self._index(obj)
+
+    def find(self, table, column=None, value=None):
+        """The objects of a table, or those whose column has a value."""
+        if column is None:
+            return list(self.objects[table])
+        return list(self._indexes[(table, column)].get(value, ()))
+
+    def _index(self, obj):
+        """Add an object to the lists and indexes of its table."""
+        table = obj.__tablename__
+        self.objects[table].append(obj)
+        for column in self.indexes[table]:
+            self._indexes[(table, column)][getattr(obj, column)].append(obj)
+
+
+class NetworkArrays(object):
+    """The structure of a network as NumPy arrays.
+
+    Nodes are numbered by their position in :attr:`node_ids`, which is
+    sorted. The not-failed vectors are held as a compressed sparse row (CSR)
+    adjacency matrix: the vectors from the node at position ``i`` lead to the
+    nodes at positions ``indices[indptr[i]:indptr[i + 1]]``. The arrays are
+    built by :func:`~wallace.models.Network.to_arrays`.
+
+    """
+
+    def __init__(self, node_ids, types, failed, origin_ids, destination_ids,
+                 vector_ids, properties=None):
+        """Build the arrays from the columns of the nodes and vectors.
+
+        The node columns must be in order of id and the vector columns in
+        order of origin.
+        """
+        import numpy as np
+
+        #: the ids of the nodes, sorted.
+        self.node_ids = node_ids
+        #: the types of the nodes, in order of their codes.
+        self.type_names, codes = np.unique(types, return_inverse=True)
+        #: the code of the type of every node, its position in type_names.
+        self.types = codes.astype(np.int8)
+        #: whether every node has failed.
+        self.failed = failed
+        #: a dict of the arrays of the numeric properties of the nodes.
+        self.properties = properties or {}
+
+        #: the positions of the nodes every vector leads to, grouped by origin.
+        self.indices = np.searchsorted(node_ids, destination_ids)
+        #: the ids of the vectors in the same order as :attr:`indices`.
+        self.vector_ids = vector_ids
+        #: where the vectors from each node start in :attr:`indices`.
+        self.indptr = np.concatenate(
+            [[0], np.cumsum(np.bincount(np.searchsorted(node_ids, origin_ids),
+                                        minlength=len(node_ids)))])\
+            .astype(np.int64)
+
+    def __len__(self):
+        """The number of nodes."""
+        return len(self.node_ids)
+
+    def degrees(self):
+        """The out-degree of every node."""
+        import numpy as np
+        return np.diff(self.indptr)
+
+    def edges(self):
+        """The origin and destination ids of the vectors, in order of origin.
+        """
+        import numpy as np
+        origins = np.repeat(self.node_ids, self.degrees())
+        return origins, self.node_ids[self.indices]
+
+    def write_edgelist(self, f, delimiter=" ", chunk_size=10000):
+        """Write the vectors to a file as lines of origin and destination id.
+        """
+        origins, destinations = self.edges()
+        for start in range(0, len(origins), chunk_size):
+            end = start + chunk_size
+            f.write("".join(
+                "{}{}{}\n".format(o, delimiter, d)
+                for o, d in zip(origins[start:end].tolist(),
+                                destinations[start:end].tolist())))
+
+    def write_graphml(self, f, chunk_size=10000):
+        """Write the nodes and vectors to a file as GraphML.
+
+        Nodes have their type, whether they have failed and their
+        properties as data, and are written a chunk at a time, as are the
+        vectors, so the document is never held in memory.
+        """
+        from xml.sax.saxutils import escape, quoteattr
+
+        keys = [("type", "string"), ("failed", "boolean")] + \
+            [(name, "double") for name in sorted(self.properties)]
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for name, type in keys:
+            f.write('  <key id={0} for="node" attr.name={0} '
+                    'attr.type="{1}"/>\n'.format(quoteattr(name), type))
+        f.write('  <graph edgedefault="directed">\n')
+
+        type_names = [escape(str(t)) for t in self.type_names]
+        for start in range(0, len(self), chunk_size):
+            end = start + chunk_size
+            columns = [self.node_ids[start:end].tolist(),
+                       self.types[start:end].tolist(),
+                       self.failed[start:end].tolist()] + \
+                [self.properties[name][start:end].tolist()
+                 for name, _ in keys[2:]]
+            lines = []
+            for row in zip(*columns):
+                lines.append('    <node id="n{}">'.format(row[0]))
+                lines.append('<data key="type">{}</data>'.format(
+                    type_names[row[1]]))
+                lines.append('<data key="failed">{}</data>'.format(
+                    "true" if row[2] else "false"))
+                for (name, _), value in zip(keys[2:], row[3:]):
+                    if value == value:  # NaN stands for no value
+                        lines.append('<data key={}>{!r}</data>'.format(
+                            quoteattr(name), value))
+                lines.append('</node>\n')
+            f.write("".join(lines))
+
+        origins, destinations = self.edges()
+        for start in range(0, len(origins), chunk_size):
+            end = start + chunk_size
+            f.write("".join(
+                '    <edge id="e{}" source="n{}" target="n{}"/>\n'.format(
+                    v, o, d)
+                for v, o, d in zip(self.vector_ids[start:end].tolist(),
+                                   origins[start:end].tolist(),
+                                   destinations[start:end].tolist())))
+        f.write('  </graph>\n</graphml>\n')
@@ -0,0 +1,183 @@
+"""Collect metrics about requests and serve them in Prometheus format.
+
+The web server records how long every request takes, its status and how
+many SQL statements it ran, and for how long, labelled by route. The
+statements are counted with SQLAlchemy engine events on
+:data:`wallace.db.engine`. The metrics are kept in memory, so each server
+process reports its own.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+import threading
+import time
+
+from sqlalchemy import event
+
+from wallace import db
+
+#: the upper bounds of the buckets of the request duration histograms, in
+#: seconds.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0)
+
+#: the upper bounds of the buckets of the SQL statement count histograms.
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram(object):
+    """Counts of observations falling in a fixed set of buckets."""
+
+    def __init__(self, buckets):
+        """Create an empty histogram with the given bucket upper bounds."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Record an observation."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """The number of observations in each bucket or any lower one."""
+        counts = []
+        running = 0
+        for count in self.counts:
+            running += count
+            counts.append(running)
+        return counts
+
+
+class Registry(object):
+    """The metrics collected by a server process."""
+
+    def __init__(self):
+        """Create an empty registry."""
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.durations = {}
+        self.statements = {}
+        self.sql_statements = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+
+    def record(self, route, method, status, duration, statements,
+               sql_seconds):
+        """Record a finished request."""
+        labels = (route, method)
+        with self.lock:
+            self.requests[labels + (str(status),)] += 1
+            self.durations.setdefault(
+                labels, Histogram(DURATION_BUCKETS)).observe(duration)
+            self.statements.setdefault(
+                labels, Histogram(STATEMENT_BUCKETS)).observe(statements)
+            self.sql_statements[labels] += statements
+            self.sql_seconds[labels] += sql_seconds
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            lines.extend([
+                "# HELP wallace_requests_total Requests by route, method "
+                "and status.",
+                "# TYPE wallace_requests_total counter"])
+            for (route, method, status), n in sorted(self.requests.items()):
+                lines.append("wallace_requests_total{} {}".format(
+                    _labels(route=route, method=method, status=status), n))
+
+            self._render_histograms(
+                lines, "wallace_request_duration_seconds",
+                "Request latency by route and method.", self.durations)
+            self._render_histograms(
+                lines, "wallace_request_sql_statements",
+                "SQL statements per request by route and method.",
+                self.statements)
+
+            for name, help, values in [
+                    ("wallace_sql_statements_total",
+                     "SQL statements run by route and method.",
+                     self.sql_statements),
+                    ("wallace_sql_duration_seconds_total",
+                     "Time spent running SQL statements by route and "
+                     "method.", self.sql_seconds)]:
+                lines.extend(["# HELP {} {}".format(name, help),
+                              "# TYPE {} counter".format(name)])
+                for (route, method), value in sorted(values.items()):
+                    lines.append("{}{} {}".format(
+                        name, _labels(route=route, method=method),
+                        _number(value)))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines, name, help, histograms):
+        """Add the lines for a family of histograms."""
+        lines.extend(["# HELP {} {}".format(name, help),
+                      "# TYPE {} histogram".format(name)])
+        for (route, method), histogram in sorted(histograms.items()):
+            bounds = [_number(b) for b in histogram.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, histogram.cumulative_counts()):
+                lines.append("{}_bucket{} {}".format(
+                    name, _labels(route=route, method=method, le=bound),
+                    count))
+            labels = _labels(route=route, method=method)
+            lines.append("{}_sum{} {}".format(name, labels,
+                                              _number(histogram.total)))
+            lines.append("{}_count{} {}".format(name, labels,
+                                                histogram.count))
+
+
+def _labels(route, method, **extra):
+    """Format the labels of a metric."""
+    labels = [("route", route), ("method", method)] + sorted(extra.items())
+    return "{" + ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels) + "}"
+
+
+def _number(value):
+    """Format a number."""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+#: the metrics collected by this process.
+registry = Registry()
+
+# the SQL statements run by the current thread's request.
+_current = threading.local()
+
+
+def start_request():
+    """Start timing a request and counting its SQL statements."""
+    _current.start = time.time()
+    _current.statements = 0
+    _current.sql_seconds = 0.0
+
+
+def finish_request(route, method, status):
+    """Record the request started by the current thread."""
+    start = getattr(_current, "start", None)
+    if start is None:
+        return
+    registry.record(route, method, status, time.time() - start,
+                    _current.statements, _current.sql_seconds)
+    _current.start = None
+
+
+@event.listens_for(db.engine, "before_cursor_execute")
+def _start_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    """Note when a SQL statement starts."""
+    _current.statement_start = time.time()
+
+
+@event.listens_for(db.engine, "after_cursor_execute")
+def _finish_statement(conn, cursor, statement, parameters, context,
+                      executemany):
+    """Count a SQL statement against the current request, if any."""
+    if getattr(_current, "start", None) is not None:
+        _current.statements += 1
+        _current.sql_seconds += time.time() - _current.statement_start
@@ -1,13 +1,21 @@
 """Define Wallace's core models."""
 
 from datetime import datetime
+from weakref import WeakKeyDictionary
 
 from .db import Base
+from .graph import Adjacency, Degrees, GraphCache, NetworkArrays
 
-from sqlalchemy import ForeignKey, or_, and_
+from sqlalchemy import ForeignKey, or_, and_, event, func
 from sqlalchemy import (Column, String, Text, Enum, Integer, Boolean, DateTime,
-                        Float)
-from sqlalchemy.orm import relationship, validates
+                        Float, Index, MetaData, Table)
+from sqlalchemy import case, cast, exists, literal, null, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, array
+from sqlalchemy.sql.expression import type_coerce
+from sqlalchemy.orm import relationship, validates, object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.evaluator import EvaluatorCompiler, UnevaluatableError
+from sqlalchemy.orm.util import identity_key
 
 import inspect
 
@@ -19,6 +27,156 @@ def timenow():
     return datetime.now()
 
 
+def flush_pending(*objects):
+    """Flush the session if any of the objects has yet to be given an id."""
+    for obj in objects:
+        if obj.id is None:
+            session = object_session(obj)
+            if session is not None:
+                session.flush()
+            return
+
+
+def get_all(session, model, ids):
+    """Get the instances of a model with the given ids.
+
+    Instances that are already in the session are taken from its identity map,
+    the rest are loaded with a single query.
+    """
+    found = []
+    missing = []
+    for i in ids:
+        obj = session.identity_map.get(identity_key(model, i))
+        if obj is None:
+            missing.append(i)
+        else:
+            found.append(obj)
+    if missing:
+        found.extend(session.query(model).filter(model.id.in_(missing)).all())
+    return found
+
+
+#: the instances inserted by bulk_insert() in each transaction.
+_bulk_inserted = WeakKeyDictionary()
+
+
+def bulk_insert(session, model, rows):
+    """Insert rows of a model with a single multi-row ``INSERT``.
+
+    ``rows`` is a list of dicts which must all have the same keys. Return
+    instances of the new rows, in the same order, which are in the session
+    but were not inserted by a flush, so session listeners that look at the
+    new objects of a flush do not see them. They can get them from
+    :func:`bulk_inserted` instead.
+    """
+    table = model.__table__
+    result = session.execute(
+        table.insert().values(rows).returning(*table.columns))
+    instances = list(session.query(model).instances(result))
+    _bulk_inserted.setdefault(_root_transaction(session), [])\
+        .extend(instances)
+    return instances
+
+
+def bulk_inserted(session):
+    """The instances inserted by bulk_insert() in the current transaction.
+
+    This can be called from the session's ``after_commit`` listeners, but
+    the instances are forgotten once the transaction is over.
+    """
+    return list(_bulk_inserted.get(_root_transaction(session), ()))
+
+
+def _root_transaction(session):
+    """The outermost transaction of a session."""
+    transaction = session.transaction
+    while transaction._parent is not None:
+        transaction = transaction._parent
+    return transaction
+
+
+def alive_at(model, time):
+    """A criterion matching the rows of a model that were alive at a time.
+
+    Those are the rows that had been created by then and had not yet failed,
+    whether or not they have failed since.
+    """
+    return and_(model.creation_time <= time,
+                or_(model.time_of_death == None, model.time_of_death > time))
+
+
+def fail_where(session, model, criterion, time, *columns):
+    """Fail all the not-failed rows of a model that match a criterion.
+
+    The rows are failed with a single ``UPDATE``, and any matching instances
+    already in the session are updated to match. Return the id and any
+    additional ``columns`` of the rows that were failed.
+    """
+    table = model.__table__
+    rows = session.execute(
+        table.update()
+        .where(and_(table.c.failed == False, criterion))
+        .values(failed=True, time_of_death=time)
+        .returning(table.c.id, *columns)).fetchall()
+
+    for row in rows:
+        obj = session.identity_map.get(identity_key(model, row.id))
+        if obj is not None:
+            set_committed_value(obj, "failed", True)
+            set_committed_value(obj, "time_of_death", time)
+    return rows
+
+
+def fail_nodes(criterion):
+    """Fail all the not-failed nodes that match a criterion.
+
+    Also fail all vectors connected to these nodes, infos made by them,
+    transmissions to or from them and transformations made by them or
+    involving their infos. This takes one ``UPDATE`` per table, however many
+    objects are failed. Return the ids of the nodes that were failed.
+    """
+    session = Node.query.session
+    session.flush()
+    time = timenow()
+
+    nodes = fail_where(session, Node, criterion, time, Node.network_id)
+    node_ids = [n.id for n in nodes]
+    if not node_ids:
+        return []
+
+    vectors = fail_where(
+        session, Vector,
+        or_(Vector.origin_id.in_(node_ids),
+            Vector.destination_id.in_(node_ids)),
+        time, Vector.origin_id, Vector.destination_id, Vector.network_id)
+    infos = fail_where(session, Info, Info.origin_id.in_(node_ids), time)
+    fail_where(
+        session, Transmission,
+        or_(Transmission.origin_id.in_(node_ids),
+            Transmission.destination_id.in_(node_ids)),
+        time)
+
+    info_ids = [i.id for i in infos]
+    if info_ids:
+        criterion = or_(Transformation.node_id.in_(node_ids),
+                        Transformation.info_in_id.in_(info_ids),
+                        Transformation.info_out_id.in_(info_ids))
+    else:
+        criterion = Transformation.node_id.in_(node_ids)
+    fail_where(session, Transformation, criterion, time)
+
+    for network_id in set(n.network_id for n in nodes):
+        network = session.query(Network).get(network_id)
+        for v in vectors:
+            if v.network_id == network_id:
+                network._vector_failed(v.origin_id, v.destination_id)
+        network._change_node_count(
+            -len([n for n in nodes if n.network_id == network_id]))
+        network.calculate_full()
+
+    return node_ids
+
+
 class SharedMixin(object):
     """Create shared columns."""
 
@@ -48,6 +206,29 @@ class SharedMixin(object):
     #: String form.
     property5 = Column(String(256), nullable=True, default=None)
 
+    #: a generic column that can be used to store experiment-specific
+    #: integers. Unlike the property columns it can be filtered and sorted on
+    #: in SQL without a cast. Nodes' integer1, which holds e.g. generations,
+    #: is indexed where it is set.
+    integer1 = Column(Integer, nullable=True, default=None)
+
+    #: a generic column that can be used to store experiment-specific
+    #: integers.
+    integer2 = Column(Integer, nullable=True, default=None)
+
+    #: a generic column that can be used to store experiment-specific real
+    #: numbers. Nodes' real1, which holds Agent.fitness, is indexed where it
+    #: is set.
+    real1 = Column(Float, nullable=True, default=None)
+
+    #: a generic column that can be used to store experiment-specific real
+    #: numbers.
+    real2 = Column(Float, nullable=True, default=None)
+
+    #: a generic column that can be used to store experiment-specific
+    #: booleans.
+    boolean1 = Column(Boolean, nullable=True, default=None)
+
     #: boolean indicating whether the Network has failed which
     #: prompts Wallace to ignore it unless specified otherwise. Objects are
     #: usually failed to indicate something has gone wrong.
@@ -146,7 +327,12 @@ class Participant(Base, SharedMixin):
             "property2": self.property2,
             "property3": self.property3,
             "property4": self.property4,
-            "property5": self.property5
+            "property5": self.property5,
+            "integer1": self.integer1,
+            "integer2": self.integer2,
+            "real1": self.real1,
+            "real2": self.real2,
+            "boolean1": self.boolean1
         }
 
     def nodes(self, type=None, failed=False):
@@ -207,11 +393,21 @@ class Participant(Base, SharedMixin):
         returned.
 
         """
-        nodes = self.nodes(failed="all")
-        infos = []
-        for n in nodes:
-            infos.extend(n.infos(type=type, failed=failed))
-        return infos
+        if type is None:
+            type = Info
+
+        if not issubclass(type, Info):
+            raise(TypeError("{} is not a valid info type.".format(type)))
+
+        if failed not in ["all", False, True]:
+            raise ValueError("{} is not a valid info failed".format(failed))
+
+        query = type.query\
+            .join(Node, Node.id == type.origin_id)\
+            .filter(Node.participant_id == self.id)
+        if failed != "all":
+            query = query.filter(type.failed == failed)
+        return query.all()
 
     def fail(self):
         """Fail a participant.
@@ -228,8 +424,7 @@ class Participant(Base, SharedMixin):
             self.failed = True
             self.time_of_death = timenow()
 
-            for n in self.nodes():
-                n.fail()
+            fail_nodes(Node.participant_id == self.id)
 
 
 class Question(Base, SharedMixin):
@@ -304,7 +499,12 @@ class Question(Base, SharedMixin):
             "property2": self.property2,
             "property3": self.property3,
             "property4": self.property4,
-            "property5": self.property5
+            "property5": self.property5,
+            "integer1": self.integer1,
+            "integer2": self.integer2,
+            "real1": self.real1,
+            "real2": self.real2,
+            "boolean1": self.boolean1
         }
 
 
@@ -333,17 +533,23 @@ class Network(Base, SharedMixin):
     #: networks as either "practice" or "experiment"
     role = Column(String(26), nullable=False, default="default", index=True)
 
+    #: The number of not-failed nodes in the network. This is kept up to
+    #: date as nodes are created and failed so that
+    #: :func:`~wallace.models.Network.calculate_full` does not need to count
+    #: them.
+    node_count = Column(Integer, nullable=False, default=0)
+
     def __repr__(self):
         """The string representation of a network."""
         return ("<Network-{}-{} with {} nodes, {} vectors, {} infos, "
                 "{} transmissions and {} transformations>").format(
             self.id,
             self.type,
-            len(self.nodes()),
-            len(self.vectors()),
-            len(self.infos()),
-            len(self.transmissions()),
-            len(self.transformations()))
+            self.count_nodes(),
+            self.count_vectors(),
+            self.count_infos(),
+            self.count_transmissions(),
+            self.count_transformations())
 
     def __json__(self):
         """Return json description of a participant."""
@@ -360,7 +566,12 @@ class Network(Base, SharedMixin):
             "property2": self.property2,
             "property3": self.property3,
             "property4": self.property4,
-            "property5": self.property5
+            "property5": self.property5,
+            "integer1": self.integer1,
+            "integer2": self.integer2,
+            "real1": self.real1,
+            "real2": self.real2,
+            "boolean1": self.boolean1
         }
 
     """ ###################################
@@ -374,6 +585,25 @@ class Network(Base, SharedMixin):
         (default) or True. If a participant_id is passed only
         nodes with that participant_id will be returned.
         """
+        return self._all(self._nodes_query(type=type,
+                                           failed=failed,
+                                           participant_id=participant_id),
+                         "node")
+
+    def count_nodes(self, type=None, failed=False, participant_id=None):
+        """Count the nodes in the network.
+
+        Takes the same arguments as :func:`~wallace.models.Network.nodes`, but
+        the counting is done by the database (or in memory, if the graph is
+        loaded).
+        """
+        return self._count(self._nodes_query(type=type,
+                                             failed=failed,
+                                             participant_id=participant_id),
+                           "node")
+
+    def _nodes_query(self, type=None, failed=False, participant_id=None):
+        """The query behind nodes() and count_nodes()."""
         if type is None:
             type = Node
 
@@ -383,31 +613,12 @@ class Network(Base, SharedMixin):
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid node failed".format(failed))
 
+        query = type.query.filter_by(network_id=self.id)
         if participant_id is not None:
-            if failed == "all":
-                return type\
-                    .query\
-                    .filter_by(network_id=self.id,
-                               participant_id=participant_id)\
-                    .all()
-            else:
-                return type\
-                    .query\
-                    .filter_by(network_id=self.id,
-                               participant_id=participant_id,
-                               failed=failed)\
-                    .all()
-        else:
-            if failed == "all":
-                return type\
-                    .query\
-                    .filter_by(network_id=self.id)\
-                    .all()
-            else:
-                return type\
-                    .query\
-                    .filter_by(failed=failed, network_id=self.id)\
-                    .all()
+            query = query.filter_by(participant_id=participant_id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+        return query
 
     def size(self, type=None, failed=False):
         """How many nodes in a network.
@@ -415,7 +626,7 @@ class Network(Base, SharedMixin):
         type specifies the class of node, failed
         can be True/False/all.
         """
-        return len(self.nodes(type=type, failed=failed))
+        return self.count_nodes(type=type, failed=failed)
 
     def infos(self, type=None, failed=False):
         """
@@ -427,18 +638,29 @@ class Network(Base, SharedMixin):
         :class:`~wallace.models.Node`.
 
         """
+        return self._all(self._infos_query(type=type, failed=failed), "info")
+
+    def count_infos(self, type=None, failed=False):
+        """Count the infos in the network.
+
+        Takes the same arguments as :func:`~wallace.models.Network.infos`, but
+        the counting is done by the database (or in memory, if the graph is
+        loaded).
+        """
+        return self._count(self._infos_query(type=type, failed=failed),
+                           "info")
+
+    def _infos_query(self, type=None, failed=False):
+        """The query behind infos() and count_infos()."""
         if type is None:
             type = Info
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid failed".format(failed))
 
-        if failed == "all":
-            return type.query\
-                .filter_by(network_id=self.id)\
-                .all()
-        else:
-            return type.query.filter_by(
-                network_id=self.id, failed=failed).all()
+        query = type.query.filter_by(network_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+        return query
 
     def transmissions(self, status="all", failed=False):
         """Get transmissions in the network.
@@ -448,6 +670,23 @@ class Network(Base, SharedMixin):
         To get transmissions from a specific vector, see the
         transmissions() method in class Vector.
         """
+        return self._all(
+            self._transmissions_query(status=status, failed=failed),
+            "transmission")
+
+    def count_transmissions(self, status="all", failed=False):
+        """Count the transmissions in the network.
+
+        Takes the same arguments as
+        :func:`~wallace.models.Network.transmissions`, but the counting is
+        done by the database (or in memory, if the graph is loaded).
+        """
+        return self._count(
+            self._transmissions_query(status=status, failed=failed),
+            "transmission")
+
+    def _transmissions_query(self, status="all", failed=False):
+        """The query behind transmissions() and count_transmissions()."""
         if status not in ["all", "pending", "received"]:
             raise(ValueError("You cannot get transmission of status {}."
                   .format(status) +
@@ -455,25 +694,12 @@ class Network(Base, SharedMixin):
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid failed".format(failed))
 
-        if status == "all":
-            if failed == "all":
-                return Transmission.query\
-                    .filter_by(network_id=self.id)\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter_by(network_id=self.id, failed=failed)\
-                    .all()
-        else:
-            if failed == "all":
-                return Transmission.query\
-                    .filter_by(network_id=self.id, status=status)\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter_by(
-                        network_id=self.id, status=status, failed=failed)\
-                    .all()
+        query = Transmission.query.filter_by(network_id=self.id)
+        if status != "all":
+            query = query.filter_by(status=status)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+        return query
 
     def transformations(self, type=None, failed=False):
         """Get transformations in the network.
@@ -484,34 +710,192 @@ class Network(Base, SharedMixin):
         To get transformations from a specific node,
         see Node.transformations().
         """
+        return self._transformations_query(type=type, failed=failed).all()
+
+    def count_transformations(self, type=None, failed=False):
+        """Count the transformations in the network.
+
+        Takes the same arguments as
+        :func:`~wallace.models.Network.transformations`, but the counting is
+        done by the database.
+        """
+        return self._transformations_query(type=type, failed=failed).count()
+
+    def _transformations_query(self, type=None, failed=False):
+        """The query behind transformations() and count_transformations()."""
         if type is None:
             type = Transformation
 
         if failed not in ["all", True, False]:
             raise ValueError("{} is not a valid failed".format(failed))
 
-        if failed == "all":
-            return type.query\
-                .filter_by(network_id=self.id)\
-                .all()
-        else:
-            return type.query\
-                .filter_by(network_id=self.id, failed=failed)\
-                .all()
+        query = type.query.filter_by(network_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+        return query
 
     def latest_transmission_recipient(self):
         """Get the node that most recently received a transmission."""
-        from operator import attrgetter
+        t = self._first(Transmission.query.filter_by(
+            status="received", network_id=self.id, failed=False),
+            "transmission", by="receive_time")
+        return None if t is None else t.destination
+
+    def latest(self, type=None, failed=False, where=None):
+        """Get the most recently created node, info, vector or transmission.
+
+        Type must be a subclass of :class:`~wallace.models.Node` (the
+        default), :class:`~wallace.models.Info`,
+        :class:`~wallace.models.Vector` or
+        :class:`~wallace.models.Transmission`. Failed can be True, False
+        (default) or "all" and where is an optional SQL criterion, e.g.
+        ``Node.id != node.id``. Ties are broken by id. The database finds it
+        with ``ORDER BY creation_time DESC, id DESC LIMIT 1``, so nothing
+        else is loaded. Return None if there is none.
+        """
+        return self._first(self._created_query(type, failed, where),
+                           (type or Node).__tablename__)
 
-        ts = Transmission.query\
-            .filter_by(status="received", network_id=self.id, failed=False)\
-            .all()
+    def earliest(self, type=None, failed=False, where=None):
+        """Get the first created node, info, vector or transmission.
 
-        if ts:
-            t = max(ts, key=attrgetter('receive_time'))
-            return t.destination
-        else:
-            return None
+        Takes the same arguments as :func:`~wallace.models.Network.latest`.
+        """
+        return self._first(self._created_query(type, failed, where),
+                           (type or Node).__tablename__, latest=False)
+
+    def at(self, time):
+        """Get the network as it was at a time.
+
+        Return a :class:`~wallace.models.Snapshot` whose methods get the
+        nodes, vectors and infos that were alive at that time, i.e. that had
+        been created and had not yet failed.
+        """
+        return Snapshot(self, time)
+
+    def snapshots(self, times):
+        """Get the network as it was at each of several times.
+
+        Everything the network held up to the last of the times is loaded
+        with a query per table, and the creations and deaths are swept
+        through once, in order, to make a
+        :class:`~wallace.models.Snapshot` for each time. This is much
+        quicker than calling :func:`~wallace.models.Network.at` for each of
+        many times. Return the snapshots in order of time.
+        """
+        times = sorted(times)
+        if not times:
+            return []
+        flush_pending(self)
+
+        # every object is born once and may die once. At the same time,
+        # births come before deaths.
+        events = []
+        for model in [Node, Vector, Info]:
+            for obj in model.query\
+                    .filter_by(network_id=self.id)\
+                    .filter(model.creation_time <= times[-1]):
+                events.append((obj.creation_time, 0, obj))
+                if obj.time_of_death is not None:
+                    events.append((obj.time_of_death, 1, obj))
+        events.sort(key=lambda event: event[:2])
+
+        alive = dict((table, {}) for table in ["node", "vector", "info"])
+        snapshots = []
+        i = 0
+        for time in times:
+            while i < len(events) and events[i][0] <= time:
+                _, died, obj = events[i]
+                if died:
+                    alive[obj.__tablename__].pop(obj.id, None)
+                else:
+                    alive[obj.__tablename__][obj.id] = obj
+                i += 1
+            snapshots.append(Snapshot(self, time, dict(
+                (table, [objects[k] for k in sorted(objects)])
+                for table, objects in alive.items())))
+        return snapshots
+
+    def _created_query(self, type=None, failed=False, where=None):
+        """The query behind latest() and earliest()."""
+        if type is None:
+            type = Node
+        if not issubclass(type, (Node, Info, Vector, Transmission)):
+            raise TypeError("{} is not a valid type.".format(type))
+        if failed not in ["all", False, True]:
+            raise ValueError("{} is not a valid failed".format(failed))
+
+        query = type.query.filter_by(network_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+        if where is not None:
+            query = query.filter(where)
+        return query
+
+    def lineage_tree(self, failed=False, materialize=False):
+        """Get the lineages of all the infos in the network.
+
+        Every info that was not made from another info by a transformation is
+        the root of a tree, whose branches are the transformations that
+        followed from it. The trees are fetched with a single recursive
+        query and returned as a list of rows, ordered by root and then path,
+        with the attributes:
+
+        * ``info_id``, the id of the info,
+        * ``parent_id``, the id of the info it was made from, or None for
+          roots,
+        * ``root_id``, the id of the root of its tree,
+        * ``depth``, the number of transformations since the root, and
+        * ``path``, a list of the ids of the infos from the root to it.
+
+        An info made from several infos appears once for each of them.
+        ``failed`` filters both the roots and the transformations followed.
+        If ``materialize`` is True, the rows are also written to a temporary
+        table called ``lineage``, replacing any earlier one, so that later
+        queries on the same connection can join against it.
+        """
+        if failed not in ["all", False, True]:
+            raise ValueError("{} is not a valid failed".format(failed))
+
+        criteria = []
+        roots = [Info.network_id == self.id]
+        if failed != "all":
+            criteria.append(Transformation.failed == failed)
+            roots.append(Info.failed == failed)
+        roots.append(~exists().where(
+            and_(Transformation.info_out_id == Info.id, *criteria)))
+
+        tree = select([Info.id.label("info_id"),
+                       cast(null(), Integer).label("parent_id"),
+                       Info.id.label("root_id"),
+                       literal(0).label("depth"),
+                       array([Info.id]).label("path")])\
+            .where(and_(*roots))\
+            .cte("lineage_tree", recursive=True)
+        parent = tree.alias("parent")
+        tree = tree.union_all(
+            select([Transformation.info_out_id,
+                    Transformation.info_in_id,
+                    parent.c.root_id,
+                    parent.c.depth + 1,
+                    type_coerce(parent.c.path.op("||")(
+                        Transformation.info_out_id), ARRAY(Integer))])
+            .where(and_(Transformation.info_in_id == parent.c.info_id,
+                        *criteria)))
+
+        session = object_session(self)
+        if materialize:
+            connection = session.connection()
+            # has_table only looks in the current schema, so checkfirst
+            # would never find an earlier temporary table.
+            connection.execute("DROP TABLE IF EXISTS pg_temp.lineage")
+            lineage.create(connection)
+            connection.execute(lineage.insert().from_select(
+                [c.name for c in lineage.columns], select([tree])))
+
+        return session.query(tree)\
+            .order_by(tree.c.root_id, tree.c.path)\
+            .all()
 
     def vectors(self, failed=False):
         """
@@ -520,17 +904,244 @@ class Network(Base, SharedMixin):
         failed = { False, True, "all" }
         To get the vectors to/from to a specific node, see Node.vectors().
         """
+        return self._all(self._vectors_query(failed=failed), "vector")
+
+    def count_vectors(self, failed=False):
+        """Count the vectors in the network.
+
+        Takes the same arguments as :func:`~wallace.models.Network.vectors`,
+        but the counting is done by the database (or in memory, if the graph is
+        loaded).
+        """
+        return self._count(self._vectors_query(failed=failed), "vector")
+
+    def _vectors_query(self, failed=False):
+        """The query behind vectors() and count_vectors()."""
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid vector failed".format(failed))
 
-        if failed == "all":
-            return Vector.query\
+        query = Vector.query.filter_by(network_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+        return query
+
+    def adjacency(self):
+        """Get the adjacency index of the network.
+
+        Return an :class:`~wallace.graph.Adjacency` holding the not-failed
+        vectors in the network and the classes of its nodes. The index is
+        built with two queries (or none, if the graph is loaded) the first
+        time it is asked for and is then
+        kept up to date as vectors are created and failed. It is discarded
+        whenever the network is expired (e.g. on commit or rollback).
+        """
+        index = self.__dict__.get("_adjacency")
+        if index is None and "_graph" in self.__dict__:
+            graph = self._loaded_graph()
+            index = Adjacency()
+            for n in graph.find("node"):
+                index.add_node(n.id, type(n))
+            for v in graph.find("vector"):
+                if not v.failed:
+                    index.add_edge(v.origin_id, v.destination_id)
+            self._adjacency = index
+        elif index is None:
+            flush_pending(self)
+            index = Adjacency()
+
+            polymorphic_map = Node.__mapper__.polymorphic_map
+            nodes = Node.query\
+                .with_entities(Node.id, Node.type)\
                 .filter_by(network_id=self.id)\
                 .all()
-        else:
-            return Vector.query\
-                .filter_by(network_id=self.id, failed=failed)\
+            for n in nodes:
+                mapper = polymorphic_map.get(n.type)
+                index.add_node(n.id, mapper.class_ if mapper else Node)
+
+            vectors = Vector.query\
+                .with_entities(Vector.origin_id, Vector.destination_id)\
+                .filter_by(network_id=self.id, failed=False)\
+                .all()
+            for v in vectors:
+                index.add_edge(v.origin_id, v.destination_id)
+
+            self._adjacency = index
+        return index
+
+    def degrees(self):
+        """Get the out-degree index of the network.
+
+        Return a :class:`~wallace.graph.Degrees` holding the number of
+        not-failed vectors from every node in the network, which can be used
+        to draw nodes by preferential attachment. Like
+        :func:`~wallace.models.Network.adjacency`, the index is built with a
+        single query the first time it is asked for, kept up to date as
+        vectors are created and failed and discarded whenever the network is
+        expired.
+        """
+        index = self.__dict__.get("_degrees")
+        if index is None and "_graph" in self.__dict__:
+            graph = self._loaded_graph()
+            index = Degrees()
+            for v in graph.find("vector"):
+                if not v.failed:
+                    index.change(v.origin_id, 1)
+            self._degrees = index
+        elif index is None:
+            flush_pending(self)
+            index = Degrees()
+
+            degrees = Vector.query\
+                .with_entities(Vector.origin_id, func.count(Vector.id))\
+                .filter_by(network_id=self.id, failed=False)\
+                .group_by(Vector.origin_id)\
                 .all()
+            for origin_id, degree in degrees:
+                index.change(origin_id, degree)
+
+            self._degrees = index
+        return index
+
+    def to_arrays(self, properties=()):
+        """Get the structure of the network as NumPy arrays.
+
+        Return a :class:`~wallace.graph.NetworkArrays` holding the ids, type
+        codes and failed status of all the nodes in the network and a CSR
+        adjacency matrix of its not-failed vectors, which can be written out
+        as an edge list or GraphML. ``properties`` names numeric columns of
+        the nodes, or numeric hybrid properties of a class of node (e.g.
+        ``"fitness"``), to include as float arrays. They are NaN where they
+        are null and for the nodes of other classes. The arrays are read from
+        two queries of the columns alone, without creating any nodes or
+        vectors. NumPy is needed to build them.
+        """
+        import numpy as np
+
+        flush_pending(self)
+        session = object_session(self)
+        columns = [_node_property(name) for name in properties]
+
+        nodes = session.execute(
+            select([Node.id, Node.type, Node.failed] + columns)
+            .where(Node.network_id == self.id)
+            .order_by(Node.id)).fetchall()
+        vectors = session.execute(
+            select([Vector.origin_id, Vector.destination_id, Vector.id])
+            .where(and_(Vector.network_id == self.id, Vector.failed == False))
+            .order_by(Vector.origin_id, Vector.id)).fetchall()
+
+        def column(rows, i, dtype):
+            return np.fromiter((row[i] for row in rows), dtype, len(rows))
+
+        return NetworkArrays(
+            node_ids=column(nodes, 0, np.int64),
+            types=np.array([row[1] for row in nodes], dtype=object),
+            failed=column(nodes, 2, np.bool_),
+            origin_ids=column(vectors, 0, np.int64),
+            destination_ids=column(vectors, 1, np.int64),
+            vector_ids=column(vectors, 2, np.int64),
+            properties=dict(
+                (name, np.array([np.nan if row[3 + i] is None
+                                 else float(row[3 + i]) for row in nodes],
+                                dtype=np.float64))
+                for i, name in enumerate(properties)))
+
+    def load_graph(self):
+        """Load the nodes, vectors, infos and transmissions of the network.
+
+        Everything is fetched with four queries and held in a
+        :class:`~wallace.graph.GraphCache` until the network is expired (e.g.
+        on commit or rollback), so in the web server it lasts for a single
+        request. While it is loaded, the methods of the network and of its
+        nodes that get nodes, vectors, infos and transmissions answer from
+        memory without querying the database, and nodes, vectors, infos and
+        transmissions created in the network are added to it. Return the
+        cache.
+        """
+        graph = self.__dict__.get("_graph")
+        if graph is None:
+            flush_pending(self)
+            graph = GraphCache()
+            for model in [Node, Vector, Info, Transmission]:
+                graph.load(model.query
+                           .filter_by(network_id=self.id)
+                           .order_by(model.id)
+                           .all())
+            self._graph = graph
+        return graph
+
+    def _loaded_graph(self):
+        """The loaded graph of the network, if any, with new objects indexed.
+        """
+        graph = self.__dict__.get("_graph")
+        if graph is not None and graph.pending:
+            object_session(self).flush()
+            graph.index_pending()
+        return graph
+
+    def _from_graph(self, query, table, column=None, value=None):
+        """Answer a query from the loaded graph.
+
+        The query's criteria are evaluated in Python on the objects of the
+        table, or on those whose ``column`` has ``value``. Return None if the
+        graph is not loaded or the criteria cannot be evaluated, in which case
+        the query has to be run.
+        """
+        if self.__dict__.get("_graph") is None:
+            return None
+        if query.whereclause is None:
+            matches = None
+        else:
+            try:
+                matches = EvaluatorCompiler().process(query.whereclause)
+            except UnevaluatableError:
+                return None
+
+        model = query.column_descriptions[0]["type"]
+        return [obj for obj in self._loaded_graph().find(table, column, value)
+                if isinstance(obj, model) and (matches is None or matches(obj))]
+
+    def _all(self, query, table, column=None, value=None):
+        """Run a query, or answer it from the loaded graph if possible."""
+        found = self._from_graph(query, table, column, value)
+        return query.all() if found is None else found
+
+    def _first(self, query, table, latest=True, by="creation_time",
+               column=None, value=None):
+        """The newest (or oldest) result of a query, or None.
+
+        Results are ordered by the ``by`` column and then by id. The query
+        is answered from the loaded graph if possible.
+        """
+        model = query.column_descriptions[0]["type"]
+        found = self._from_graph(query, table, column, value)
+        if found is not None:
+            if not found:
+                return None
+            pick = max if latest else min
+            return pick(found, key=lambda obj: (getattr(obj, by), obj.id))
+
+        order = [getattr(model, by), model.id]
+        if latest:
+            order = [c.desc() for c in order]
+        return query.order_by(*order).first()
+
+    def _count(self, query, table, column=None, value=None):
+        """Count the results of a query, from the loaded graph if possible."""
+        found = self._from_graph(query, table, column, value)
+        return query.count() if found is None else len(found)
+
+    def _graph_added(self, obj):
+        """Add a newly created object to the loaded graph, if any."""
+        graph = self.__dict__.get("_graph")
+        if graph is not None:
+            graph.add(obj)
+
+    def _graph_loaded(self, objects):
+        """Add objects that have just been inserted to the loaded graph."""
+        graph = self.__dict__.get("_graph")
+        if graph is not None:
+            graph.load(sorted(objects, key=lambda obj: obj.id))
 
     """ ###################################
     Methods that make Networks do things
@@ -540,6 +1151,160 @@ class Network(Base, SharedMixin):
         """Add the node to the network."""
         raise NotImplementedError
 
+    def add_vectors(self, pairs):
+        """Connect many pairs of nodes at once.
+
+        ``pairs`` is a list of (origin, destination) tuples of nodes in the
+        network. Pairs that are already connected (or repeated) are skipped;
+        vectors for all the others are created with a single multi-row insert
+        and returned in the order their pairs were given. The same checks as
+        :class:`~wallace.models.Vector` are made for every pair and an error
+        is raised, before anything is created, if any of them fail.
+
+        """
+        for origin, destination in pairs:
+            if origin.network_id != self.id:
+                raise ValueError("{} cannot add a vector from {} as it is in "
+                                 "network {}".format(self, origin,
+                                                     origin.network_id))
+            Vector._check_endpoints(origin, destination)
+
+        flush_pending(self, *[n for pair in pairs for n in pair])
+        index = self.adjacency()
+
+        new_pairs = []
+        for origin, destination in pairs:
+            if not index.is_connected(origin.id, destination.id):
+                self._vector_added(origin, destination)
+                new_pairs.append((origin, destination))
+        if not new_pairs:
+            return []
+
+        vectors = bulk_insert(object_session(self), Vector, [{
+            "origin_id": origin.id,
+            "destination_id": destination.id,
+            "network_id": self.id,
+            "creation_time": timenow(),
+            "failed": False
+        } for origin, destination in new_pairs])
+        self._graph_loaded(vectors)
+        return vectors
+
+    def add_transmissions(self, pairs):
+        """Transmit many infos at once.
+
+        ``pairs`` is a list of (vector, info) tuples of vectors in the
+        network and the infos to send along them. The same checks as
+        :class:`~wallace.models.Transmission` are made for every pair and an
+        error is raised, before anything is created, if any of them fail.
+        The transmissions are then created with a single multi-row insert
+        and returned in the order their pairs were given.
+
+        """
+        if not pairs:
+            return []
+        flush_pending(*[x for pair in pairs for x in pair])
+        for vector, info in pairs:
+            if vector.network_id != self.id:
+                raise ValueError("{} cannot add a transmission along {} as it "
+                                 "is in network {}".format(self, vector,
+                                                           vector.network_id))
+            Transmission._check(vector, info)
+
+        transmissions = bulk_insert(object_session(self), Transmission, [{
+            "vector_id": vector.id,
+            "info_id": info.id,
+            "origin_id": vector.origin_id,
+            "destination_id": vector.destination_id,
+            "network_id": self.id,
+            "creation_time": timenow(),
+            "receive_time": None,
+            "status": "pending",
+            "failed": False
+        } for vector, info in pairs])
+        self._graph_loaded(transmissions)
+        return transmissions
+
+    def deliver_all(self):
+        """Receive every pending transmission in the network.
+
+        The not-failed pending transmissions to not-failed nodes are all
+        marked as received with a single ``UPDATE ... RETURNING``, and are
+        then grouped by destination. Each destination's
+        :func:`~wallace.models.Node.update` is called, in order of node id,
+        with the infos of its transmissions, as
+        :func:`~wallace.models.Node.receive` would. Nodes whose classes
+        override receive (e.g. sources, which cannot receive at all) are
+        left out of the update and have their own receive called instead.
+        Return the received transmissions in order of id.
+
+        """
+        session = object_session(self)
+        session.flush()
+
+        table = Transmission.__table__
+        node_table = Node.__table__
+        receivers = [identity for identity, mapper
+                     in Node.__mapper__.polymorphic_map.items()
+                     if mapper.class_.receive.__func__ is not
+                     Node.receive.__func__]
+
+        def living(receive):
+            """The not-failed nodes whose classes override receive, or not.
+            """
+            criteria = [node_table.c.network_id == self.id,
+                        node_table.c.failed == False]
+            if receive:
+                criteria.append(node_table.c.type.in_(receivers))
+            elif receivers:
+                criteria.append(~node_table.c.type.in_(receivers))
+            return select([node_table.c.id]).where(and_(*criteria))
+
+        def pending(receive):
+            """The criteria of the pending transmissions to those nodes."""
+            return and_(table.c.network_id == self.id,
+                        table.c.status == "pending",
+                        table.c.failed == False,
+                        table.c.destination_id.in_(living(receive)))
+
+        # nodes whose classes override receive must receive for themselves.
+        overridden = []
+        if receivers:
+            overridden = Transmission.query.filter(pending(True))\
+                .order_by(Transmission.id).all()
+            destinations = Node.query.filter(Node.id.in_(
+                set(t.destination_id for t in overridden)))\
+                .order_by(Node.id).all() if overridden else []
+            for node in destinations:
+                node.receive()
+
+        result = session.execute(
+            table.update()
+            .where(pending(False))
+            .values(status="received", receive_time=timenow())
+            .returning(*table.columns))
+        transmissions = sorted(
+            session.query(Transmission).populate_existing().instances(result),
+            key=lambda t: t.id)
+        received = sorted(transmissions + [t for t in overridden
+                                           if t.status == "received"],
+                          key=lambda t: t.id)
+        if not transmissions:
+            return received
+
+        batches = {}
+        for t in transmissions:
+            batches.setdefault(t.destination_id, []).append(t)
+
+        # load (or refresh) the infos and destinations with a query each.
+        infos = dict((i.id, i) for i in Info.query.filter(
+            Info.id.in_(set(t.info_id for t in transmissions))))
+        destinations = Node.query.filter(Node.id.in_(list(batches)))\
+            .order_by(Node.id).all()
+        for node in destinations:
+            node.update([infos[t.info_id] for t in batches[node.id]])
+        return received
+
     def fail(self):
         """Fail an entire network."""
         if self.failed is True:
@@ -549,12 +1314,56 @@ class Network(Base, SharedMixin):
             self.failed = True
             self.time_of_death = timenow()
 
-            for n in self.nodes():
-                n.fail()
+            fail_nodes(Node.network_id == self.id)
 
     def calculate_full(self):
-        """Set whether the network is full."""
-        self.full = len(self.nodes()) >= self.max_size
+        """Set whether the network is full.
+
+        This compares the maintained
+        :attr:`~wallace.models.Network.node_count` with the
+        :attr:`~wallace.models.Network.max_size`, so no nodes are loaded.
+        """
+        self.full = self.node_count >= self.max_size
+
+    def _change_node_count(self, change):
+        """Atomically add change to the node count of the network."""
+        session = object_session(self)
+        if session is None:
+            self.node_count = (self.node_count or 0) + change
+            return
+
+        flush_pending(self)
+        table = Network.__table__
+        count = session.execute(
+            table.update()
+            .where(table.c.id == self.id)
+            .values(node_count=table.c.node_count + change)
+            .returning(table.c.node_count)).scalar()
+        set_committed_value(self, "node_count", count)
+
+    def _vector_added(self, origin, destination):
+        """Update the in-memory indexes with a newly created vector."""
+        adjacency = self.__dict__.get("_adjacency")
+        degrees = self.__dict__.get("_degrees")
+        if adjacency is None and degrees is None:
+            return
+
+        flush_pending(origin, destination)
+        if adjacency is not None:
+            adjacency.add_node(origin.id, type(origin))
+            adjacency.add_node(destination.id, type(destination))
+            adjacency.add_edge(origin.id, destination.id)
+        if degrees is not None:
+            degrees.change(origin.id, 1)
+
+    def _vector_failed(self, origin_id, destination_id):
+        """Update the in-memory indexes with a newly failed vector."""
+        adjacency = self.__dict__.get("_adjacency")
+        if adjacency is not None:
+            adjacency.remove_edge(origin_id, destination_id)
+        degrees = self.__dict__.get("_degrees")
+        if degrees is not None:
+            degrees.change(origin_id, -1)
 
     def print_verbose(self):
         """Print a verbose representation of a network."""
@@ -579,11 +1388,146 @@ class Network(Base, SharedMixin):
             print t
 
 
+#: the temporary table :func:`Network.lineage_tree` materializes lineages
+#: into. It has its own metadata so that it is not created with the others.
+lineage = Table(
+    "lineage", MetaData(),
+    Column("info_id", Integer),
+    Column("parent_id", Integer),
+    Column("root_id", Integer),
+    Column("depth", Integer),
+    Column("path", ARRAY(Integer)),
+    prefixes=["TEMPORARY"])
+
+
+def _node_property(name):
+    """The expression of a column or hybrid property of the nodes.
+
+    A property that :class:`Node` lacks is taken from the first class of
+    node, in order of polymorphic identity, that has it, and is null for
+    the nodes of other classes.
+    """
+    if name in Node.__table__.columns:
+        return Node.__table__.columns[name]
+    polymorphic_map = Node.__mapper__.polymorphic_map
+    for identity in sorted(polymorphic_map):
+        cls = polymorphic_map[identity].class_
+        if hasattr(cls, name):
+            identities = [i for i, m in polymorphic_map.items()
+                          if issubclass(m.class_, cls)]
+            return case([(Node.type.in_(identities), getattr(cls, name))],
+                        else_=null())
+    raise ValueError("{} is not a property of any node".format(name))
+
+
+@event.listens_for(Network, "expire", propagate=True)
+def _discard_network_indexes(target, attrs):
+    """Discard a network's in-memory indexes when it is expired."""
+    if target is not None and attrs is None:
+        target.__dict__.pop("_adjacency", None)
+        target.__dict__.pop("_degrees", None)
+        target.__dict__.pop("_graph", None)
+        target.__dict__.pop("_parents", None)
+
+
+class Snapshot(object):
+    """A network as it was at a moment in time.
+
+    Snapshots are made by :func:`~wallace.models.Network.at` and
+    :func:`~wallace.models.Network.snapshots`. Their methods get the nodes,
+    vectors and infos that were alive at :attr:`time`: those that had been
+    created by then and had not yet failed, whether or not they have failed
+    since. A snapshot made by ``at()`` queries the database each time it is
+    asked (see :func:`~wallace.models.alive_at`), while those made by
+    ``snapshots()`` already hold everything.
+    """
+
+    def __init__(self, network, time, objects=None):
+        """Create a snapshot of a network at a time.
+
+        ``objects`` holds the lists of alive nodes, vectors and infos, by
+        table name, if they have already been found.
+        """
+        #: the network.
+        self.network = network
+        #: the time the snapshot is of.
+        self.time = time
+        self._objects = objects
+
+    def __repr__(self):
+        """The string representation of a snapshot."""
+        return "Snapshot-{}-{}".format(self.network.id, self.time.isoformat())
+
+    def nodes(self, type=None):
+        """Get the nodes that were alive, in order of id.
+
+        type specifies the class of node (defaults to Node).
+        """
+        return self._get(type or Node, "node")
+
+    def vectors(self):
+        """Get the vectors that were alive, in order of id."""
+        return self._get(Vector, "vector")
+
+    def infos(self, type=None, origin=None):
+        """Get the infos that were alive, in order of id.
+
+        type specifies the class of info (defaults to Info). If an origin
+        node is given, only its infos are returned.
+        """
+        infos = self._get(type or Info, "info")
+        if origin is not None:
+            infos = [i for i in infos if i.origin_id == origin.id]
+        return infos
+
+    def state(self, origin=None):
+        """Get the most recently created State that was alive, if any.
+
+        If an origin node (e.g. an environment) is given, only its states
+        are considered.
+        """
+        from wallace.information import State
+        if self._objects is not None:
+            states = self.infos(type=State, origin=origin)
+            if not states:
+                return None
+            return max(states, key=lambda s: (s.creation_time, s.id))
+
+        query = State.query.filter_by(network_id=self.network.id)\
+            .filter(alive_at(State, self.time))
+        if origin is not None:
+            query = query.filter_by(origin_id=origin.id)
+        return self.network._first(query, "info")
+
+    def _get(self, model, table):
+        """The alive objects of a model, in order of id."""
+        if self._objects is not None:
+            return [o for o in self._objects[table] if isinstance(o, model)]
+        flush_pending(self.network)
+        return model.query\
+            .filter_by(network_id=self.network.id)\
+            .filter(alive_at(model, self.time))\
+            .order_by(model.id)\
+            .all()
+
+
 class Node(Base, SharedMixin):
     """A point in a network."""
 
     __tablename__ = "node"
 
+    # for finding the latest and earliest nodes in a network, and for
+    # filtering and sorting them on fitness (real1) and generation
+    # (integer1). Most nodes leave those unset, so only the nodes that set
+    # them are indexed.
+    __table_args__ = (
+        Index("node_network_id_creation_time", "network_id", "creation_time"),
+        Index("node_network_id_real1", "network_id", "real1",
+              postgresql_where=text("real1 IS NOT NULL")),
+        Index("node_network_id_integer1", "network_id", "integer1",
+              postgresql_where=text("integer1 IS NOT NULL")),
+    )
+
     #: A String giving the name of the class. Defaults to
     #: ``node``. This allows subclassing.
     type = Column(String(50))
@@ -621,12 +1565,15 @@ class Node(Base, SharedMixin):
 
         self.network = network
         self.network_id = network.id
+        network._change_node_count(1)
         network.calculate_full()
 
         if participant is not None:
             self.participant = participant
             self.participant_id = participant.id
 
+        network._graph_added(self)
+
     def __repr__(self):
         """The string representation of a node."""
         return "Node-{}-{}".format(self.id, self.type)
@@ -645,7 +1592,12 @@ class Node(Base, SharedMixin):
             "property2": self.property2,
             "property3": self.property3,
             "property4": self.property4,
-            "property5": self.property5
+            "property5": self.property5,
+            "integer1": self.integer1,
+            "integer2": self.integer2,
+            "real1": self.real1,
+            "real2": self.real2,
+            "boolean1": self.boolean1
         }
 
     """ ###################################
@@ -668,39 +1620,22 @@ class Node(Base, SharedMixin):
             raise ValueError("{} is not a valid vector failed".format(failed))
 
         # get the vectors
-        if failed == "all":
-            if direction == "all":
-                return Vector.query\
-                    .filter(or_(Vector.destination_id == self.id,
-                                Vector.origin_id == self.id))\
-                    .all()
-
-            if direction == "incoming":
-                return Vector.query\
-                    .filter_by(destination_id=self.id)\
-                    .all()
-
-            if direction == "outgoing":
-                return Vector.query\
-                    .filter_by(origin_id=self.id)\
-                    .all()
+        flush_pending(self)
+        if direction == "all":
+            query = Vector.query\
+                .filter(or_(Vector.destination_id == self.id,
+                            Vector.origin_id == self.id))
+            column = None
+        elif direction == "incoming":
+            query = Vector.query.filter_by(destination_id=self.id)
+            column = "destination_id"
         else:
-            if direction == "all":
-                return Vector.query\
-                    .filter(and_(Vector.failed == failed,
-                            or_(Vector.destination_id == self.id,
-                                Vector.origin_id == self.id)))\
-                    .all()
-
-            if direction == "incoming":
-                return Vector.query\
-                    .filter_by(destination_id=self.id, failed=failed)\
-                    .all()
-
-            if direction == "outgoing":
-                return Vector.query\
-                    .filter_by(origin_id=self.id, failed=failed)\
-                    .all()
+            query = Vector.query.filter_by(origin_id=self.id)
+            column = "origin_id"
+
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+        return self.network._all(query, "vector", column, self.id)
 
     def neighbors(self, type=None, direction="to", failed=None):
         """Get a node's neighbors - nodes that are directly connected to it.
@@ -735,36 +1670,15 @@ class Node(Base, SharedMixin):
                 "example, getting not-failed nodes connected to you via failed"
                 " vectors, you should do so via sql queries.")
 
-        neighbors = []
         # get the neighbours
-        if direction == "to":
-            outgoing_vectors = Vector.query\
-                .with_entities(Vector.destination_id)\
-                .filter_by(origin_id=self.id, failed=False).all()
-
-            neighbor_ids = [v.destination_id for v in outgoing_vectors]
-            if neighbor_ids:
-                neighbors = Node.query.filter(Node.id.in_(neighbor_ids)).all()
-                neighbors = [n for n in neighbors if isinstance(n, type)]
-
-        if direction == "from":
-            incoming_vectors = Vector.query.with_entities(Vector.origin_id)\
-                .filter_by(destination_id=self.id, failed=False).all()
-
-            neighbor_ids = [v.origin_id for v in incoming_vectors]
-            if neighbor_ids:
-                neighbors = Node.query.filter(Node.id.in_(neighbor_ids)).all()
-                neighbors = [n for n in neighbors if isinstance(n, type)]
-
-        if direction == "either":
-            neighbors = list(set(self.neighbors(type=type, direction="to") +
-                                 self.neighbors(type=type, direction="from")))
+        flush_pending(self)
+        index = self.network.adjacency()
+        neighbor_ids = [
+            i for i in index.neighbors(self.id, direction=direction)
+            if i not in index.types or issubclass(index.types[i], type)]
 
-        if direction == "both":
-            neighbors = list(set(self.neighbors(type=type, direction="to")) &
-                             set(self.neighbors(type=type, direction="from")))
-
-        return neighbors
+        neighbors = get_all(object_session(self), Node, neighbor_ids)
+        return [n for n in neighbors if isinstance(n, type)]
 
     def is_connected(self, whom, direction="to", failed=None):
         """Check whether this node is connected [to/from] whom.
@@ -793,8 +1707,6 @@ class Node(Base, SharedMixin):
             whom = [whom]
             is_list = False
 
-        whom_ids = [n.id for n in whom]
-
         # check whom contains only Nodes
         for node in whom:
             if not isinstance(node, Node):
@@ -807,40 +1719,10 @@ class Node(Base, SharedMixin):
                              .format(direction))
 
         # get is_connected
-        connected = []
-        if direction == "to":
-            vectors = Vector.query.with_entities(Vector.destination_id)\
-                .filter_by(origin_id=self.id, failed=False).all()
-            destinations = set([v.destination_id for v in vectors])
-            for w in whom_ids:
-                connected.append(w in destinations)
-
-        elif direction == "from":
-            vectors = Vector.query.with_entities(Vector.origin_id)\
-                .filter_by(destination_id=self.id, failed=False).all()
-            origins = set([v.origin_id for v in vectors])
-            for w in whom_ids:
-                connected.append(w in origins)
-
-        elif direction in ["either", "both"]:
-
-            vectors = Vector.query\
-                .with_entities(Vector.origin_id, Vector.destination_id)\
-                .filter(and_(Vector.failed == False,
-                             or_(Vector.destination_id == self.id,
-                                 Vector.origin_id == self.id))).all()
-
-            destinations = set([v.destination_id for v in vectors])
-            origins = set([v.origin_id for v in vectors])
-
-            if direction == "either":
-                origins_destinations = destinations.union(origins)
-
-            elif direction == "both":
-                origins_destinations = destinations.intersection(origins)
-
-            for w in whom_ids:
-                connected.append(w in origins_destinations)
+        flush_pending(self, *whom)
+        neighbor_ids = self.network.adjacency().neighbors(
+            self.id, direction=direction)
+        connected = [w.id in neighbor_ids for w in whom]
 
         if is_list:
             return connected
@@ -854,6 +1736,32 @@ class Node(Base, SharedMixin):
         ``Info``. Failed can be True, False or "all".
 
         """
+        return self.network._all(self._infos_query(type, failed), "info",
+                                 "origin_id", self.id)
+
+    def latest(self, type=None, failed=False, where=None):
+        """Get the most recently created info that originates from this node.
+
+        Type must be a subclass of :class:`~wallace.models.Info`, the default
+        is ``Info``. Failed can be True, False or "all" and where is an
+        optional SQL criterion. Ties are broken by id. The database finds it
+        with ``ORDER BY creation_time DESC, id DESC LIMIT 1``. Return None if
+        there is none.
+        """
+        return self.network._first(self._infos_query(type, failed, where),
+                                   "info", column="origin_id", value=self.id)
+
+    def earliest(self, type=None, failed=False, where=None):
+        """Get the first created info that originates from this node.
+
+        Takes the same arguments as :func:`~wallace.models.Node.latest`.
+        """
+        return self.network._first(self._infos_query(type, failed, where),
+                                   "info", latest=False, column="origin_id",
+                                   value=self.id)
+
+    def _infos_query(self, type=None, failed=False, where=None):
+        """The query behind infos(), latest() and earliest()."""
         if type is None:
             type = Info
 
@@ -865,16 +1773,13 @@ class Node(Base, SharedMixin):
         if failed not in ["all", False, True]:
             raise ValueError("{} is not a valid vector failed".format(failed))
 
-        if failed == "all":
-            return type\
-                .query\
-                .filter_by(origin_id=self.id)\
-                .all()
-        else:
-            return type\
-                .query\
-                .filter_by(origin_id=self.id, failed=failed)\
-                .all()
+        flush_pending(self)
+        query = type.query.filter_by(origin_id=self.id)
+        if failed != "all":
+            query = query.filter_by(failed=failed)
+        if where is not None:
+            query = query.filter(where)
+        return query
 
     def received_infos(self, type=None, failed=None):
         """Get infos that have been sent to this node.
@@ -900,6 +1805,17 @@ class Node(Base, SharedMixin):
                             "as it is not a valid type."
                             .format(type)))
 
+        flush_pending(self)
+        if self.network.__dict__.get("_graph") is not None:
+            transmissions = self.network._all(
+                Transmission.query.filter_by(destination_id=self.id,
+                                             status="received",
+                                             failed=False),
+                "transmission", "destination_id", self.id)
+            infos = get_all(object_session(self), Info,
+                            sorted(set(t.info_id for t in transmissions)))
+            return [i for i in infos if isinstance(i, type)]
+
         transmissions = Transmission\
             .query.with_entities(Transmission.info_id)\
             .filter_by(destination_id=self.id,
@@ -935,42 +1851,23 @@ class Node(Base, SharedMixin):
                              .format(failed))
 
         # get transmissions
+        flush_pending(self)
         if direction == "all":
-            if status == "all":
-                return Transmission.query\
-                    .filter(and_(Transmission.failed == False,
-                                 or_(Transmission.destination_id == self.id,
-                                     Transmission.origin_id == self.id)))\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter(and_(Transmission.failed == False,
-                                 Transmission.status == status,
-                                 or_(Transmission.destination_id == self.id,
-                                     Transmission.origin_id == self.id)))\
-                    .all()
-        if direction == "incoming":
-            if status == "all":
-                return Transmission.query\
-                    .filter_by(failed=False, destination_id=self.id)\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter(and_(Transmission.failed == False,
-                                 Transmission.destination_id == self.id,
-                                 Transmission.status == status))\
-                    .all()
-        if direction == "outgoing":
-            if status == "all":
-                return Transmission.query\
-                    .filter_by(failed=False, origin_id=self.id)\
-                    .all()
-            else:
-                return Transmission.query\
-                    .filter(and_(Transmission.failed == False,
-                                 Transmission.origin_id == self.id,
-                                 Transmission.status == status))\
-                    .all()
+            query = Transmission.query\
+                .filter(or_(Transmission.destination_id == self.id,
+                            Transmission.origin_id == self.id))
+            column = None
+        elif direction == "incoming":
+            query = Transmission.query.filter_by(destination_id=self.id)
+            column = "destination_id"
+        else:
+            query = Transmission.query.filter_by(origin_id=self.id)
+            column = "origin_id"
+
+        query = query.filter_by(failed=False)
+        if status != "all":
+            query = query.filter_by(status=status)
+        return self.network._all(query, "transmission", column, self.id)
 
     def transformations(self, type=None, failed=False):
         """
@@ -1019,18 +1916,8 @@ class Node(Base, SharedMixin):
             raise AttributeError(
                 "Cannot fail {} - it has already failed.".format(self))
         else:
-            self.failed = True
-            self.time_of_death = timenow()
-            self.network.calculate_full()
-
-            for v in self.vectors():
-                v.fail()
-            for i in self.infos():
-                i.fail()
-            for t in self.transmissions(direction="all"):
-                t.fail()
-            for t in self.transformations():
-                t.fail()
+            flush_pending(self)
+            fail_nodes(Node.id == self.id)
 
     def connect(self, whom, direction="to"):
         """Create a vector from self to/from whom.
@@ -1065,37 +1952,47 @@ class Node(Base, SharedMixin):
         # make whom a list
         whom = self.flatten([whom])
 
+        # check whom contains only Nodes
+        for node in whom:
+            if not isinstance(node, Node):
+                raise TypeError("connect cannot parse objects of type {}."
+                                .format(type(node)))
+
         # make the connections
-        new_vectors = []
+        flush_pending(self, *whom)
+        index = self.network.adjacency()
+        pairs = []
         if direction in ["to", "both"]:
-            already_connected_to = self.flatten(
-                [self.is_connected(direction="to", whom=whom)])
-            for node, connected in zip(whom, already_connected_to):
-                if connected:
+            for node in whom:
+                if index.is_connected(self.id, node.id):
                     print("Warning! {} already connected to {}, "
                           "instruction to connect will be ignored."
                           .format(self, node))
                 else:
-                    new_vectors.append(Vector(origin=self, destination=node))
+                    pairs.append((self, node))
         if direction in ["from", "both"]:
-            already_connected_from = self.flatten(
-                [self.is_connected(direction="from", whom=whom)])
-            for node, connected in zip(whom, already_connected_from):
-                if connected:
+            for node in whom:
+                if index.is_connected(node.id, self.id):
                     print("Warning! {} already connected from {}, "
                           "instruction to connect will be ignored."
                           .format(self, node))
                 else:
-                    new_vectors.append(Vector(origin=node, destination=self))
-        return new_vectors
+                    pairs.append((node, self))
+        return self.network.add_vectors(pairs)
 
     def flatten(self, l):
         """Turn a list of lists into a list."""
-        if l == []:
-            return l
-        if isinstance(l[0], list):
-            return self.flatten(l[0]) + self.flatten(l[1:])
-        return l[:1] + self.flatten(l[1:])
+        flat = []
+        stack = [iter(l)]
+        while stack:
+            for item in stack[-1]:
+                if isinstance(item, list):
+                    stack.append(iter(item))
+                    break
+                flat.append(item)
+            else:
+                stack.pop()
+        return flat
 
     def transmit(self, what=None, to_whom=None):
         """Transmit one or more infos from one node to another.
@@ -1119,50 +2016,56 @@ class Node(Base, SharedMixin):
             (3) to_whom is/contains a node that the transmitting node does not
                 have a not-failed connection with.
         """
-        # make the list of what
-        what = self.flatten([what])
-        for i in range(len(what)):
-            if what[i] is None:
-                what[i] = self._what()
-            elif inspect.isclass(what[i]) and issubclass(what[i], Info):
-                what[i] = self.infos(type=what[i])
-        what = self.flatten(what)
-        for i in range(len(what)):
-            if inspect.isclass(what[i]) and issubclass(what[i], Info):
-                what[i] = self.infos(type=what[i])
-        what = list(set(self.flatten(what)))
-
-        # make the list of to_whom
-        to_whom = self.flatten([to_whom])
-        for i in range(len(to_whom)):
-            if to_whom[i] is None:
-                to_whom[i] = self._to_whom()
-            elif inspect.isclass(to_whom[i]) and issubclass(to_whom[i], Node):
-                to_whom[i] = self.neighbors(direction="to", type=to_whom[i])
-        to_whom = self.flatten(to_whom)
-        for i in range(len(to_whom)):
-            if inspect.isclass(to_whom[i]) and issubclass(to_whom[i], Node):
-                to_whom[i] = self.neighbors(direction="to", type=to_whom[i])
-        to_whom = list(set(self.flatten(to_whom)))
-
-        transmissions = []
-        vectors = self.vectors(direction="outgoing")
-        for w in what:
-            for tw in to_whom:
-                try:
-                    vector = [v for v in vectors
-                              if v.destination_id == tw.id][0]
-                except:
-                    raise ValueError(
-                        "{} cannot transmit to {} as it does not have "
-                        "a connection to them".format(self, tw))
-                t = Transmission(info=w, vector=vector)
-                transmissions.append(t)
+        what = self._transmit_targets(what, self._what, Info, self.infos)
+        to_whom = self._transmit_targets(
+            to_whom, self._to_whom, Node,
+            lambda type: self.neighbors(direction="to", type=type))
+
+        flush_pending(self, *to_whom)
+        vectors = dict((v.destination_id, v)
+                       for v in self.vectors(direction="outgoing"))
+        for tw in to_whom:
+            if tw.id not in vectors:
+                raise ValueError(
+                    "{} cannot transmit to {} as it does not have "
+                    "a connection to them".format(self, tw))
+
+        transmissions = self.network.add_transmissions(
+            [(vectors[tw.id], w) for w in what for tw in to_whom])
         if len(transmissions) == 1:
             return transmissions[0]
         else:
             return transmissions
 
+    def _transmit_targets(self, targets, default, base, get):
+        """Make the list of what or to_whom for transmit().
+
+        None is replaced with default() and subclasses of base with the
+        objects of those classes that get(type) returns, which is called
+        once however many classes there are. Repeats are dropped.
+        """
+        targets = self.flatten([targets])
+        targets = self.flatten([default() if t is None else t
+                                for t in targets])
+
+        def is_type(t):
+            return inspect.isclass(t) and issubclass(t, base)
+
+        types = tuple(t for t in targets if is_type(t))
+        found = [t for t in targets if not is_type(t)]
+        if types:
+            found.extend(obj for obj in get(types[0] if len(types) == 1
+                                            else base)
+                         if isinstance(obj, types))
+
+        unique = []
+        seen = set()
+        for obj in found:
+            if obj not in seen:
+                seen.add(obj)
+                unique.append(obj)
+        return unique
+
     def _what(self):
         """What to transmit if what is not specified.
 
@@ -1274,6 +2177,11 @@ class Vector(Base, SharedMixin):
 
     __tablename__ = "vector"
 
+    # for finding the vectors of a network that were alive at a time.
+    __table_args__ = (
+        Index("vector_network_id_creation_time", "network_id", "creation_time"),
+    )
+
     #: the id of the Node at which the vector originates
     origin_id = Column(Integer, ForeignKey('node.id'), index=True)
 
@@ -1296,6 +2204,20 @@ class Vector(Base, SharedMixin):
 
     def __init__(self, origin, destination):
         """Create a vector."""
+        self._check_endpoints(origin, destination)
+
+        self.origin = origin
+        self.origin_id = origin.id
+        self.destination = destination
+        self.destination_id = destination.id
+        self.network = origin.network
+        self.network_id = origin.network_id
+        self.network._vector_added(origin, destination)
+        self.network._graph_added(self)
+
+    @staticmethod
+    def _check_endpoints(origin, destination):
+        """Raise an error if origin cannot connect to destination."""
         # check origin and destination are in the same network
         if origin.network_id != destination.network_id:
             raise ValueError("{}, in network {}, cannot connect with {} "
@@ -1321,13 +2243,6 @@ class Vector(Base, SharedMixin):
         if origin == destination:
             raise ValueError("{} cannot connect to itself.".format(origin))
 
-        self.origin = origin
-        self.origin_id = origin.id
-        self.destination = destination
-        self.destination_id = destination.id
-        self.network = origin.network
-        self.network_id = origin.network_id
-
     def __repr__(self):
         """The string representation of a vector."""
         return "Vector-{}-{}".format(
@@ -1348,7 +2263,12 @@ class Vector(Base, SharedMixin):
             "property2": self.property2,
             "property3": self.property3,
             "property4": self.property4,
-            "property5": self.property5
+            "property5": self.property5,
+            "integer1": self.integer1,
+            "integer2": self.integer2,
+            "real1": self.real1,
+            "real2": self.real2,
+            "boolean1": self.boolean1
         }
 
     """#######################################
@@ -1391,9 +2311,12 @@ class Vector(Base, SharedMixin):
         else:
             self.failed = True
             self.time_of_death = timenow()
+            self.network._vector_failed(self.origin_id, self.destination_id)
 
-            for t in self.transmissions():
-                t.fail()
+            session = object_session(self)
+            session.flush()
+            fail_where(session, Transmission,
+                       Transmission.vector_id == self.id, self.time_of_death)
 
 
 class Info(Base, SharedMixin):
@@ -1401,6 +2324,13 @@ class Info(Base, SharedMixin):
 
     __tablename__ = "info"
 
+    # for finding the latest and earliest infos in a network or of a node.
+    __table_args__ = (
+        Index("info_network_id_creation_time", "network_id", "creation_time"),
+        Index("info_origin_id_type_creation_time",
+              "origin_id", "type", "creation_time"),
+    )
+
     #: a String giving the name of the class. Defaults to "info".
     #: This allows subclassing.
     type = Column(String(50))
@@ -1436,6 +2366,7 @@ class Info(Base, SharedMixin):
         self.contents = contents
         self.network_id = origin.network_id
         self.network = origin.network
+        self.network._graph_added(self)
 
     @validates("contents")
     def _write_once(self, key, value):
@@ -1463,7 +2394,12 @@ class Info(Base, SharedMixin):
             "property2": self.property2,
             "property3": self.property3,
             "property4": self.property4,
-            "property5": self.property5
+            "property5": self.property5,
+            "integer1": self.integer1,
+            "integer2": self.integer2,
+            "real1": self.real1,
+            "real2": self.real2,
+            "boolean1": self.boolean1
         }
 
     def fail(self):
@@ -1480,10 +2416,68 @@ class Info(Base, SharedMixin):
             self.failed = True
             self.time_of_death = timenow()
 
-            for t in self.transmissions():
-                t.fail()
-            for t in self.transformations():
-                t.fail()
+            session = object_session(self)
+            session.flush()
+            fail_where(session, Transmission,
+                       Transmission.info_id == self.id, self.time_of_death)
+            fail_where(session, Transformation,
+                       or_(Transformation.info_in_id == self.id,
+                           Transformation.info_out_id == self.id),
+                       self.time_of_death)
+
+    def ancestors(self, failed=False):
+        """Get the infos this info was made from.
+
+        Follow transformations back from this info to the info it was made
+        from, and so on, to the infos that were not made from any other.
+        Return a list of (info, depth) tuples, where depth is the number of
+        transformations between that info and this one, nearest first. The
+        whole lineage is fetched with a single recursive query. ``failed``
+        filters the transformations followed and can be False (default),
+        True or "all".
+        """
+        return self._lineage(Transformation.info_out_id,
+                             Transformation.info_in_id, failed)
+
+    def descendants(self, failed=False):
+        """Get the infos made from this info.
+
+        Follow transformations forward from this info to the infos made from
+        it, and so on. Return a list of (info, depth) tuples, nearest first,
+        as :func:`~wallace.models.Info.ancestors` does.
+        """
+        return self._lineage(Transformation.info_in_id,
+                             Transformation.info_out_id, failed)
+
+    def _lineage(self, start, follow, failed):
+        """The infos reached by following transformations from this info.
+
+        ``start`` is the transformation column holding the id of the info
+        already reached and ``follow`` the column holding the next one.
+        """
+        if failed not in ["all", False, True]:
+            raise ValueError("{} is not a valid failed".format(failed))
+
+        criteria = []
+        if failed != "all":
+            criteria.append(Transformation.failed == failed)
+
+        reached = select([follow.label("info_id"), literal(1).label("depth")])\
+            .where(and_(start == self.id, *criteria))\
+            .cte("reached", recursive=True)
+        previous = reached.alias("previous")
+        reached = reached.union(
+            select([follow, previous.c.depth + 1])
+            .where(and_(start == previous.c.info_id, *criteria)))
+
+        # an info can be reached along several paths, keep the shortest.
+        depth = func.min(reached.c.depth)
+        return [(info, d) for info, d in Info.query
+                .join(reached, Info.id == reached.c.info_id)
+                .add_columns(depth)
+                .group_by(Info.id)
+                .order_by(depth, Info.id)
+                .all()]
 
     def transmissions(self, status="all"):
         """Get all the transmissions of this info.
@@ -1566,6 +2560,14 @@ class Transmission(Base, SharedMixin):
 
     __tablename__ = "transmission"
 
+    # for finding the latest transmissions in a network.
+    __table_args__ = (
+        Index("transmission_network_id_creation_time",
+              "network_id", "creation_time"),
+        Index("transmission_network_id_receive_time",
+              "network_id", "receive_time"),
+    )
+
     #: the id of the vector the info was sent along
     vector_id = Column(Integer, ForeignKey('vector.id'), index=True)
 
@@ -1609,6 +2611,23 @@ class Transmission(Base, SharedMixin):
 
     def __init__(self, vector, info):
         """Create a transmission."""
+        self._check(vector, info)
+
+        self.vector_id = vector.id
+        self.vector = vector
+        self.info_id = info
+        self.info = info
+        self.origin_id = vector.origin_id
+        self.origin = vector.origin
+        self.destination_id = vector.destination_id
+        self.destination = vector.destination
+        self.network_id = vector.network_id
+        self.network = vector.network
+        self.network._graph_added(self)
+
+    @staticmethod
+    def _check(vector, info):
+        """Raise an error if info cannot be transmitted along vector."""
         # check vector is not failed
         if vector.failed:
             raise ValueError("Cannot transmit along {} as it has failed."
@@ -1624,17 +2643,6 @@ class Transmission(Base, SharedMixin):
             raise ValueError("Cannot transmit {} along {} as they do not "
                              "have the same origin".format(info, vector))
 
-        self.vector_id = vector.id
-        self.vector = vector
-        self.info_id = info
-        self.info = info
-        self.origin_id = vector.origin_id
-        self.origin = vector.origin
-        self.destination_id = vector.destination_id
-        self.destination = vector.destination
-        self.network_id = vector.network_id
-        self.network = vector.network
-
     def mark_received(self):
         """Mark a transmission as having been received."""
         self.receive_time = timenow()
@@ -1662,7 +2670,12 @@ class Transmission(Base, SharedMixin):
             "property2": self.property2,
             "property3": self.property3,
             "property4": self.property4,
-            "property5": self.property5
+            "property5": self.property5,
+            "integer1": self.integer1,
+            "integer2": self.integer2,
+            "real1": self.real1,
+            "real2": self.real2,
+            "boolean1": self.boolean1
         }
 
     def fail(self):
@@ -1722,10 +2735,25 @@ class Transformation(Base, SharedMixin):
         """Create a transformation."""
         # check info_in is from the same node as info_out
         # or has been sent to the same node
-        if (info_in.origin_id != info_out.origin_id and
-            info_in.id not in [
-                t.info_id for t in info_out.origin.transmissions(
-                    direction="incoming", status="received")]):
+        network = info_out.network
+        if info_in.origin_id == info_out.origin_id:
+            received = True
+        elif network is not None and \
+                network.__dict__.get("_graph") is not None:
+            flush_pending(info_in, info_out)
+            received = network._all(
+                Transmission.query.filter_by(info_id=info_in.id,
+                                             status="received",
+                                             failed=False),
+                "transmission", "destination_id", info_out.origin_id)
+        else:
+            query = Transmission.query.filter(
+                Transmission.info == info_in,
+                Transmission.destination == info_out.origin,
+                Transmission.status == "received",
+                Transmission.failed == False)
+            received = query.session.query(query.exists()).scalar()
+        if not received:
             raise ValueError(
                 "Cannot transform {} into {} as they are not at the same node."
                 .format(info_in, info_out))
@@ -1760,7 +2788,12 @@ class Transformation(Base, SharedMixin):
             "property2": self.property2,
             "property3": self.property3,
             "property4": self.property4,
-            "property5": self.property5
+            "property5": self.property5,
+            "integer1": self.integer1,
+            "integer2": self.integer2,
+            "real1": self.real1,
+            "real2": self.real2,
+            "boolean1": self.boolean1
         }
 
     def fail(self):
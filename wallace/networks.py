@@ -1,9 +1,10 @@
 """Network structures commonly used in simulations of evolution."""
 
-from .models import Network, Node
+from .models import Network, Node, flush_pending, get_all
 from .nodes import Source
-import random
+from .sampling import WeightedSampler
 from operator import attrgetter
+from sqlalchemy.orm import object_session
 
 
 class Chain(Network):
@@ -16,14 +17,14 @@ class Chain(Network):
 
     def add_node(self, node):
         """Add an agent, connecting it to the previous node."""
-        other_nodes = [n for n in self.nodes() if n.id != node.id]
+        flush_pending(node)
+        parent = self.latest(where=Node.id != node.id)
 
-        if isinstance(node, Source) and other_nodes:
+        if isinstance(node, Source) and parent is not None:
             raise(Exception("Chain network already has a nodes, "
                             "can't add a source."))
 
-        if other_nodes:
-            parent = max(other_nodes, key=attrgetter('creation_time'))
+        if parent is not None:
             parent.connect(whom=node)
 
 
@@ -36,11 +37,12 @@ class FullyConnected(Network):
         """Add a node, connecting it to everyone and back."""
         other_nodes = [n for n in self.nodes() if n.id != node.id]
 
+        pairs = []
         for n in other_nodes:
-            if isinstance(n, Source):
-                node.connect(direction="from", whom=n)
-            else:
-                node.connect(direction="both", whom=n)
+            if not isinstance(n, Source):
+                pairs.append((node, n))
+            pairs.append((n, node))
+        self.add_vectors(pairs)
 
 
 class Empty(Network):
@@ -55,7 +57,7 @@ class Empty(Network):
     def add_source(self, source):
         """Connect the source to all existing other nodes."""
         nodes = [n for n in self.nodes() if not isinstance(n, Source)]
-        source.connect(whom=nodes)
+        self.add_vectors([(source, n) for n in nodes])
 
 
 class Star(Network):
@@ -69,11 +71,8 @@ class Star(Network):
 
     def add_node(self, node):
         """Add a node and connect it to the center."""
-        nodes = self.nodes()
-
-        if len(nodes) > 1:
-            first_node = min(nodes, key=attrgetter('creation_time'))
-            first_node.connect(direction="both", whom=node)
+        if self.count_nodes() > 1:
+            self.earliest().connect(direction="both", whom=node)
 
 
 class Burst(Network):
@@ -87,11 +86,8 @@ class Burst(Network):
 
     def add_node(self, node):
         """Add a node and connect it to the center."""
-        nodes = self.nodes()
-
-        if len(nodes) > 1:
-            first_node = min(nodes, key=attrgetter('creation_time'))
-            first_node.connect(whom=node)
+        if self.count_nodes() > 1:
+            self.earliest().connect(whom=node)
 
 
 class DiscreteGenerational(Network):
@@ -137,38 +133,38 @@ class DiscreteGenerational(Network):
 
     def add_node(self, node):
         """Link the agent to a random member of the previous generation."""
-        nodes = [n for n in self.nodes() if not isinstance(n, Source)]
-        num_agents = len(nodes)
+        num_agents = self.count_nodes() - self.count_nodes(type=Source)
         curr_generation = int((num_agents - 1) / float(self.generation_size))
         node.generation = curr_generation
 
         if curr_generation == 0:
             if self.initial_source:
-                source = min(
-                    self.nodes(type=Source),
-                    key=attrgetter('creation_time'))
+                source = self.earliest(type=Source)
                 source.connect(whom=node)
                 source.transmit(to_whom=node)
         else:
-            prev_agents = Node.query\
-                .filter_by(failed=False,
-                           network_id=self.id,
-                           generation=(curr_generation - 1))\
-                .all()
-            prev_fits = [p.fitness for p in prev_agents]
-            prev_probs = [(f / (1.0 * sum(prev_fits))) for f in prev_fits]
-
-            rnd = random.random()
-            temp = 0.0
-            for i, probability in enumerate(prev_probs):
-                temp += probability
-                if temp > rnd:
-                    parent = prev_agents[i]
-                    break
-
+            parent = self.parents(curr_generation - 1).choice()
             parent.connect(whom=node)
             parent.transmit(to_whom=node)
 
+    def parents(self, generation):
+        """Get a sampler drawing agents of a generation by their fitness.
+
+        Return a :class:`~wallace.sampling.WeightedSampler` over the
+        not-failed agents of the generation. Once a generation is complete
+        it no longer changes, so the sampler is built once and is then kept,
+        like the network's other indexes, until the network is expired (e.g.
+        on commit or rollback).
+        """
+        samplers = self.__dict__.setdefault("_parents", {})
+        if generation not in samplers:
+            agents = [n for n in self.nodes()
+                      if not isinstance(n, Source) and
+                      getattr(n, "generation", None) == generation]
+            samplers[generation] = WeightedSampler(
+                agents, [a.fitness for a in agents])
+        return samplers[generation]
+
 
 class ScaleFree(Network):
     """Barabasi-Albert (1999) model of a scale-free network.
@@ -198,38 +194,27 @@ class ScaleFree(Network):
         return int(self.property2)
 
     def add_node(self, node):
-        """Add newcomers one by one, using linear preferential attachment."""
-        nodes = self.nodes()
+        """Add newcomers one by one, using linear preferential attachment.
 
+        Newcomers are attached to m distinct existing nodes drawn with
+        probability proportional to their out-degree, using the network's
+        :func:`~wallace.models.Network.degrees` index.
+        """
         # Start with a core of m0 fully-connected agents...
-        if len(nodes) <= self.m0:
-            other_nodes = [n for n in nodes if n.id != node.id]
-            for n in other_nodes:
-                node.connect(direction="both", whom=n)
+        if self.node_count <= self.m0:
+            other_nodes = [n for n in self.nodes() if n.id != node.id]
+            node.connect(direction="both", whom=other_nodes)
 
         # ...then add newcomers one by one with preferential attachment.
         else:
-            for idx_newvector in xrange(self.m):
-
-                these_nodes = [
-                    n for n in nodes if (
-                        n.id != node.id and
-                        not n.is_connected(direction="either", whom=node))]
-
-                outdegrees = [
-                    len(n.vectors(direction="outgoing")) for n in these_nodes]
-
-                # Select a member using preferential attachment
-                ps = [(d / (1.0 * sum(outdegrees))) for d in outdegrees]
-                rnd = random.random() * sum(ps)
-                cur = 0.0
-                for i, p in enumerate(ps):
-                    cur += p
-                    if rnd < cur:
-                        vector_to = these_nodes[i]
+            flush_pending(node)
+            exclude = self.adjacency().neighbors(node.id, direction="either")
+            exclude.add(node.id)
+            ids = self.degrees().sample(self.m, exclude=exclude)
+            targets = get_all(object_session(self), Node, ids)
 
-                # Create vector from newcomer to selected member and back
-                node.connect(direction="both", whom=vector_to)
+            # Create vectors from newcomer to selected members and back
+            node.connect(direction="both", whom=targets)
 
 
 class SequentialMicrosociety(Network):
@@ -256,5 +241,4 @@ class SequentialMicrosociety(Network):
 
         connecting_nodes = other_nodes[0:(self.n - 1)]
 
-        for n in connecting_nodes:
-            n.connect(whom=node)
+        self.add_vectors([(n, node) for n in connecting_nodes])
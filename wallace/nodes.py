@@ -1,11 +1,8 @@
 """Define kinds of nodes: agents, sources, and environments."""
 
-from wallace.models import Node, Info
+from wallace.models import Node, Info, alive_at
 from wallace.information import State
-from sqlalchemy import Integer
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.sql.expression import cast
-from operator import attrgetter
 import random
 
 
@@ -17,20 +14,17 @@ class Agent(Node):
     @hybrid_property
     def fitness(self):
         """Endow agents with a numerical fitness."""
-        try:
-            return float(self.property1)
-        except TypeError:
-            return None
+        return self.real1
 
     @fitness.setter
     def fitness(self, fitness):
-        """Assign fitness to property1."""
-        self.property1 = repr(fitness)
+        """Assign fitness to real1."""
+        self.real1 = fitness
 
     @fitness.expression
     def fitness(self):
-        """Retrieve fitness via property1."""
-        return cast(self.property1, Integer)
+        """Retrieve fitness via real1."""
+        return self.real1
 
 
 class ReplicatorAgent(Agent):
@@ -96,14 +90,15 @@ class Environment(Node):
     def state(self, time=None):
         """The most recently-created info of type State at the specfied time.
 
-        If time is None then it returns the most recent state as of now.
+        If time is None then it returns the most recent state as of now,
+        otherwise the most recent of the states that were alive at that time
+        (see :func:`~wallace.models.Network.at`).
         """
         if time is None:
-            return max(self.infos(type=State), key=attrgetter('creation_time'))
+            return self.latest(type=State)
         else:
-            states = [
-                s for s in self.infos(type=State) if s.creation_time < time]
-            return max(states, key=attrgetter('creation_time'))
+            return self.latest(type=State, failed="all",
+                               where=alive_at(State, time))
 
     def _what(self):
         """Return the most recent state."""
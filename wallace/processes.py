@@ -1,6 +1,11 @@
-"""Processes manipulate networks and their parts."""
+"""Processes manipulate networks and their parts.
+
+Each process takes a single step. To run many steps of random_walk or
+moran_cultural at once, see :class:`~wallace.simulation.Simulation`.
+"""
 
 from nodes import Agent, Source
+from sampling import WeightedSampler
 import random
 
 
@@ -36,11 +41,7 @@ def moran_cultural(network):
         replaced = random.choice(
             replacer.neighbors(direction="to", type=Agent))
 
-        from operator import attrgetter
-
-        replacer.transmit(
-            what=max(replacer.infos(), key=attrgetter('creation_time')),
-            to_whom=replaced)
+        replacer.transmit(what=replacer.latest(), to_whom=replaced)
 
 
 def moran_sexual(network):
@@ -54,10 +55,8 @@ def moran_sexual(network):
         replacer = random.choice(network.nodes(type=Source))
         replacer.transmit()
     else:
-        from operator import attrgetter
-        agents = network.nodes(type=Agent)
-        baby = max(agents, key=attrgetter('creation_time'))
-        agents = [a for a in agents if a.id != baby.id]
+        baby = network.latest(type=Agent)
+        agents = [a for a in network.nodes(type=Agent) if a.id != baby.id]
         replacer = random.choice(agents)
         replaced = random.choice(
             replacer.neighbors(direction="to", type=Agent))
@@ -78,17 +77,16 @@ def moran_sexual(network):
 
 
 def transmit_by_fitness(from_whom, to_whom=None, what=None):
-    """Choose a parent with probability proportional to their fitness."""
-    parents = from_whom
-    parent_fs = [p.fitness for p in parents]
-    parent_probs = [(f / (1.0 * sum(parent_fs))) for f in parent_fs]
-
-    rnd = random.random()
-    temp = 0.0
-    for i, probability in enumerate(parent_probs):
-        temp += probability
-        if temp > rnd:
-            parent = parents[i]
-            break
-
+    """Choose a parent with probability proportional to their fitness.
+
+    Parents whose fitness is None are treated as having a fitness of zero.
+    A ValueError is raised if none of the parents has a positive fitness.
+    ``from_whom`` can also be a :class:`~wallace.sampling.WeightedSampler`
+    of the parents, e.g. from
+    :func:`~wallace.networks.DiscreteGenerational.parents`, so that one
+    sampler can be reused for many choices.
+    """
+    if not isinstance(from_whom, WeightedSampler):
+        from_whom = WeightedSampler(from_whom, [p.fitness for p in from_whom])
+    parent = from_whom.choice()
     parent.transmit(what=what, to_whom=to_whom)
@@ -0,0 +1,134 @@
+"""Count the SQL statements run by a block of code.
+
+Many model methods query the database, and calling them in a loop can
+quietly turn one query into hundreds. :func:`query_budget` counts the
+statements run inside a ``with`` block, grouped by the line of code that
+ran them, and complains if there are more than expected::
+
+    with query_budget(2):
+        participant.infos()
+
+Statements are counted with SQLAlchemy engine events on
+:data:`wallace.db.engine`, so only statements run by the current thread are
+counted.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import os
+import threading
+import traceback
+import warnings
+
+import sqlalchemy
+from sqlalchemy import event
+
+from wallace import db
+
+
+class QueryBudgetExceeded(AssertionError):
+    """More SQL statements were run than a query budget allows."""
+
+
+class QueryCounter(object):
+    """The SQL statements run inside a :func:`count_queries` block."""
+
+    def __init__(self):
+        """Create an empty counter."""
+        #: a list of (statement, call site) tuples, in the order they ran.
+        self.statements = []
+
+    @property
+    def count(self):
+        """The number of statements run."""
+        return len(self.statements)
+
+    def by_call_site(self):
+        """The number of statements run from each call site.
+
+        Return a list of (call site, count) tuples, most statements first.
+        """
+        counts = defaultdict(int)
+        for _, call_site in self.statements:
+            counts[call_site] += 1
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def report(self):
+        """A summary of the statements run from each call site."""
+        return "\n".join("{:>5}  {}".format(n, call_site)
+                         for call_site, n in self.by_call_site())
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements run inside a block.
+
+    Yields a :class:`QueryCounter` that fills up as statements are run.
+    Blocks can be nested, each counter counts every statement run while it
+    is open.
+    """
+    counter = QueryCounter()
+    counters = _counters()
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+@contextmanager
+def query_budget(n, warn=False):
+    """Allow at most n SQL statements to be run inside a block.
+
+    If more are run, :class:`QueryBudgetExceeded` is raised at the end of the
+    block, with a report of where the statements came from. If ``warn`` is
+    True a ``RuntimeWarning`` is issued instead. Nothing is checked if the
+    block raises an exception.
+    """
+    with count_queries() as counter:
+        yield counter
+
+    if counter.count > n:
+        message = "{} SQL statements were run, but the budget was {}:\n{}"\
+            .format(counter.count, n, counter.report())
+        if warn:
+            warnings.warn(message, RuntimeWarning, stacklevel=3)
+        else:
+            raise QueryBudgetExceeded(message)
+
+
+# the counters open in the current thread.
+_local = threading.local()
+
+# the files whose frames are skipped when finding a statement's call site.
+_sqlalchemy_dir = os.path.dirname(os.path.abspath(sqlalchemy.__file__))
+_this_file = os.path.splitext(os.path.abspath(__file__))[0]
+
+
+def _counters():
+    """The counters open in the current thread."""
+    if not hasattr(_local, "counters"):
+        _local.counters = []
+    return _local.counters
+
+
+def _call_site():
+    """The innermost line outside of SQLAlchemy that ran a statement."""
+    for filename, line, function, _ in reversed(traceback.extract_stack()):
+        path = os.path.abspath(filename)
+        if path.startswith(_sqlalchemy_dir) or \
+                os.path.splitext(path)[0] == _this_file:
+            continue
+        return "{}:{} in {}".format(filename, line, function)
+    return "unknown"
+
+
+@event.listens_for(db.engine, "after_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    """Count a SQL statement against the open counters, if any."""
+    counters = _counters()
+    if counters:
+        entry = (statement, _call_site())
+        for counter in counters:
+            counter.statements.append(entry)
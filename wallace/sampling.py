@@ -0,0 +1,149 @@
+"""Weighted random sampling."""
+
+from bisect import bisect_right
+import random
+
+
+class FenwickTree(object):
+    """A list of non-negative weights that can be sampled from.
+
+    A Fenwick (binary indexed) tree stores the cumulative sums of the weights
+    so that changing a weight, appending a weight and finding the index at
+    which the running total passes a value all take O(log n) time.
+    """
+
+    def __init__(self, weights=()):
+        """Create a tree holding the given weights."""
+        self._weights = list(weights)
+        self._positive = len([w for w in self._weights if w > 0])
+        self._tree = [0] + self._weights
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+    def __len__(self):
+        """The number of weights in the tree."""
+        return len(self._weights)
+
+    def __getitem__(self, index):
+        """The weight at an index."""
+        return self._weights[index]
+
+    def __setitem__(self, index, weight):
+        """Change the weight at an index."""
+        self.add(index, weight - self._weights[index])
+
+    def add(self, index, change):
+        """Add change to the weight at an index."""
+        was_positive = self._weights[index] > 0
+        self._weights[index] += change
+        self._positive += (self._weights[index] > 0) - was_positive
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += change
+            i += i & -i
+
+    def append(self, weight):
+        """Add a new weight to the end of the tree."""
+        i = len(self._tree)
+        lowest = i & -i
+        self._tree.append(weight + self.prefix(i - 1) -
+                          self.prefix(i - lowest))
+        self._weights.append(weight)
+        self._positive += weight > 0
+
+    def prefix(self, n):
+        """The sum of the first n weights."""
+        total = 0
+        while n > 0:
+            total += self._tree[n]
+            n -= n & -n
+        return total
+
+    def total(self):
+        """The sum of all the weights."""
+        return self.prefix(len(self._weights))
+
+    def find(self, value):
+        """The index of the weight at which the running total exceeds value."""
+        index = 0
+        step = 1
+        while step * 2 < len(self._tree):
+            step *= 2
+        while step > 0:
+            i = index + step
+            if i < len(self._tree) and self._tree[i] <= value:
+                index = i
+                value -= self._tree[i]
+            step //= 2
+        return index
+
+    def sample(self, k, exclude=()):
+        """Draw k distinct indexes with probability proportional to weight.
+
+        Indexes in ``exclude`` and indexes with zero weight are never drawn,
+        so fewer than k indexes are returned if there are not enough left.
+        """
+        removed = {}
+        for index in exclude:
+            if index not in removed:
+                removed[index] = self._weights[index]
+                self[index] = 0
+
+        drawn = []
+        try:
+            while len(drawn) < k and self._positive > 0:
+                index = self.find(random.random() * self.total())
+                if index >= len(self._weights) or self._weights[index] <= 0:
+                    # only reachable through floating point rounding
+                    continue
+                drawn.append(index)
+                removed[index] = self._weights[index]
+                self[index] = 0
+        finally:
+            for index, weight in removed.items():
+                self[index] = weight
+        return drawn
+
+
+class WeightedSampler(object):
+    """A fixed list of items that can be drawn in proportion to weights.
+
+    The cumulative sums of the weights are computed once, in O(n) time, after
+    which each draw is a binary search taking O(log n) time. Weights of None
+    count as zero and items with zero weight are never drawn.
+    """
+
+    def __init__(self, items, weights):
+        """Create a sampler over items with the given weights."""
+        self.items = list(items)
+        self._cumulative = []
+        total = 0.0
+        for weight in weights:
+            if weight is None:
+                weight = 0
+            if weight < 0:
+                raise ValueError("Cannot sample with negative weight {}"
+                                 .format(weight))
+            total += weight
+            self._cumulative.append(total)
+
+        if len(self._cumulative) != len(self.items):
+            raise ValueError("{} items were given {} weights"
+                             .format(len(self.items), len(self._cumulative)))
+        if total <= 0:
+            raise ValueError("Cannot sample from {} as none of them has a "
+                             "positive weight".format(self.items))
+
+    def sample(self, k):
+        """Draw k items, with replacement."""
+        total = self._cumulative[-1]
+        last = len(self.items) - 1
+        return [self.items[min(bisect_right(self._cumulative,
+                                            random.random() * total), last)]
+                for _ in xrange(k)]
+
+    def choice(self):
+        """Draw a single item."""
+        return self.sample(1)[0]
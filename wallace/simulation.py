@@ -0,0 +1,346 @@
+"""Run many steps of a process on a network in memory.
+
+The processes in :mod:`wallace.processes` take a single step at a time and
+query the database several times per step. A :class:`Simulation` instead
+loads a network into NumPy arrays once, runs as many steps as are needed
+without touching the database and then writes the infos, transmissions and
+transformations that the steps created back in bulk.
+
+NumPy is needed to run simulations, but is not needed by the rest of
+Wallace.
+"""
+
+from datetime import timedelta
+
+from .models import (Node, Vector, Info, Transmission, Transformation,
+                     bulk_insert, get_all, timenow)
+from .nodes import Agent, ReplicatorAgent, Source
+from .transformations import Replication
+
+from sqlalchemy.orm import object_session
+
+
+class Simulation(object):
+    """A network held in memory so that processes can be run on it quickly.
+
+    The simulation holds the not-failed nodes of the network, a compressed
+    sparse row (CSR) adjacency matrix of its not-failed vectors and the most
+    recent info of each node. Each step transmits a node's most recent info
+    to one of its neighbors. Receivers that are ReplicatorAgents copy what
+    they are sent, as :func:`~wallace.nodes.ReplicatorAgent.update` does;
+    transmissions to other nodes are received but have no further effect.
+
+    Nothing is written to the database until :func:`save` is called.
+    """
+
+    #: the number of rows written by each insert in :func:`save`.
+    chunk_size = 1000
+
+    def __init__(self, network, seed=None):
+        """Load a network into memory.
+
+        ``seed`` seeds the random number generator used by the simulation,
+        so that runs can be repeated. The classes of all the network's nodes
+        must have been imported, as they decide how the nodes behave, and a
+        ValueError is raised if any has not.
+        """
+        import numpy as np
+
+        self.network = network
+        self.random = np.random.RandomState(seed)
+        session = object_session(network)
+        session.flush()
+
+        # nodes, sorted by id so that ids can be mapped to positions with a
+        # binary search.
+        polymorphic_map = Node.__mapper__.polymorphic_map
+        nodes = Node.query\
+            .with_entities(Node.id, Node.type)\
+            .filter_by(network_id=network.id, failed=False)\
+            .order_by(Node.id)\
+            .all()
+        self.node_ids = np.array([n.id for n in nodes], dtype=np.int64)
+        unmapped = sorted(set(n.type for n in nodes) - set(polymorphic_map))
+        if unmapped:
+            raise ValueError(
+                "Cannot simulate nodes of type {}, as their classes have not "
+                "been imported.".format(", ".join(unmapped)))
+        self.node_types = [polymorphic_map[n.type].class_ for n in nodes]
+        self.is_agent = np.array(
+            [issubclass(t, Agent) for t in self.node_types], dtype=bool)
+        self.is_source = np.array(
+            [issubclass(t, Source) for t in self.node_types], dtype=bool)
+        self.replicates = np.array(
+            [issubclass(t, ReplicatorAgent) for t in self.node_types],
+            dtype=bool)
+
+        # the adjacency matrix, with the id of the vector behind every edge.
+        vectors = Vector.query\
+            .with_entities(Vector.id, Vector.origin_id, Vector.destination_id)\
+            .filter_by(network_id=network.id, failed=False)\
+            .order_by(Vector.origin_id, Vector.id)\
+            .all()
+        origins = self._positions([v.origin_id for v in vectors])
+        self.vector_ids = np.array([v.id for v in vectors], dtype=np.int64)
+        self.indices = self._positions([v.destination_id for v in vectors])
+        self.indptr = self._indptr(origins)
+
+        # the edges that lead to agents, which the processes choose between.
+        to_agents = np.flatnonzero(self.is_agent[self.indices])
+        self.agent_edges = to_agents
+        self.agent_indptr = self._indptr(origins[to_agents])
+
+        # the infos, indexed by position; new infos have an id of None
+        # until they are saved.
+        self.info_ids = []
+        self.info_types = []
+        self.info_contents = []
+        self.current = np.full(len(self.node_ids), -1, dtype=np.int64)
+        infos = Info.query\
+            .with_entities(Info.origin_id, Info.id, Info.type, Info.contents)\
+            .filter_by(network_id=network.id, failed=False)\
+            .distinct(Info.origin_id)\
+            .order_by(Info.origin_id, Info.creation_time.desc(),
+                      Info.id.desc())\
+            .all()
+        for info in infos:
+            # the infos of failed nodes have no position.
+            position = self._positions([info.origin_id])[0]
+            if position < len(self.node_ids) and \
+                    self.node_ids[position] == info.origin_id:
+                self.current[position] = self._add_info(
+                    info.id, info.type, info.contents)
+
+        latest = Transmission.query\
+            .with_entities(Transmission.destination_id)\
+            .filter_by(network_id=network.id, status="received",
+                       failed=False)\
+            .order_by(Transmission.receive_time.desc(),
+                      Transmission.id.desc())\
+            .first()
+        self.latest = None
+        if latest is not None and latest.destination_id in self.node_ids:
+            self.latest = self._positions([latest.destination_id])[0]
+        self.transmitted = Transmission.query\
+            .filter_by(network_id=network.id, failed=False)\
+            .count() > 0
+
+        # what has happened since the simulation was last saved, as lists
+        # of (tick, ...) tuples.
+        self.ticks = 0
+        self.new_infos = []
+        self.transmissions = []
+        self.replications = []
+
+    def _positions(self, ids):
+        """The positions of the nodes with the given ids."""
+        import numpy as np
+        return np.searchsorted(self.node_ids, np.asarray(ids, dtype=np.int64))
+
+    def _indptr(self, origins):
+        """The CSR row pointers of a list of edge origins sorted by node."""
+        import numpy as np
+        counts = np.bincount(origins, minlength=len(self.node_ids))
+        return np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def _add_info(self, info_id, info_type, contents):
+        """Add an info to the simulation and return its position."""
+        self.info_ids.append(info_id)
+        self.info_types.append(info_type)
+        self.info_contents.append(contents)
+        return len(self.info_ids) - 1
+
+    def _create_info(self, node, info_type, contents):
+        """Have the node at a position create a new info."""
+        info = self._add_info(None, info_type, contents)
+        self.new_infos.append((self.ticks, info, node))
+        self.current[node] = info
+        return info
+
+    def _transmit(self, edge, info):
+        """Send an info along an edge and have its destination receive it."""
+        destination = self.indices[edge]
+        self.transmissions.append((self.ticks, edge, info))
+        if self.replicates[destination]:
+            copy = self._create_info(destination, self.info_types[info],
+                                     self.info_contents[info])
+            self.replications.append((self.ticks, info, copy, destination))
+        self.latest = destination
+        self.transmitted = True
+        self.ticks += 1
+
+    def _broadcast_from_source(self, edges=None):
+        """Have a randomly chosen source create an info and transmit it.
+
+        The info is sent along all of the source's edges, as
+        :func:`~wallace.models.Node.transmit` does by default, unless a
+        function choosing between them is given as ``edges``. Return the
+        position of the source.
+        """
+        sources = self.is_source.nonzero()[0]
+        if not len(sources):
+            raise ValueError("{} has no sources to transmit from"
+                             .format(self.network))
+        position = sources[self.random.randint(len(sources))]
+        source = get_all(object_session(self.network), Node,
+                         [int(self.node_ids[position])])[0]
+
+        info_type = source._info_type().__mapper__.polymorphic_identity
+        info = self._create_info(position, info_type, source._contents())
+        if edges is None:
+            edges = range(self.indptr[position], self.indptr[position + 1])
+        else:
+            edges = [edges(position)]
+        for edge in edges:
+            self._transmit(edge, info)
+        return position
+
+    def _random_agent_edge(self, node, u):
+        """Choose an edge from a node to an agent, given a uniform draw."""
+        start = self.agent_indptr[node]
+        degree = self.agent_indptr[node + 1] - start
+        if degree == 0:
+            raise ValueError("Node-{} has no agents to transmit to"
+                             .format(self.node_ids[node]))
+        return self.agent_edges[start + int(u * degree)]
+
+    def random_walk(self, steps):
+        """Take a number of steps of :func:`~wallace.processes.random_walk`.
+
+        The walk carries on from the node that most recently received a
+        transmission, or starts at a randomly chosen source. At each step,
+        the current node transmits its most recent info to a randomly chosen
+        agent downstream of it.
+        """
+        draws = self.random.random_sample(steps)
+        for u in draws:
+            if self.latest is None:
+                self._broadcast_from_source(
+                    edges=lambda s: self._random_agent_edge(s, u))
+            else:
+                sender = self.latest
+                info = self.current[sender]
+                if info < 0:
+                    raise ValueError("Node-{} has no infos to transmit"
+                                     .format(self.node_ids[sender]))
+                self._transmit(self._random_agent_edge(sender, u), info)
+
+    def moran_cultural(self, steps):
+        """Take a number of steps of :func:`~wallace.processes.moran_cultural`.
+
+        If nothing has been transmitted in the network yet, the first step
+        has a randomly chosen source broadcast a new info. At every other
+        step a randomly chosen agent transmits its most recent info to a
+        randomly chosen agent downstream of it.
+        """
+        import numpy as np
+
+        if steps > 0 and not self.transmitted:
+            self._broadcast_from_source()
+            steps -= 1
+
+        agents = np.flatnonzero(self.is_agent)
+        if steps <= 0:
+            return
+        if not len(agents):
+            raise ValueError("{} has no agents".format(self.network))
+
+        replacers = agents[self.random.randint(len(agents), size=steps)]
+        draws = self.random.random_sample(steps)
+        for replacer, u in zip(replacers, draws):
+            info = self.current[replacer]
+            if info < 0:
+                raise ValueError("Node-{} has no infos to transmit"
+                                 .format(self.node_ids[replacer]))
+            self._transmit(self._random_agent_edge(replacer, u), info)
+
+    def infos(self):
+        """The contents of the most recent info of every node, by node id.
+
+        Nodes without infos are left out.
+        """
+        return dict((int(self.node_ids[n]), self.info_contents[i])
+                    for n, i in enumerate(self.current) if i >= 0)
+
+    def save(self):
+        """Write everything that has happened since the last save.
+
+        The new infos, the transmissions (which are all received) and the
+        replications are each written with multi-row inserts, timestamped a
+        microsecond apart in the order they happened. The session is flushed
+        but not committed.
+        """
+        session = object_session(self.network)
+        network_id = self.network.id
+        start = timenow()
+
+        def time(tick):
+            return start + timedelta(microseconds=tick)
+
+        # give the new infos ids up front, so that the transmissions and
+        # transformations can refer to them.
+        sequence = "{}_id_seq".format(Info.__tablename__)
+        ids = session.execute(
+            "SELECT nextval(:sequence) FROM generate_series(1, :n)",
+            {"sequence": sequence, "n": len(self.new_infos)}).fetchall()
+        for (tick, info, node), (info_id,) in zip(self.new_infos, ids):
+            self.info_ids[info] = info_id
+
+        self._insert(session, Info, [{
+            "id": self.info_ids[info],
+            "type": self.info_types[info],
+            "origin_id": int(self.node_ids[node]),
+            "network_id": network_id,
+            "contents": self.info_contents[info],
+            "creation_time": time(tick),
+            "failed": False
+        } for tick, info, node in self.new_infos])
+
+        origins = self._origins()
+        self._insert(session, Transmission, [{
+            "vector_id": int(self.vector_ids[edge]),
+            "info_id": self.info_ids[info],
+            "origin_id": int(self.node_ids[origins[edge]]),
+            "destination_id": int(self.node_ids[self.indices[edge]]),
+            "network_id": network_id,
+            "creation_time": time(tick),
+            "receive_time": time(tick),
+            "status": "received",
+            "failed": False
+        } for tick, edge, info in self.transmissions])
+
+        replication = Replication.__mapper__.polymorphic_identity
+        self._insert(session, Transformation, [{
+            "type": replication,
+            "info_in_id": self.info_ids[info_in],
+            "info_out_id": self.info_ids[info_out],
+            "node_id": int(self.node_ids[node]),
+            "network_id": network_id,
+            "creation_time": time(tick),
+            "failed": False
+        } for tick, info_in, info_out, node in self.replications])
+
+        # the rows were inserted behind the back of the network's loaded
+        # graph, if it has one, so it is out of date.
+        self.network.__dict__.pop("_graph", None)
+
+        self.ticks = 0
+        self.new_infos = []
+        self.transmissions = []
+        self.replications = []
+
+    def _origins(self):
+        """The position of the origin of every edge."""
+        import numpy as np
+        return np.repeat(np.arange(len(self.node_ids)),
+                         np.diff(self.indptr))
+
+    def _insert(self, session, model, rows):
+        """Insert rows into the table of a model in chunks.
+
+        The rows are inserted with :func:`~wallace.models.bulk_insert`, so
+        session listeners, like those of the response cache, see them once
+        the transaction is committed.
+        """
+        for i in range(0, len(rows), self.chunk_size):
+            bulk_insert(session, model, rows[i:i + self.chunk_size])